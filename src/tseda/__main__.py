@@ -1,19 +1,18 @@
+"""Command line interface for tseda.
+
+Each subcommand imports the modules it needs when it runs, so that
+`tseda --help` and `tseda preprocess` do not import panel, the app and
+the plotting dependencies of its pages.
+"""
+
 import pathlib
 
 import click
 import daiquiri
 
-daiquiri.setup(level="WARN")  # noqa
-import panel as pn  # noqa
-
-from . import app  # noqa
-from . import config  # noqa
-from . import model  # noqa
-from . import datastore  # noqa
-from .datastore import IndividualsTable  # noqa
-from tsbrowse import preprocess as preprocess_  # noqa
-from tsbrowse.model import TSModel  # noqa
+from . import cache, config
 
+daiquiri.setup(level="WARN")
 
 logger = daiquiri.getLogger("tseda")
 
@@ -31,6 +30,15 @@ def setup_logging(log_level, no_log_filter):
         logger.setLevel("CRITICAL")
 
 
+def _parse_size(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return cache.parse_size(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
 @click.group()
 def cli():
     """Command line interface for tseda."""
@@ -48,16 +56,56 @@ def cli():
         "with .tseda extension"
     ),
 )
-def preprocess(tszip_path, output):
+@click.option(
+    "--gnn-window-size",
+    default=None,
+    type=click.IntRange(min=1),
+    help=(
+        "Precompute the haplotype GNN of all samples against the "
+        "populations in windows of this size"
+    ),
+)
+@click.option(
+    "--num-workers",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes for the GNN precomputation",
+)
+def preprocess(tszip_path, output, gnn_window_size, num_workers):
     """Preprocess a tskit tree sequence or tszip file, producing a .tseda file.
 
-    Calls tsbrowse.preprocess.preprocess.
+    Calls tsbrowse.preprocess.preprocess, stores the individuals and
+    sample sets tables in the file, and optionally stores the windowed
+    haplotype GNN for the default sample sets.
     """
+    import pandas as pd
+    from tsbrowse import preprocess as preprocess_
+    from tsbrowse.model import TSModel
+
+    from . import precompute
+    from .model import Individuals, population_sample_sets
+
     tszip_path = pathlib.Path(tszip_path)
     if output is None:
         output = tszip_path.with_suffix(".tseda")
 
     preprocess_.preprocess(tszip_path, output, show_progress=True)
+    tsm = TSModel(output)
+    individuals = Individuals.from_tree_sequence(tsm.ts)
+    precompute.write_tables(
+        output,
+        tsm.ts,
+        individuals,
+        pd.DataFrame(population_sample_sets(tsm.ts)),
+    )
+    if gnn_window_size is not None:
+        precompute.write_gnn(
+            output,
+            tsm.ts,
+            individuals.sample_sets(),
+            gnn_window_size,
+            num_workers=num_workers,
+        )
 
 
 @cli.command()
@@ -71,6 +119,56 @@ def preprocess(tszip_path, output):
 @click.option(
     "--admin", default=False, is_flag=True, help="Add bokeh admin panel"
 )
+@click.option(
+    "--num-workers",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes for haplotype GNN calculations",
+)
+@click.option(
+    "--gnn-dtype",
+    default="float64",
+    type=click.Choice(["float64", "float32", "float16"]),
+    help="Floating point precision of haplotype GNN results",
+)
+@click.option(
+    "--cache-dir",
+    default=None,
+    type=click.Path(file_okay=False),
+    help="Directory of the result cache, defaults to the user cache dir",
+)
+@click.option(
+    "--cache-size-limit",
+    default=None,
+    callback=_parse_size,
+    help=(
+        "Maximum size of the result cache, e.g. 500M or 20GB; defaults to "
+        "the previous limit of the cache directory (1GB for a new cache)"
+    ),
+)
+@click.option(
+    "--cache-eviction-policy",
+    default=cache.EVICTION_POLICIES[0],
+    type=click.Choice(cache.EVICTION_POLICIES),
+    help="Entries to evict once the result cache exceeds its size limit",
+)
+@click.option(
+    "--plot-cache-size",
+    default=None,
+    callback=_parse_size,
+    help=(
+        "Memory budget of the rendered plots kept for reuse by each session, "
+        "e.g. 256M (the default)"
+    ),
+)
+@click.option(
+    "--warm-pages/--no-warm-pages",
+    default=False,
+    help=(
+        "Construct all pages once the first page is shown, rather than "
+        "each page on first selection"
+    ),
+)
 @click.option("--log-level", default="INFO", help="Logging level")
 @click.option(
     "--no-log-filter",
@@ -78,9 +176,34 @@ def preprocess(tszip_path, output):
     is_flag=True,
     help="Do not filter the output log (advanced debugging only)",
 )
-def serve(path, port, show, log_level, no_log_filter, admin):
+def serve(
+    path,
+    port,
+    show,
+    num_workers,
+    gnn_dtype,
+    cache_dir,
+    cache_size_limit,
+    cache_eviction_policy,
+    plot_cache_size,
+    warm_pages,
+    log_level,
+    no_log_filter,
+    admin,
+):
     """Run the tseda datastore server, version based on View base class."""
+    import panel as pn
+    from tsbrowse.model import TSModel
+
+    from . import app, datastore, precompute
+    from .datastore import IndividualsTable
+
     setup_logging(log_level, no_log_filter)
+    cache.configure(
+        cache_dir,
+        size_limit=cache_size_limit,
+        eviction_policy=cache_eviction_policy,
+    )
 
     tsm = TSModel(path)
     individuals_table, sample_sets_table = datastore.preprocess(tsm)
@@ -91,11 +214,177 @@ def serve(path, port, show, log_level, no_log_filter, admin):
             tsm=tsm,
             sample_sets_table=sample_sets_table,
             individuals_table=individuals_table,
+            num_workers=num_workers,
+            gnn_dtype=gnn_dtype,
+            precomputed_gnn=precompute.load_gnn(path),
+            plot_cache_size=(
+                config.PLOT_CACHE_SIZE
+                if plot_cache_size is None
+                else plot_cache_size
+            ),
         ),
         title="TSEda Datastore App",
         views=[IndividualsTable],
+        warm_pages=warm_pages,
     )
-    pn.serve(app_.view(), port=port, show=show, verbose=False, admin=admin)
+    pn.serve(app_.view, port=port, show=show, verbose=False, admin=admin)
+
+
+@cli.command()
+@click.argument(
+    "paths",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    "--statistic",
+    "-s",
+    "statistics",
+    multiple=True,
+    type=click.Choice(config.ONEWAY_STATISTICS + config.MULTIWAY_STATISTICS),
+    help="Statistic to calculate; can be repeated, defaults to all",
+)
+@click.option(
+    "--mode",
+    "-m",
+    "modes",
+    multiple=True,
+    default=["site"],
+    type=click.Choice(["site", "branch"]),
+    help="Mode of the statistics; can be repeated",
+)
+@click.option(
+    "--window-size",
+    "-w",
+    "window_sizes",
+    multiple=True,
+    default=[10000],
+    type=click.IntRange(min=1),
+    help="Size of the windows; can be repeated",
+)
+@click.option(
+    "--sample-sets",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False),
+    help=(
+        "JSON file mapping sample set names to lists of individual IDs; "
+        "defaults to the populations"
+    ),
+)
+@click.option(
+    "--output-dir",
+    "-o",
+    default=".",
+    type=click.Path(file_okay=False),
+    help="Directory to write the tracks to",
+)
+@click.option(
+    "--format",
+    "fmt",
+    default="parquet",
+    type=click.Choice(["parquet", "npz"]),
+    help="File format of the tracks",
+)
+@click.option(
+    "--num-workers",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes",
+)
+@click.option("--log-level", default="INFO", help="Logging level")
+def compute(
+    paths,
+    statistics,
+    modes,
+    window_sizes,
+    sample_sets,
+    output_dir,
+    fmt,
+    num_workers,
+    log_level,
+):
+    """Calculate windowed statistics of the tree sequences in PATHS.
+
+    Writes a track for every combination of file, statistic, mode and
+    window size to the output directory, named
+    <file>.<statistic>.<mode>.<window size>.<format>, with the values
+    plotted on the Statistics page.
+    """
+    from . import batch
+
+    setup_logging(log_level, False)
+    definitions = None
+    if sample_sets is not None:
+        try:
+            definitions = batch.read_definitions(sample_sets)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--sample-sets")
+    try:
+        written = batch.run(
+            paths,
+            statistics or batch.STATISTICS,
+            modes,
+            window_sizes,
+            output_dir,
+            fmt=fmt,
+            definitions=definitions,
+            num_workers=num_workers,
+        )
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    click.echo(f"Wrote {len(written)} tracks to {output_dir}")
+
+
+@cli.group(name="cache")
+@click.option(
+    "--cache-dir",
+    default=None,
+    type=click.Path(file_okay=False),
+    help="Directory of the result cache, defaults to the user cache dir",
+)
+def cache_group(cache_dir):
+    """Inspect and manage the result cache."""
+    cache.configure(cache_dir)
+
+
+@cache_group.command()
+def stats():
+    """Show the size, settings and hit rate of the result cache."""
+    info = cache.info()
+    hit_rate = info["hit_rate"]
+    click.echo(f"Directory:       {info['directory']}")
+    click.echo(f"Entries:         {info['entries']}")
+    click.echo(f"Size:            {info['volume'] / 2**20:.1f} MiB")
+    click.echo(f"Size limit:      {info['size_limit'] / 2**20:.1f} MiB")
+    click.echo(f"Eviction policy: {info['eviction_policy']}")
+    click.echo(
+        f"Hits/misses:     {info['hits']}/{info['misses']}"
+        + ("" if hit_rate is None else f" ({hit_rate:.1%} hit rate)")
+    )
+
+
+@cache_group.command()
+@click.confirmation_option(prompt="Remove all cached results?")
+def clear():
+    """Remove all entries from the result cache."""
+    count = cache.get_cache().clear()
+    cache.get_cache().stats(reset=True)
+    click.echo(f"Removed {count} entries")
+
+
+@cache_group.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+def prune(path):
+    """Remove the cached results of the tree sequence in PATH.
+
+    PATH can be a .tseda, tszip or tskit file.
+    """
+    import tszip
+
+    ts = tszip.load(path)
+    count = cache.evict(cache.file_fingerprint(path, ts))
+    click.echo(f"Removed {count} entries for {path}")
 
 
 if __name__ == "__main__":
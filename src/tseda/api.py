@@ -0,0 +1,245 @@
+"""Headless computations on a tree sequence.
+
+The functions in this module take a tree sequence and sample sets, given
+as a mapping from sample set id to an array of sample (tskit node) IDs
+such as returned by IndividualsTable.sample_sets(), and return NumPy
+arrays or Pandas DataFrames. They are the computations behind the
+statistics, structure and GNN views of the app, which call them, but do
+not import panel, bokeh or holoviews, so that batch jobs and notebooks
+can use them without the UI.
+"""
+
+import itertools
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import tskit
+
+from .config import MULTIWAY_STATISTICS, ONEWAY_STATISTICS
+from .gnn import windowed_genealogical_nearest_neighbours
+from .model import Individuals
+
+
+def population_samples(ts: tskit.TreeSequence) -> Dict:
+    """Returns the samples of the individuals of each population, as the
+    app groups them before any sample set is edited. The names and colors
+    of these sample sets are given by model.population_sample_sets.
+
+    Arguments:
+        ts (tskit.TreeSequence): The tree sequence.
+
+    Returns:
+        dict: A dictionary where keys are population IDs and values are
+        int32 arrays of the samples of the individuals in that population.
+    """
+    return Individuals.from_tree_sequence(ts).sample_sets()
+
+
+def oneway_statistic(
+    ts: tskit.TreeSequence,
+    statistic: str,
+    sample_sets: Dict,
+    windows: Optional[List[float]] = None,
+    mode: str = "site",
+) -> np.ndarray:
+    """Calculates a one-way statistic of each sample set.
+
+    Arguments:
+        ts (tskit.TreeSequence): The tree sequence.
+        statistic (str): The name of the tskit method, one of
+            ONEWAY_STATISTICS.
+        sample_sets (dict): Mapping from sample set id to samples.
+        windows (List[float], optional): Window breakpoints.
+        mode (str): "site" or "branch".
+
+    Returns:
+        np.ndarray: The statistic with shape (windows, sample sets), where
+        the window axis is dropped if windows is None.
+
+    Raises:
+        ValueError: If the statistic is not supported.
+    """
+    if statistic not in ONEWAY_STATISTICS:
+        raise ValueError(f"Invalid statistic {statistic}")
+    return getattr(ts, statistic)(
+        list(sample_sets.values()), windows=windows, mode=mode
+    )
+
+
+def multiway_statistic(
+    ts: tskit.TreeSequence,
+    statistic: str,
+    sample_sets: Dict,
+    indexes: List,
+    windows: Optional[List[float]] = None,
+    mode: str = "site",
+) -> np.ndarray:
+    """Calculates a two-way statistic between pairs of sample sets.
+
+    Arguments:
+        ts (tskit.TreeSequence): The tree sequence.
+        statistic (str): The name of the tskit method, one of
+            MULTIWAY_STATISTICS.
+        sample_sets (dict): Mapping from sample set id to samples.
+        indexes (List): Pairs of positions in sample_sets to compare.
+        windows (List[float], optional): Window breakpoints.
+        mode (str): "site" or "branch".
+
+    Returns:
+        np.ndarray: The statistic with shape (windows, pairs), where the
+        window axis is dropped if windows is None.
+
+    Raises:
+        ValueError: If the statistic is not supported.
+    """
+    if statistic not in MULTIWAY_STATISTICS:
+        raise ValueError(f"Invalid statistic {statistic}")
+    return getattr(ts, statistic)(
+        list(sample_sets.values()),
+        windows=windows,
+        indexes=indexes,
+        mode=mode,
+    )
+
+
+def pairwise_fst(ts: tskit.TreeSequence, sample_sets: Dict) -> np.ndarray:
+    """Calculates Fst between all pairs of sample sets.
+
+    Arguments:
+        ts (tskit.TreeSequence): The tree sequence.
+        sample_sets (dict): Mapping from sample set id to samples.
+
+    Returns:
+        np.ndarray: A (sample sets, sample sets) matrix of Fst values, in
+        the order of sample_sets.
+    """
+    k = len(sample_sets)
+    indexes = list(itertools.product(range(k), range(k)))
+    fst = ts.Fst(list(sample_sets.values()), indexes=indexes)
+    return np.reshape(fst, (k, k))
+
+
+def genealogical_nearest_neighbours(
+    ts: tskit.TreeSequence,
+    sample_sets: Dict,
+    focal: Optional[List[int]] = None,
+) -> np.ndarray:
+    """Calculates the Genealogical Nearest Neighbors (GNN) of focal
+    samples over the entire sequence.
+
+    Arguments:
+        ts (tskit.TreeSequence): The tree sequence.
+        sample_sets (dict): Mapping from sample set id to samples.
+        focal (List[int], optional): The focal samples. If None, the
+            samples of all sample sets are used, in order.
+
+    Returns:
+        np.ndarray: GNN proportions with shape (focal, sample sets).
+    """
+    if focal is None:
+        focal = np.concatenate(list(sample_sets.values()))
+    return ts.genealogical_nearest_neighbours(
+        focal, sample_sets=list(sample_sets.values())
+    )
+
+
+def _focal_sample_sets(sample_sets: Dict) -> np.ndarray:
+    """Returns the sample set id of each sample of the sample sets, in
+    order."""
+    return np.repeat(
+        np.array(list(sample_sets), dtype=np.int64),
+        [len(samples) for samples in sample_sets.values()],
+    )
+
+
+def gnn_table(
+    ts: tskit.TreeSequence,
+    sample_sets: Dict,
+    gnn: Optional[np.ndarray] = None,
+) -> pd.DataFrame:
+    """Returns the GNN proportions of the samples of the sample sets
+    against the sample sets, as shown in the GNN VBar plot.
+
+    Arguments:
+        ts (tskit.TreeSequence): The tree sequence.
+        sample_sets (dict): Mapping from sample set id to samples.
+        gnn (np.ndarray, optional): The GNN proportions of the samples of
+            the sample sets, in order, as returned by
+            genealogical_nearest_neighbours. Calculated if None.
+
+    Returns:
+        pd.DataFrame: A DataFrame with a column per sample set id, indexed
+        by the sample set id, the position of the sample and the
+        individual of the sample.
+    """
+    if gnn is None:
+        gnn = genealogical_nearest_neighbours(ts, sample_sets)
+    samples = np.concatenate(list(sample_sets.values()))
+    df = pd.DataFrame(gnn, columns=list(sample_sets))
+    df["id"] = ts.nodes_individual[samples]
+    df["sample_id"] = df.index
+    df["sample_set_id"] = _focal_sample_sets(sample_sets)
+    df.set_index(["sample_set_id", "sample_id", "id"], inplace=True)
+    return df
+
+
+def mean_gnn(
+    ts: tskit.TreeSequence,
+    sample_sets: Dict,
+    gnn: Optional[np.ndarray] = None,
+) -> pd.DataFrame:
+    """Returns the mean GNN proportions of the samples of each sample set
+    against the sample sets.
+
+    Arguments:
+        ts (tskit.TreeSequence): The tree sequence.
+        sample_sets (dict): Mapping from sample set id to samples.
+        gnn (np.ndarray, optional): The GNN proportions of the samples of
+            the sample sets, in order, as returned by
+            genealogical_nearest_neighbours. Calculated if None.
+
+    Returns:
+        pd.DataFrame: A (sample sets, sample sets) DataFrame indexed by
+        the focal sample set id, with a column per sample set id.
+    """
+    if gnn is None:
+        gnn = genealogical_nearest_neighbours(ts, sample_sets)
+    df = pd.DataFrame(gnn, columns=list(sample_sets))
+    return df.groupby(_focal_sample_sets(sample_sets)).mean()
+
+
+def haplotype_gnn(
+    ts: tskit.TreeSequence,
+    focal: List[int],
+    sample_sets: Dict,
+    windows: Optional[List[float]] = None,
+    time_windows: Optional[List[float]] = None,
+    **kwargs,
+) -> np.ndarray:
+    """Calculates the windowed haplotype GNN of the focal samples, with
+    the engine used by the iGNN page.
+
+    Arguments:
+        ts (tskit.TreeSequence): The tree sequence.
+        focal (List[int]): The focal samples.
+        sample_sets (dict): Mapping from sample set id to samples.
+        windows (List[float], optional): Window breakpoints.
+        time_windows (List[float], optional): Time window breakpoints.
+        **kwargs: Passed on to
+            gnn.windowed_genealogical_nearest_neighbours, such as
+            num_workers, dtype or sparse.
+
+    Returns:
+        np.ndarray: GNN proportions with shape (windows, time windows,
+        focal, sample sets), where the window and time window axes are
+        dropped if the corresponding argument is None.
+    """
+    return windowed_genealogical_nearest_neighbours(
+        ts,
+        focal,
+        sample_sets,
+        windows=windows,
+        time_windows=time_windows,
+        **kwargs,
+    )
@@ -5,6 +5,7 @@ DataStoreApp subclasses the Viewer class from panel and renders a
 panel.FastListTemplate object.
 """
 
+import threading
 import time
 
 import daiquiri
@@ -57,10 +58,19 @@ class DataStoreApp(Viewer):
         managing data.
         title (str): The title of the application.
         views (List[str]): A list of views to show on startup.
+        warm_pages (bool): Whether to construct the pages that have not been
+        visited in a background thread once the first page has been shown.
+        pages (Dict[str, View]): The pages constructed so far, by title.
+        Pages are constructed on first selection, under a lock so that a
+        page selected during warming is not constructed twice.
+        page_timings (Dict[str, float]): The construction time in seconds of
+        each constructed page, by title.
 
     Methods:
-        __init__(**params): Initializes the application, loads pages, and sets
-        up data update listeners.
+        __init__(**params): Initializes the application and sets up data
+        update listeners.
+        get_page(title) -> View: Returns the page with the given title,
+        constructing it on first access.
         view(): Creates the main application view, including a header selector
         for switching between different pages.
     """
@@ -71,17 +81,20 @@ class DataStoreApp(Viewer):
 
     views = param.List(doc="What views to show on startup.")
 
+    warm_pages = param.Boolean(
+        default=False,
+        doc="Construct the remaining pages after the first page is shown.",
+    )
+
     def __init__(self, **params):
         super().__init__(**params)
-        t = time.time()
-        logger.info("Initialising pages")
-        self.pages = {
-            page.title: page(datastore=self.datastore) for page in vpages.PAGES
-        }
+        self.pages = {}
+        self.page_timings = {}
+        self._pages_lock = threading.RLock()
+        self._warm_thread = None
         self.spinner = pn.indicators.LoadingSpinner(
             value=True, width=50, height=50
         )
-        logger.info(f"Initialised pages in {time.time() - t:.2f}s")
 
         updating = (
             self.datastore.sample_sets_table.data.rx.updating()
@@ -95,6 +108,48 @@ class DataStoreApp(Viewer):
             )
         )
 
+    def get_page(self, title):
+        """Returns the page with the given title, constructing it on first
+        access.
+
+        Arguments:
+            title (str): The title of the page.
+
+        Returns:
+            View: The page.
+        """
+        with self._pages_lock:
+            if title not in self.pages:
+                t = time.time()
+                page = vpages.load_page(title)
+                self.pages[title] = page(datastore=self.datastore)
+                self.page_timings[title] = time.time() - t
+                logger.info(
+                    f"Initialised {title} page in "
+                    f"{self.page_timings[title]:.2f}s"
+                )
+            return self.pages[title]
+
+    def _start_warming(self):
+        """Constructs the pages that have not been visited yet in a
+        background thread, so that the session stays responsive."""
+        if self._warm_thread is None or not self._warm_thread.is_alive():
+            self._warm_thread = threading.Thread(
+                target=self._warm_pages, name="tseda-warm-pages", daemon=True
+            )
+            self._warm_thread.start()
+
+    def _warm_pages(self):
+        """Constructs the pages that have not been visited yet."""
+        t = time.time()
+        for title in vpages.TITLES:
+            self.get_page(title)
+        timings = ", ".join(
+            f"{title} {seconds:.2f}s"
+            for title, seconds in self.page_timings.items()
+        )
+        logger.info(f"Initialised pages in {time.time() - t:.2f}s ({timings})")
+
     @param.depends("views")
     def view(self):
         """Creates the main application view. Main application view that
@@ -106,7 +161,7 @@ class DataStoreApp(Viewer):
             pn.template.FastListTemplate: A Panel template containing the
             header selector, sidebar, and main content.
         """
-        page_titles = list(self.pages.keys())
+        page_titles = vpages.TITLES
         header_selector = pn.widgets.RadioButtonGroup(
             options=page_titles,
             value=page_titles[0],
@@ -117,12 +172,15 @@ class DataStoreApp(Viewer):
         @pn.depends(header_selector.param.value)
         def get_content(selected_page):
             yield self.spinner
-            yield self.pages[selected_page].servable
+            yield self.get_page(selected_page).servable
 
         @pn.depends(header_selector.param.value)
         def get_sidebar(selected_page):
             yield self.spinner
-            yield self.pages[selected_page].sidebar
+            yield self.get_page(selected_page).sidebar
+
+        if self.warm_pages:
+            pn.state.onload(self._start_warming)
 
         self._template = pn.template.FastListTemplate(
             title=(
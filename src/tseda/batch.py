@@ -0,0 +1,293 @@
+"""Batch calculation of windowed statistics.
+
+Used by `tseda compute` to calculate the one-way and multi-way statistics
+of the Statistics page for many tree sequences, modes and window sizes
+in a pool of worker processes, writing each track to a Parquet or NPZ
+file. The tracks are calculated by tseda.api with the windows, sample
+sets and sample set pairs that the Statistics page plots.
+
+Sample sets are the populations of each tree sequence by default, or can
+be defined in a JSON file that maps sample set names to lists of
+individual IDs.
+"""
+
+import concurrent.futures
+import dataclasses
+import itertools
+import json
+import multiprocessing
+import pathlib
+from typing import Dict, List, Optional, Tuple
+
+import daiquiri
+import numpy as np
+import pandas as pd
+import tszip
+
+from . import api
+from .config import MULTIWAY_STATISTICS, ONEWAY_STATISTICS
+from .gnn import make_windows
+from .model import Individuals, population_sample_sets
+
+logger = daiquiri.getLogger("tseda")
+
+STATISTICS = ONEWAY_STATISTICS + MULTIWAY_STATISTICS
+MODES = ["site", "branch"]
+FORMATS = ["parquet", "npz"]
+
+
+@dataclasses.dataclass(frozen=True)
+class Job:
+    """A statistics track to calculate.
+
+    Attributes:
+        path (str): Path of the tree sequence, in any format tszip.load
+            reads (.trees, .tsz or .tseda).
+        statistic (str): One of STATISTICS.
+        mode (str): "site" or "branch".
+        window_size (int): Size of the windows.
+    """
+
+    path: str
+    statistic: str
+    mode: str
+    window_size: int
+
+    def output_path(self, output_dir, fmt: str) -> pathlib.Path:
+        """Returns the path of the file the track is written to."""
+        name = pathlib.Path(self.path).name
+        return pathlib.Path(output_dir) / (
+            f"{name}.{self.statistic}.{self.mode}.{self.window_size}.{fmt}"
+        )
+
+
+def load_sample_sets(
+    ts, definitions: Optional[Dict[str, List[int]]] = None
+) -> Tuple[Dict, Dict[int, str]]:
+    """Returns the sample sets of a tree sequence and their names.
+
+    Arguments:
+        ts (tskit.TreeSequence): The tree sequence.
+        definitions (dict, optional): Mapping from sample set name to the
+            IDs of its individuals. If None, the populations are used.
+
+    Returns:
+        Tuple[dict, dict]: The mapping from sample set id to samples, as
+        IndividualsTable.sample_sets() returns it, and the mapping from
+        sample set id to name.
+
+    Raises:
+        ValueError: If a sample set has no samples or individuals that are
+            not in the tree sequence, or if an individual is in more than
+            one sample set.
+    """
+    if definitions is None:
+        names = {
+            ss.sample_set_id: ss.name for ss in population_sample_sets(ts)
+        }
+        sample_sets = api.population_samples(ts)
+        return sample_sets, {key: names[key] for key in sample_sets}
+    individuals = Individuals.from_tree_sequence(ts)
+    sample_sets, names = {}, {}
+    owner = np.full(len(individuals), -1, dtype=np.int64)
+    for sample_set_id, (name, ids) in enumerate(definitions.items()):
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        if len(ids) > 0 and (ids[0] < 0 or ids[-1] >= len(individuals)):
+            raise ValueError(
+                f"Sample set {name} has individuals that are not in the "
+                "tree sequence"
+            )
+        shared = ids[owner[ids] >= 0]
+        if len(shared) > 0:
+            raise ValueError(
+                f"Sample set {name} has individual {shared[0]}, which is "
+                f"already in sample set {names[owner[shared[0]]]}"
+            )
+        owner[ids] = sample_set_id
+        sample_sets[sample_set_id] = np.concatenate(
+            [individuals.individual_nodes(i) for i in ids]
+            + [np.zeros(0, dtype=np.int32)]
+        )
+        if len(sample_sets[sample_set_id]) == 0:
+            raise ValueError(f"Sample set {name} has no samples")
+        names[sample_set_id] = name
+    return sample_sets, names
+
+
+def compute_track(
+    ts, statistic: str, mode: str, window_size: int, sample_sets, names
+) -> pd.DataFrame:
+    """Calculates a windowed statistic as the Statistics page plots it.
+
+    One-way statistics have a column per sample set. Multi-way statistics
+    have a column per pair of sample sets, named after the two sample
+    sets joined by "-", for all the pairs offered on the Statistics page.
+
+    Arguments:
+        ts (tskit.TreeSequence): The tree sequence.
+        statistic (str): One of STATISTICS.
+        mode (str): "site" or "branch".
+        window_size (int): Size of the windows.
+        sample_sets (dict): Mapping from sample set id to samples.
+        names (dict): Mapping from sample set id to name.
+
+    Returns:
+        pd.DataFrame: The start and end of each window, followed by the
+        statistic in that window.
+    """
+    windows = make_windows(window_size, ts.sequence_length)
+    if statistic in ONEWAY_STATISTICS:
+        values = api.oneway_statistic(
+            ts, statistic, sample_sets, windows=windows, mode=mode
+        )
+        columns = [names[key] for key in sample_sets]
+    else:
+        ids = sorted(sample_sets)
+        pairs = list(itertools.combinations(sample_sets, 2))
+        values = api.multiway_statistic(
+            ts,
+            statistic,
+            {key: sample_sets[key] for key in ids},
+            [(ids.index(x), ids.index(y)) for x, y in pairs],
+            windows=windows,
+            mode=mode,
+        )
+        columns = [f"{names[x]}-{names[y]}" for x, y in pairs]
+    df = pd.DataFrame(values, columns=columns)
+    df.insert(0, "start", windows[:-1])
+    df.insert(1, "end", windows[1:])
+    return df
+
+
+def write_track(df: pd.DataFrame, path, fmt: str):
+    """Writes a track to a Parquet file, or to an NPZ file with the window
+    breakpoints, the values and the column names."""
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    elif fmt == "npz":
+        values = df.drop(columns=["start", "end"])
+        np.savez(
+            path,
+            windows=np.append(df["start"].to_numpy(), df["end"].iloc[-1]),
+            values=values.to_numpy(),
+            columns=np.array(values.columns, dtype=str),
+        )
+    else:
+        raise ValueError(f"Unknown format {fmt}")
+
+
+# Tree sequences and sample sets loaded by this process, by path and
+# sample set definitions
+_loaded = {}
+
+
+def _load(path, definitions):
+    key = (path, json.dumps(definitions, sort_keys=True))
+    if key not in _loaded:
+        ts = tszip.load(path)
+        _loaded[key] = (ts, *load_sample_sets(ts, definitions))
+    return _loaded[key]
+
+
+def run_job(
+    job: Job, output_dir, fmt: str, definitions=None
+) -> Optional[pathlib.Path]:
+    """Calculates a track and writes it to output_dir.
+
+    Returns:
+        pathlib.Path: The file written, or None if branch mode was asked
+        for a tree sequence with uncalibrated times.
+    """
+    ts, sample_sets, names = _load(job.path, definitions)
+    if job.mode == "branch" and ts.time_units == "uncalibrated":
+        logger.warning(
+            f"Skipping {job.statistic} in branch mode for {job.path}, "
+            "which has uncalibrated times"
+        )
+        return None
+    df = compute_track(
+        ts, job.statistic, job.mode, job.window_size, sample_sets, names
+    )
+    path = job.output_path(output_dir, fmt)
+    write_track(df, path, fmt)
+    logger.info(f"Wrote {path}")
+    return path
+
+
+def run(
+    paths: List[str],
+    statistics: List[str],
+    modes: List[str],
+    window_sizes: List[int],
+    output_dir,
+    fmt: str = "parquet",
+    definitions: Optional[Dict[str, List[int]]] = None,
+    num_workers: int = 1,
+) -> List[pathlib.Path]:
+    """Calculates every combination of tree sequence, statistic, mode and
+    window size, and writes each track to output_dir.
+
+    Arguments:
+        paths (List[str]): Paths of the tree sequences.
+        statistics (List[str]): Statistics from STATISTICS.
+        modes (List[str]): Modes from MODES.
+        window_sizes (List[int]): Window sizes.
+        output_dir: Directory to write the tracks to.
+        fmt (str): One of FORMATS.
+        definitions (dict, optional): Mapping from sample set name to the
+            IDs of its individuals. If None, the populations are used.
+        num_workers (int): Number of worker processes.
+
+    Returns:
+        List[pathlib.Path]: The files written.
+
+    Raises:
+        ValueError: If two paths have the same file name, as their tracks
+            would be written to the same files.
+    """
+    names = [pathlib.Path(path).name for path in paths]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(
+            f"Tree sequences with the same file name: {', '.join(duplicates)}"
+        )
+    pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+    jobs = [
+        Job(str(path), statistic, mode, window_size)
+        for path, statistic, mode, window_size in itertools.product(
+            paths, statistics, modes, window_sizes
+        )
+    ]
+    logger.info(f"Calculating {len(jobs)} tracks")
+    if num_workers <= 1:
+        results = [run_job(job, output_dir, fmt, definitions) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            n = len(jobs)
+            results = list(
+                executor.map(
+                    run_job,
+                    jobs,
+                    [output_dir] * n,
+                    [fmt] * n,
+                    [definitions] * n,
+                )
+            )
+    return [path for path in results if path is not None]
+
+
+def read_definitions(path) -> Dict[str, List[int]]:
+    """Reads sample set definitions from a JSON file mapping sample set
+    names to lists of individual IDs."""
+    with open(path) as f:
+        definitions = json.load(f)
+    if not isinstance(definitions, dict) or not all(
+        isinstance(ids, list) for ids in definitions.values()
+    ):
+        raise ValueError(
+            f"{path} must map sample set names to lists of individual IDs"
+        )
+    return definitions
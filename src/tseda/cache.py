@@ -1,11 +1,28 @@
 """This module provides a caching mechanism for the TSeDA application,
-utilizing the `diskcache` library."""
+utilizing the `diskcache` library, and an in-memory cache of rendered
+plot objects.
 
+Results are stored under content-addressed keys, built from a fingerprint
+of the tree sequence and a digest of the canonicalised parameters of the
+computation, so that they are shared between sessions and server
+restarts on the same data.
+"""
+
+import collections
+import hashlib
+import json
 import pathlib
+import pickle
+import re
+import sys
+import zlib
+from typing import Callable, Hashable, Optional
 
 import appdirs
 import daiquiri
 import diskcache
+import numpy as np
+from diskcache.core import UNKNOWN
 
 logger = daiquiri.getLogger("cache")
 
@@ -23,4 +40,472 @@ def get_cache_dir() -> pathlib.Path:
     return cache_dir
 
 
-cache = diskcache.Cache(get_cache_dir())
+#: Eviction policies offered to operators, see the diskcache documentation.
+EVICTION_POLICIES = ["least-recently-used", "least-frequently-used"]
+
+
+class CompressedDisk(diskcache.Disk):
+    """Serialises cached values with pickle, compressing payloads larger
+    than compress_threshold bytes (typically NumPy arrays) with zlib."""
+
+    def __init__(
+        self,
+        directory,
+        compress_level: int = 1,
+        compress_threshold: int = 2**16,
+        **kwargs,
+    ):
+        self.compress_level = compress_level
+        self.compress_threshold = compress_threshold
+        super().__init__(directory, **kwargs)
+
+    def store(self, value, read, key=UNKNOWN):
+        if not read:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            if len(data) >= self.compress_threshold:
+                value = b"z" + zlib.compress(data, self.compress_level)
+            else:
+                value = b"p" + data
+        return super().store(value, read, key=key)
+
+    def fetch(self, mode, filename, value, read):
+        data = super().fetch(mode, filename, value, read)
+        if not read and isinstance(data, bytes):
+            if data[:1] == b"z":
+                data = zlib.decompress(data[1:])
+            else:
+                data = data[1:]
+            data = pickle.loads(data)
+        return data
+
+
+def open_cache(directory=None, **settings) -> diskcache.Cache:
+    """Opens the result cache.
+
+    Arguments:
+        directory: The cache directory, defaults to `get_cache_dir()`.
+        **settings: diskcache settings such as size_limit and
+            eviction_policy. Settings are persisted in the cache
+            directory, so settings that are not given keep their previous
+            values.
+
+    Returns:
+        diskcache.Cache: The cache, with hit and miss statistics enabled.
+    """
+    if directory is None:
+        directory = get_cache_dir()
+    settings = {k: v for k, v in settings.items() if v is not None}
+    return diskcache.Cache(
+        str(directory), disk=CompressedDisk, statistics=True, **settings
+    )
+
+
+#: The result cache, opened on first use by get_cache(), so that importing
+#: tseda does not create or lock the default cache directory.
+cache: Optional[diskcache.Cache] = None
+
+
+def get_cache() -> diskcache.Cache:
+    """Returns the result cache, opening the default cache on first use
+    unless `configure` has opened another."""
+    global cache
+    if cache is None:
+        cache = open_cache()
+    return cache
+
+
+def configure(
+    directory=None,
+    size_limit: Optional[int] = None,
+    eviction_policy: Optional[str] = None,
+):
+    """Replaces the global cache, e.g. with the options given to
+    `tseda serve`.
+
+    Arguments:
+        directory: The cache directory, defaults to `get_cache_dir()`.
+        size_limit (int): Maximum size of the cache in bytes; the cache
+            evicts entries once it grows larger.
+        eviction_policy (str): One of EVICTION_POLICIES.
+    """
+    global cache
+    if cache is not None:
+        cache.close()
+    cache = open_cache(
+        directory, size_limit=size_limit, eviction_policy=eviction_policy
+    )
+    logger.info(
+        f"Using cache {cache.directory} with size limit "
+        f"{cache.size_limit} and {cache.eviction_policy} eviction"
+    )
+
+
+_UNITS = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+
+def parse_size(size: str) -> int:
+    """Parses a size such as "500M" or "2GB" into bytes."""
+    match = re.fullmatch(
+        r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)I?B?\s*", size.upper()
+    )
+    if match is None:
+        raise ValueError(f"Invalid size {size}")
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+
+def info() -> dict:
+    """Returns the location, size, settings and hit rate of the cache."""
+    cache = get_cache()
+    hits, misses = cache.stats()
+    lookups = hits + misses
+    return {
+        "directory": cache.directory,
+        "entries": len(cache),
+        "volume": cache.volume(),
+        "size_limit": cache.size_limit,
+        "eviction_policy": cache.eviction_policy,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / lookups if lookups > 0 else None,
+    }
+
+
+def evict(fingerprint: str) -> int:
+    """Removes all cached results of the tree sequence with the given
+    fingerprint and returns the number of removed entries."""
+    return get_cache().evict(fingerprint)
+
+
+#: Columns up to this many bytes are hashed in full; larger columns are
+#: hashed through FINGERPRINT_BLOCKS evenly spaced blocks of
+#: FINGERPRINT_BLOCK_SIZE bytes, including the first and last block.
+FINGERPRINT_BLOCK_SIZE = 2**16
+FINGERPRINT_BLOCKS = 64
+
+
+def _update_column(digest, values: np.ndarray):
+    """Adds a table column to the digest, sampling large columns."""
+    digest.update(f"{values.dtype.str}{values.shape}".encode())
+    data = np.ascontiguousarray(values).reshape(-1).view(np.uint8)
+    if data.size <= FINGERPRINT_BLOCK_SIZE * FINGERPRINT_BLOCKS:
+        digest.update(data)
+        return
+    starts = np.linspace(
+        0, data.size - FINGERPRINT_BLOCK_SIZE, FINGERPRINT_BLOCKS
+    ).astype(np.int64)
+    for start in starts:
+        digest.update(data[start : start + FINGERPRINT_BLOCK_SIZE])
+
+
+#: Numeric columns read through the zero-copy array accessors of the tree
+#: sequence.
+FINGERPRINT_COLUMNS = [
+    "individuals_flags",
+    "nodes_flags",
+    "nodes_time",
+    "nodes_population",
+    "nodes_individual",
+    "edges_left",
+    "edges_right",
+    "edges_parent",
+    "edges_child",
+    "migrations_left",
+    "migrations_right",
+    "migrations_node",
+    "migrations_source",
+    "migrations_dest",
+    "migrations_time",
+    "sites_position",
+    "mutations_site",
+    "mutations_node",
+    "mutations_parent",
+    "mutations_time",
+]
+
+#: Row accessors of each table, used for the metadata and string columns
+#: that have no array accessor. At most FINGERPRINT_ROWS evenly spaced rows
+#: are hashed, including the first and last row.
+FINGERPRINT_ROW_ACCESSORS = {
+    "individuals": "individual",
+    "nodes": "node",
+    "edges": "edge",
+    "migrations": "migration",
+    "sites": "site",
+    "mutations": "mutation",
+    "populations": "population",
+    "provenances": "provenance",
+}
+FINGERPRINT_ROWS = 256
+
+
+def _update_rows(digest, accessor, num_rows: int):
+    """Adds the rows of a table to the digest, sampling large tables."""
+    digest.update(str(num_rows).encode())
+    rows = np.unique(
+        np.linspace(0, num_rows - 1, min(num_rows, FINGERPRINT_ROWS)).astype(
+            np.int64
+        )
+    )
+    for row in rows.tolist():
+        digest.update(repr(accessor(row)).encode())
+
+
+def fingerprint(ts) -> str:
+    """Returns a digest of the contents of a tree sequence.
+
+    The numeric columns are read through the array accessors of the tree
+    sequence, such as ts.nodes_time, which share memory with it, and are
+    hashed one at a time together with their lengths. Small columns are
+    hashed in full; large columns are sampled so that the cost is bounded
+    for multi-GB tree sequences. The metadata and string columns, which
+    have no array accessor, are hashed from a sample of rows of each
+    table, and the provenance table, which records edits made with tskit,
+    is hashed in full if it is small. The tables are never copied, which
+    ts.tables does in tskit 0.6.
+
+    Arguments:
+        ts (tskit.TreeSequence): The tree sequence.
+
+    Returns:
+        str: A hex digest of the contents of the tree sequence.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(ts.sequence_length).encode())
+    digest.update(repr(ts.metadata).encode())
+    digest.update(repr(ts.table_metadata_schemas).encode())
+    for name in FINGERPRINT_COLUMNS:
+        digest.update(name.encode())
+        _update_column(digest, getattr(ts, name))
+    for name, accessor in FINGERPRINT_ROW_ACCESSORS.items():
+        digest.update(name.encode())
+        _update_rows(digest, getattr(ts, accessor), getattr(ts, f"num_{name}"))
+    return digest.hexdigest()
+
+
+def file_fingerprint(path, ts) -> str:
+    """Returns the fingerprint of the tree sequence stored at path.
+
+    The fingerprint is memoized in the cache under the resolved path,
+    size and modification time of the file, so that it is only computed
+    the first time an unchanged file is opened.
+
+    Arguments:
+        path: Path of the file the tree sequence was loaded from.
+        ts (tskit.TreeSequence): The tree sequence.
+
+    Returns:
+        str: The fingerprint of the tree sequence.
+    """
+    path = pathlib.Path(path).resolve()
+    stat = path.stat()
+    key = f"fingerprint/{path}/{stat.st_size}/{stat.st_mtime_ns}"
+    result = get_cache().get(key, default=None)
+    if result is None:
+        logger.debug(f"Computing fingerprint of {path}")
+        result = fingerprint(ts)
+        get_cache().set(key, result, tag=result)
+    return result
+
+
+def _canonical(value):
+    """Converts a parameter to a JSON serialisable value that is equal
+    for equal parameters."""
+    if isinstance(value, np.ndarray):
+        # Integer lists become int64 arrays, so node IDs given as a list
+        # or as a tskit int32 array produce the same key
+        if value.dtype.kind in "iu":
+            value = value.astype(np.int64)
+        value = np.ascontiguousarray(value)
+        return {
+            "dtype": value.dtype.str,
+            "shape": value.shape,
+            "data": hashlib.blake2b(
+                value.tobytes(), digest_size=16
+            ).hexdigest(),
+        }
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        try:
+            array = np.asarray(value)
+        except ValueError:  # ragged
+            array = None
+        if array is not None and array.size > 0 and array.dtype.kind in "biuf":
+            return _canonical(array)
+        return [_canonical(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def make_key(name: str, fingerprint: str, **params) -> str:
+    """Builds a cache key for a computation.
+
+    Arguments:
+        name (str): The name of the computation.
+        fingerprint (str): The fingerprint of the tree sequence.
+        **params: The parameters of the computation. NumPy arrays, dicts,
+            lists and tuples are canonicalised; numeric sequences are
+            treated as arrays, so windows given as a list or as an array
+            of floats produce the same key.
+
+    Returns:
+        str: The cache key.
+    """
+    params = json.dumps(_canonical(params), sort_keys=True, default=repr)
+    digest = hashlib.blake2b(params.encode(), digest_size=16).hexdigest()
+    return f"{name}/{fingerprint}/{digest}"
+
+
+def lookup(name: str, fingerprint: str, **params):
+    """Returns the cached result of a computation, or None on a cache
+    miss."""
+    return get_cache().get(make_key(name, fingerprint, **params), default=None)
+
+
+def store(name: str, fingerprint: str, result, **params):
+    """Stores the result of a computation, tagged with the fingerprint
+    of the tree sequence."""
+    get_cache().set(
+        make_key(name, fingerprint, **params), result, tag=fingerprint
+    )
+
+
+def memoize(name: str, fingerprint: str, func, **params):
+    """Returns the cached result of a computation, calling func() and
+    storing its result on a cache miss.
+
+    Arguments:
+        name (str): The name of the computation.
+        fingerprint (str): The fingerprint of the tree sequence.
+        func (Callable): Computes the result.
+        **params: The parameters that determine the result.
+    """
+    result = lookup(name, fingerprint, **params)
+    if result is None:
+        logger.debug(f"Cache miss for {name}")
+        result = func()
+        store(name, fingerprint, result, **params)
+    return result
+
+
+_CHILD_ATTRIBUTES = [
+    "objects",
+    "object",
+    "data",
+    "streams",
+    "renderers",
+    "data_source",
+]
+
+
+def estimate_size(obj, _seen=None) -> int:
+    """Estimates the memory used by a rendered plot object in bytes.
+
+    Arrays, data frames and strings are counted by their payload; panel
+    layouts and panes, HoloViews elements and streams, and Bokeh figures
+    are traversed through the attributes that hold their children and
+    data. Other objects are counted by `sys.getsizeof`.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if hasattr(obj, "memory_usage"):  # pandas
+        return int(np.sum(obj.memory_usage(deep=True)))
+    if isinstance(obj, (str, bytes)):
+        return sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return sum(estimate_size(v, _seen) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_size(v, _seen) for v in obj)
+    size = sys.getsizeof(obj)
+    for attr in _CHILD_ATTRIBUTES:
+        value = getattr(obj, attr, None)
+        if value is not None and not callable(value):
+            size += estimate_size(value, _seen)
+    return size
+
+
+class PlotCache:
+    """A least-recently-used cache of rendered plot objects, bounded by
+    an estimate of their memory use.
+
+    Attributes:
+        max_size (int): Memory budget in bytes. Objects larger than the
+            budget are not cached.
+        size (int): Estimated memory used by the cached objects.
+        hits (int): Number of lookups that found a cached object.
+        misses (int): Number of lookups that did not.
+    """
+
+    def __init__(self, max_size: int):
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self.max_size = max_size
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, max_size: int):
+        self._max_size = max_size
+        self._evict()
+
+    def _evict(self):
+        while self.size > self._max_size:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.size -= size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable):
+        return key in self._entries
+
+    def get(self, key: Hashable, default=None):
+        """Returns the object cached under key, marking it as the most
+        recently used, or default if there is none."""
+        if key not in self._entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def set(self, key: Hashable, value):
+        """Caches value under key, evicting the least recently used
+        objects until the cache fits its memory budget."""
+        self.pop(key)
+        size = estimate_size(value)
+        if size > self.max_size:
+            return
+        self._entries[key] = (value, size)
+        self.size += size
+        self._evict()
+
+    def pop(self, key: Hashable):
+        """Removes the object cached under key, if any."""
+        if key in self._entries:
+            _, size = self._entries.pop(key)
+            self.size -= size
+
+    def clear(self):
+        """Removes all cached objects."""
+        self._entries.clear()
+        self.size = 0
+
+    def get_or_create(self, key: Hashable, func: Callable):
+        """Returns the object cached under key, calling func() and caching
+        its result on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = func()
+            self.set(key, value)
+        return value
@@ -2,17 +2,22 @@
 
 This file stores configurations for the entire application such as figure
 dimensions and color schemes.
-"""
 
-import holoviews as hv
-from holoviews.plotting.util import process_cmap
+The color maps are resolved on first access, so that the command line
+tools can use this module without importing holoviews.
+"""
 
 # Global plot settings
 PLOT_WIDTH = 1000
 PLOT_HEIGHT = 600
 THRESHOLD = 1000  # max number of points to overlay on a plot
+PLOT_CACHE_SIZE = 256 * 2**20  # memory budget of rendered plots in bytes
 PLOT_COLOURS = ["#15E3AC", "#0FA57E", "#0D5160"]
 
+# Statistics, named after the tskit methods
+ONEWAY_STATISTICS = ["Tajimas_D", "diversity"]
+MULTIWAY_STATISTICS = ["Fst", "divergence"]
+
 # VCard settings
 SIDEBAR_BACKGROUND = "#5CB85D"
 VCARD_STYLE = {
@@ -21,14 +26,35 @@ VCARD_STYLE = {
 
 # Global color map
 CMAP = "viridis"
-CMAP_GLASBEY = {
-    cm.name: cm
-    for cm in hv.plotting.util.list_cmaps(
-        records=True, category="Categorical", reverse=False
-    )
-    if cm.name.startswith("glasbey")
-}
 colormap = "glasbey_hv"
-COLORS = process_cmap(
-    CMAP_GLASBEY[colormap].name, provider=CMAP_GLASBEY[colormap].provider
-)
+
+
+def _glasbey_cmaps():
+    from holoviews.plotting.util import list_cmaps
+
+    return {
+        cm.name: cm
+        for cm in list_cmaps(
+            records=True, category="Categorical", reverse=False
+        )
+        if cm.name.startswith("glasbey")
+    }
+
+
+def _colors():
+    # The glasbey color maps are provided by colorcet, which can be read
+    # without importing the plotting modules of holoviews
+    import colorcet
+
+    return list(colorcet.palette[colormap])
+
+
+_LAZY = {"CMAP_GLASBEY": _glasbey_cmaps, "COLORS": _colors}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = _LAZY[name]()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -28,20 +28,47 @@ TreeSequence.
 - `preprocess`: Calls `make_individuals_table`and `make_sample_sets_table`.
 """
 
+import hashlib
 import random
-from typing import Dict, List, Optional, Tuple
+from types import MappingProxyType
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import daiquiri
+import numpy as np
 import pandas as pd
 import panel as pn
 import param
 from panel.viewable import Viewer
 from tsbrowse import model
 
-from tseda import config
-from tseda.model import Individual, SampleSet
-
-from .gnn import windowed_genealogical_nearest_neighbours
+from tseda import api, cache, config
+from tseda.model import (
+    Individuals,
+    group_nodes,
+    population_sample_sets,
+)
+
+from . import precompute
+from .gnn import (
+    HaplotypeGNN,
+    SparseGNN,
+    TreeStateIndex,
+    iter_windowed_genealogical_nearest_neighbours,
+    log_progress,
+    reference_set_key,
+    reference_set_map,
+    windowed_genealogical_nearest_neighbours,
+)
+from .precompute import PrecomputedGNN
 
 logger = daiquiri.getLogger("tseda")
 
@@ -65,6 +92,9 @@ class SampleSetsTable(Viewer):
             Warning alert for duplicate sample set names.
         table (param.DataFrame):
             Underlying DataFrame holding sample set data.
+        edits (param.Integer):
+            Number of edits made to the table, incremented by the edit
+            callbacks.
 
     Methods:
         tooltip() -> pn.widgets.TooltipIcon:
@@ -77,12 +107,17 @@ class SampleSetsTable(Viewer):
             Generates a sidebar table with quick view functionalities.
         sidebar() - > pn.Column:
             Creates the sidebar with options for managing sample sets.
-        color_by_name (dict):
-            Returns a dictionary with sample set colors as key-value pairs
-            (name-color).
-        names (dict):
-            Returns a dictionary with sample set names as key-value pairs
+        color_by_name (Mapping):
+            Returns a mapping with sample set colors as key-value pairs
+            (name-color). Lookups are cached until the names or colors
+            are edited.
+        names (Mapping):
+            Returns a mapping with sample set names as key-value pairs
             (index-name).
+        names_of(ids) -> np.ndarray:
+            Returns the names of an array of sample set ids.
+        colors_of(ids) -> np.ndarray:
+            Returns the colors of an array of sample set ids.
         loc(self, i: int) -> pd.core.series.Series:
             Returns a pd.core.series.Series (row) of a dataframe for a
             specific id
@@ -134,12 +169,16 @@ class SampleSetsTable(Viewer):
         visible=False,
     )
     table = param.DataFrame()
+    edits = param.Integer(default=0, doc="Number of edits made to the table")
 
     def __init__(self, **params):
         super().__init__(**params)
         self.table.set_index(["sample_set_id"], inplace=True)
         self.data = self.param.table.rx()
 
+    def _on_edit(self, event):
+        self.edits += 1
+
     @property
     def tooltip(self) -> pn.widgets.TooltipIcon:
         """Returns a TooltipIcon widget containing instructions for editing
@@ -188,6 +227,7 @@ class SampleSetsTable(Viewer):
                     False,
                 ]
                 self.create_sample_set_textinput = None
+                self.edits += 1
 
     def get_ids(self) -> List:
         """Returns the sample set IDs.
@@ -204,33 +244,82 @@ class SampleSetsTable(Viewer):
         else:
             raise TypeError("self.table is not a valid pandas DataFrame.")
 
+    def _lookups(self) -> dict:
+        """Returns the name and color lookups of the sample sets, which
+        are rebuilt only when the ids, names or colors have changed since
+        the previous call."""
+        df = self.data.rx.value
+        version = pd.util.hash_pandas_object(df[["name", "color"]]).values
+        lookups = getattr(self, "_lookups_cache", None)
+        if lookups is None or not np.array_equal(lookups["version"], version):
+            names = df["name"].to_numpy(dtype=object)
+            colors = df["color"].to_numpy(dtype=object)
+            lookups = {
+                "version": version,
+                "index": df.index.copy(),
+                "names": names,
+                "colors": colors,
+                "names_by_id": MappingProxyType(dict(zip(df.index, names))),
+                "color_by_name": MappingProxyType(dict(zip(names, colors))),
+            }
+            self._lookups_cache = lookups
+        return lookups
+
+    def _positions(self, ids) -> np.ndarray:
+        lookups = self._lookups()
+        positions = lookups["index"].get_indexer(np.asarray(ids).ravel())
+        if np.any(positions < 0):
+            missing = np.asarray(ids).ravel()[positions < 0]
+            raise KeyError(f"Unknown sample set ids {missing.tolist()}")
+        return positions
+
     @property
-    def color_by_name(self) -> Dict[str, str]:
-        """Return the color of all sample sets as a dictionary with sample set
-        names as keys.
+    def color_by_name(self) -> Mapping[str, str]:
+        """Return the color of all sample sets as a read-only mapping with
+        sample set names as keys.
 
         Returns:
-            Dict: dictionary of
+            Mapping: mapping of names (str) to colors (str)
         """
-        d = {}
-        for _, row in self.data.rx.value.iterrows():
-            d[row["name"]] = row.color
-        return d
+        return self._lookups()["color_by_name"]
 
     @property
-    def names(self) -> Dict[int, str]:
-        # TODO: see why this is called 6 times in a row - unecessary
-        """Return the names of all sample sets as a dictionary.
+    def names(self) -> Mapping[int, str]:
+        """Return the names of all sample sets as a read-only mapping.
 
         Returns:
-            Dict: dictionary of indices (int) as keys and
+            Mapping: mapping of indices (int) as keys and
             names (str) as values
         """
-        d = {}
-        for index, row in self.data.rx.value.iterrows():
-            d[index] = row["name"]
+        return self._lookups()["names_by_id"]
+
+    def names_of(self, ids) -> np.ndarray:
+        """Returns the names of the sample sets with the given ids.
+
+        Arguments:
+            ids (array_like): Sample set ids.
+
+        Returns:
+            np.ndarray: Object array of names aligned with ids.
+
+        Raises:
+            KeyError: If an id is not in the table.
+        """
+        return self._lookups()["names"][self._positions(ids)]
+
+    def colors_of(self, ids) -> np.ndarray:
+        """Returns the colors of the sample sets with the given ids.
+
+        Arguments:
+            ids (array_like): Sample set ids.
 
-        return d
+        Returns:
+            np.ndarray: Object array of colors aligned with ids.
+
+        Raises:
+            KeyError: If an id is not in the table.
+        """
+        return self._lookups()["colors"][self._positions(ids)]
 
     def loc(self, i: int) -> pd.core.series.Series:
         """Returns sample set pd.core.series.Series object (dataframe row) by
@@ -269,6 +358,7 @@ class SampleSetsTable(Viewer):
             },
             height=500,
         )
+        table.on_edit(self._on_edit)
         return pn.Column(
             self.tooltip,
             table,
@@ -291,6 +381,7 @@ class SampleSetsTable(Viewer):
             editors=self.editors,
             hidden_columns=["id"],
         )
+        table.on_edit(self._on_edit)
         return pn.Card(
             pn.Column(self.tooltip, table),
             title="Sample sets table quick view",
@@ -338,6 +429,15 @@ class IndividualsTable(Viewer):
             Filter configurations for the columns.
         table (param.DataFrame):
             Underlying data stored as a DataFrame.
+        edits (param.Integer):
+            Number of edits made to the table, incremented by the edit
+            callbacks.
+        individuals (param.ClassSelector):
+            Columnar store of the individuals that the table was built
+            from, which holds the nodes of each individual.
+        node_individual (param.Array):
+            Node individual column of the tree sequence, used to map
+            samples to individuals.
         page_size (param.Selector):
             Number of rows per page to display.
         sample_select (pn.widgets.MultiChoice):
@@ -364,7 +464,8 @@ class IndividualsTable(Viewer):
             table and how to edit it.
 
         sample_sets(only_selected: Optional[bool] = True):
-            Returns a dictionary with a sample set id to samples list mapping.
+            Returns a dictionary with a sample set id to samples array
+            mapping.
 
         get_population_ids() -> List[int]:
             Returns a sorted list of unique population IDs present in the data.
@@ -375,12 +476,16 @@ class IndividualsTable(Viewer):
                 1. Underlying data ("sample_set_id" column).
                 2. Optional SampleSetsTable object (if defined).
 
-        sample2ind -> Dict[int, int]:
-            Creates a dictionary mapping sample (tskit node) IDs to
+        sample2ind -> np.ndarray:
+            Returns an array mapping sample (tskit node) IDs to
             individual IDs.
 
         samples():
-            Yields all sample (tskit node) IDs present in the data.
+            Returns an array of all sample (tskit node) IDs present in the
+            data.
+
+        nodes(i: int) -> np.ndarray:
+            Returns the sample (tskit node) IDs of an individual.
 
         loc(i: int) -> pd.core.series.Series:
             Returns the individual data (pd.Series) for a specific index (ID).
@@ -464,6 +569,15 @@ class IndividualsTable(Viewer):
         },
     }
     table = param.DataFrame()
+    edits = param.Integer(default=0, doc="Number of edits made to the table")
+    individuals = param.ClassSelector(class_=Individuals)
+    node_individual = param.Array(
+        default=None,
+        doc=(
+            "Individual of each node of the tree sequence, -1 for nodes "
+            "without an individual"
+        ),
+    )
     page_size = param.Selector(
         objects=[10, 20, 50, 100, 200, 500],
         default=20,
@@ -519,6 +633,9 @@ class IndividualsTable(Viewer):
         self.sample_select.options = all_sample_set_ids
         self.sample_select.value = all_sample_set_ids
 
+    def _on_edit(self, event):
+        self.edits += 1
+
     @property
     def tooltip(self) -> pn.widgets.TooltipIcon:
         """Returns a TooltipIcon widget containing information about the
@@ -545,28 +662,42 @@ class IndividualsTable(Viewer):
         )
 
     def sample_sets(self, only_selected: Optional[bool] = True):
-        """Returns a dictionary with a sample set id to samples list mapping.
+        """Returns a dictionary with a sample set id to samples array mapping.
 
         Arguments:
             only_selected (bool, optional): If True, only considers
             individuals marked as selected in the table. Defaults to True.
 
         Returns:
-            dict: A dictionary where keys are sample set IDs and values are
-            lists of samples (tskit node IDs) belonging to that set. If
-            `only_selected` is True, only samples marked as selected are
-            included in the lists.
+            dict: A dictionary where keys are sample set IDs, in order of
+            first appearance in the table, and values are contiguous int32
+            arrays of the samples (tskit node IDs) belonging to that set,
+            in table order. If `only_selected` is True, only samples
+            marked as selected are included in the arrays.
         """
-        sample_sets = {}
         inds = self.data.rx.value
-        for _, ind in inds.iterrows():
-            if not ind.selected and only_selected:
-                continue
-            sample_set = ind.sample_set_id
-            if sample_set not in sample_sets:
-                sample_sets[sample_set] = []
-            sample_sets[sample_set].extend(ind.nodes)
-        return sample_sets
+        nodes, rows = self._node_arrays()
+        set_ids = inds["sample_set_id"].to_numpy()[rows]
+        if only_selected:
+            keep = inds["selected"].to_numpy(dtype=bool)[rows]
+            nodes = nodes[keep]
+            set_ids = set_ids[keep]
+        return group_nodes(nodes, set_ids)
+
+    def _node_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the flat int32 array of the nodes of the individuals,
+        and the table row of the individual of each node."""
+        return self.individuals.nodes, self.individuals.node_rows()
+
+    def nodes(self, i: int) -> np.ndarray:
+        """Returns the sample (tskit node) IDs of the individual with index
+        (ID) i.
+
+        Raises:
+            KeyError: If there is no individual with ID i.
+        """
+        position = self.data.rx.value.index.get_loc(i)
+        return self.individuals.individual_nodes(position)
 
     def get_population_ids(self) -> List[int]:
         """Returns a sorted list of unique population IDs present in the data.
@@ -598,41 +729,46 @@ class IndividualsTable(Viewer):
         return sorted(list(set(individuals_sets)))
 
     @property
-    def sample2ind(self) -> Dict[int, int]:
-        """Creates a dictionary that maps sample (tskit node) IDs to individual
+    def sample2ind(self) -> np.ndarray:
+        """Returns an array that maps sample (tskit node) IDs to individual
         IDs.
 
-        This method iterates through the underlying data and builds a
-        dictionary where:
-        Keys are sample (tskit node) IDs. Values are the corresponding
-        individual IDs
-        (indices) in the data.
+        The array is taken from the node individual column of the tree
+        sequence if it was given, and is otherwise built from the nodes
+        of the individuals in the table. It is built once and rebuilt only
+        when the table is replaced. Whole arrays of samples can be looked
+        up at once, e.g. `sample2ind[samples]`.
 
         Returns:
-            dict: A dictionary mapping sample (tskit node) IDs to their
-            corresponding
-            individual IDs.
+            np.ndarray: A read-only int32 array where entry u is the
+            individual ID of node u, or -1 if node u has no individual.
         """
-        inds = self.data.rx.value
-        d = {}
-        for index, ind in inds.iterrows():
-            for node in ind.nodes:
-                d[node] = index
-        return d
-
-    def samples(self):
-        """Yields all sample (tskit node) IDs present in the data.
-
-        This method iterates through the underlying data and yields each sample
-        (tskit node) ID.
+        if getattr(self, "_sample2ind", None) is None:
+            if self.node_individual is not None:
+                index = np.array(self.node_individual, dtype=np.int32)
+            else:
+                inds = self.data.rx.value
+                nodes, rows = self._node_arrays()
+                size = int(nodes.max()) + 1 if len(nodes) > 0 else 0
+                index = np.full(size, -1, dtype=np.int32)
+                index[nodes] = inds.index.to_numpy()[rows]
+            index.flags.writeable = False
+            self._sample2ind = index
+        return self._sample2ind
+
+    @param.depends("table", "node_individual", watch=True)
+    def _reset_sample2ind(self):
+        self._sample2ind = None
+
+    def samples(self) -> np.ndarray:
+        """Returns all sample (tskit node) IDs present in the data.
 
-        Yields:
-            int: Sample (tskit node) ID from the data.
+        Returns:
+            np.ndarray: Contiguous int32 array of the sample (tskit node)
+            IDs of the individuals, in table order.
         """
-
-        for _, ind in self.data.rx.value.iterrows():
-            for node in ind.nodes:
-                yield node
+        nodes, _ = self._node_arrays()
+        return nodes
 
     def loc(self, i: int) -> pd.core.series.Series:
         """Returns the individual data, pd.core.series.Series object, for a
@@ -656,6 +792,7 @@ class IndividualsTable(Viewer):
         assignments.
         """
         self.data.rx.value.sample_set_id = self.data.rx.value.population
+        self.edits += 1
 
     def combine_tables(
         self, individuals_table: param.reactive.rx
@@ -715,6 +852,7 @@ class IndividualsTable(Viewer):
             text_align={col: "right" for col in self.columns},
             header_filters=self.filters,
         )
+        combined_table.on_edit(self._on_edit)
         return combined_table
 
     @pn.depends(
@@ -738,12 +876,15 @@ class IndividualsTable(Viewer):
         self.sample_select.options = all_sample_set_ids
 
         if isinstance(self.sample_select.value, list):
+            selected = self.data.rx.value["selected"].to_numpy(copy=True)
             self.data.rx.value["selected"] = False
             for sample_set_id in self.sample_select.value:
                 self.data.rx.value.loc[
                     self.data.rx.value.sample_set_id == sample_set_id,
                     "selected",
                 ] = True
+            if not np.array_equal(selected, self.data.rx.value["selected"]):
+                self.edits += 1
         if (
             isinstance(self.mod_update_button.value, bool)
             and self.mod_update_button.value
@@ -752,6 +893,7 @@ class IndividualsTable(Viewer):
                 self.table["population"] == self.population_from.value,  # pyright: ignore[reportIndexIssue]
                 "sample_set_id",
             ] = self.sample_set_to.value
+            self.edits += 1
 
         if (
             isinstance(self.restore_button.value, bool)
@@ -839,6 +981,17 @@ class DataStore(Viewer):
         individuals_table (param.ClassSelector):
             ClassSelector for the IndividualsTable object handling individual
             data and filtering.
+        num_workers (param.Integer):
+            Number of worker processes used for haplotype GNN
+            calculations.
+        gnn_dtype (param.Selector):
+            Floating point precision of haplotype GNN results.
+        precomputed_gnn (param.ClassSelector):
+            Windowed haplotype GNN stored in the .tseda file, which is
+            served when the windows and sample sets match.
+        plot_cache_size (param.Integer):
+            Memory budget in bytes of the cache of rendered plots of each
+            session.
         views (param.List, constant=True):
             A list of views to be displayed.
 
@@ -848,15 +1001,59 @@ class DataStore(Viewer):
             individuals
             merged with their corresponding sample set names.
 
-        haplotype_gnn(self, focal_ind, windows=None):
+        haplotype_gnn(self, focal_ind, windows=None, time_windows=None):
             Calculates and returns the haplotype Genealogical Nearest
             Neighbors (GNN)
             for a specified focal individual and optional window sizes.
+
+        iter_haplotype_gnn(self, focal_ind, windows, time_windows=None,
+                chunk_size=None, progress=None):
+            Yields the haplotype GNN of a focal individual in chunks of
+            finished windows as the tree sequence is traversed.
+
+        haplotype_gnn_batch(self, focal=None, windows=None,
+                time_windows=None, sparse=False):
+            Calculates the haplotype GNN for many focal sample nodes in a
+            single traversal of the tree sequence.
+
+        cached(self, name, func, **params):
+            Returns the result of an expensive computation from the
+            persistent cache, keyed by the tree sequence fingerprint and
+            the parameters.
+
+        cached_plot(self, name, func, **params):
+            Returns a rendered plot from the in-memory plot cache, keyed
+            by the view parameters and the data version.
+
+        genealogical_nearest_neighbours(self, focal=None, sample_sets=None):
+            Calculates the GNN of focal samples over the entire sequence,
+            reusing the previous result while the inputs are unchanged.
+
+        tree_state_index(self, sample_sets):
+            Returns tree state checkpoints used to resume region-restricted
+            GNN calculations.
     """
 
     tsm = param.ClassSelector(class_=model.TSModel)
     sample_sets_table = param.ClassSelector(class_=SampleSetsTable)
     individuals_table = param.ClassSelector(class_=IndividualsTable)
+    num_workers = param.Integer(
+        default=1,
+        bounds=(1, None),
+        doc="Number of worker processes for haplotype GNN calculations",
+    )
+    gnn_dtype = param.Selector(
+        objects=["float64", "float32", "float16"],
+        default="float64",
+        doc="Floating point precision of haplotype GNN results",
+    )
+    precomputed_gnn = param.ClassSelector(class_=PrecomputedGNN, default=None)
+    plot_cache_size = param.Integer(
+        default=config.PLOT_CACHE_SIZE,
+        bounds=(0, None),
+        doc="Memory budget in bytes of the cache of rendered plots of each "
+        "session",
+    )
 
     views = param.List(constant=True)
 
@@ -872,8 +1069,11 @@ class DataStore(Viewer):
         return color.loc[color.selected].color
 
     def haplotype_gnn(
-        self, focal_ind: int, windows: Optional[List[int]] = None
-    ) -> pd.DataFrame:
+        self,
+        focal_ind: int,
+        windows: Optional[List[int]] = None,
+        time_windows: Optional[List[float]] = None,
+    ) -> HaplotypeGNN:
         """Calculates and returns the haplotype Genealogical Nearest Neighbors
         (GNN) for a specified focal individual and optional window sizes.
 
@@ -885,65 +1085,402 @@ class DataStore(Viewer):
                 GNNs within those specific windows. If None, GNNs are
                 calculated
                 across the entire sequence length.
+            time_windows (List[float], optional): A list of time window
+                breakpoints. All time windows are calculated in the same
+                traversal, and the GNN proportions are normalised within
+                each time window.
 
         Returns:
-            pandas.DataFrame: A DataFrame containing GNN information for each
-            haplotype.
+            HaplotypeGNN: The GNN proportions of each haplotype, with
+            window and set labels. Use `to_dataframe()` for a DataFrame
+            indexed by haplotype, time window (if given) and window.
         """
-        print("ksbhflbsdfj", type(focal_ind), type(windows))
-        sample_sets = self.individuals_table.sample_sets()
-        ind = self.individuals_table.loc(focal_ind)
-        hap = windowed_genealogical_nearest_neighbours(
-            self.tsm.ts, ind.nodes, sample_sets, windows=windows
+        nodes = self.individuals_table.nodes(focal_ind)
+        hap = self.haplotype_gnn_batch(
+            nodes, windows=windows, time_windows=time_windows
         )
-        dflist = []
-        sample_set_names = [
-            self.sample_sets_table.loc(i)["name"] for i in sample_sets
-        ]
         if windows is None:
-            for i in range(hap.shape[0]):
-                x = pd.DataFrame(hap[i, :])
-                x = x.T
-                x.columns = sample_set_names
-                x["haplotype"] = i
-                x["start"] = 0
-                x["end"] = self.tsm.ts.sequence_length
-                dflist.append(x)
+            windows = [0, self.tsm.ts.sequence_length]
+        return self._haplotype_result(hap, nodes, windows, time_windows)
+
+    def iter_haplotype_gnn(
+        self,
+        focal_ind: int,
+        windows: List[int],
+        time_windows: Optional[List[float]] = None,
+        chunk_size: Optional[int] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> Iterator[HaplotypeGNN]:
+        """Yields the haplotype Genealogical Nearest Neighbors (GNN) for a
+        focal individual in chunks of finished windows, starting from the
+        left end of the windows.
+
+        Arguments:
+            focal_ind (int): The index (ID) of the focal individual within the
+                individuals table.
+            windows (List[int]): A list of window breakpoints.
+            time_windows (List[float], optional): A list of time window
+                breakpoints.
+            chunk_size (int, optional): Number of windows per chunk.
+            progress (Callable, optional): Called as progress(done, total)
+                with the number of finished windows after each chunk.
+
+        Yields:
+            HaplotypeGNN: The GNN proportions of the windows in the chunk.
+        """
+        sample_sets = self.individuals_table.sample_sets()
+        nodes = self.individuals_table.nodes(focal_ind)
+        params = dict(
+            focal=nodes,
+            sample_sets=list(sample_sets.values()),
+            windows=windows,
+            time_windows=time_windows,
+            dtype=self.gnn_dtype,
+            sparse=False,
+        )
+        hap = self._precomputed_gnn(nodes, sample_sets, windows, time_windows)
+        if hap is None:
+            hap = cache.lookup("haplotype_gnn", self.fingerprint, **params)
+        if hap is not None:
+            if progress is not None:
+                progress(hap.shape[0], hap.shape[0])
+            yield self._haplotype_result(
+                hap.astype(self.gnn_dtype), nodes, windows, time_windows
+            )
+            return
+        checkpoints = None
+        if windows[0] > 0:
+            checkpoints = self.tree_state_index(sample_sets)
+        chunks = iter_windowed_genealogical_nearest_neighbours(
+            self.tsm.ts,
+            nodes,
+            sample_sets,
+            windows,
+            time_windows=time_windows,
+            chunk_size=chunk_size,
+            checkpoints=checkpoints,
+            progress=progress,
+            dtype=self.gnn_dtype,
+        )
+        parts = []
+        for start, hap in chunks:
+            parts.append(hap)
+            yield self._haplotype_result(
+                hap,
+                nodes,
+                windows[start : start + hap.shape[0] + 1],
+                time_windows,
+            )
+        # Only a completed traversal is stored
+        cache.store(
+            "haplotype_gnn", self.fingerprint, np.concatenate(parts), **params
+        )
+
+    def _haplotype_result(
+        self,
+        hap: np.ndarray,
+        nodes: List[int],
+        windows: List[int],
+        time_windows: Optional[List[float]] = None,
+    ) -> HaplotypeGNN:
+        """Wraps dense GNN proportions of haplotypes, restoring the window
+        and time window axes dropped by the GNN engine."""
+        windows = np.asarray(windows)
+        if time_windows is not None:
+            time_windows = np.asarray(time_windows)
+            num_time_windows = time_windows.shape[0] - 1
         else:
-            for i in range(hap.shape[1]):
-                x = pd.DataFrame(hap[:, i, :])
-                x.columns = sample_set_names
-                x["haplotype"] = i
-                x["start"] = windows[0:-1]
-                x["end"] = windows[1:]
-                dflist.append(x)
-        df = pd.concat(dflist)
-        df.set_index(["haplotype", "start", "end"], inplace=True)
-        return df
-
-
-def make_individuals_table(tsm: model.TSModel) -> IndividualsTable:
+            num_time_windows = 1
+        sample_sets = self.individuals_table.sample_sets()
+        return HaplotypeGNN(
+            values=hap.reshape(
+                (windows.shape[0] - 1, num_time_windows, len(nodes), -1)
+            ),
+            windows=windows,
+            nodes=np.asarray(nodes),
+            labels=self.sample_sets_table.names_of(list(sample_sets)).tolist(),
+            time_windows=time_windows,
+        )
+
+    def haplotype_gnn_batch(
+        self,
+        focal: Optional[List[int]] = None,
+        windows: Optional[List[int]] = None,
+        time_windows: Optional[List[float]] = None,
+        sparse: bool = False,
+    ) -> Union[np.ndarray, SparseGNN]:
+        """Calculates the haplotype Genealogical Nearest Neighbors (GNN) for
+        many focal sample nodes in a single pass over the tree sequence.
+
+        Arguments:
+            focal (List[int], optional): The sample (tskit node) IDs to use
+                as focal nodes. If None, all samples in the individuals
+                table are used.
+            windows (List[int], optional): A list of window breakpoints. If
+                None, GNNs are calculated across the entire sequence
+                length.
+            time_windows (List[float], optional): A list of time window
+                breakpoints. All time windows are calculated in the same
+                traversal.
+            sparse (bool): Return the proportions as a SparseGNN, which
+                only stores the non-zero proportions of each window. The
+                sparse output is for API users with many focal nodes; the
+                views plot the few haplotypes of an individual from dense
+                arrays in the `gnn_dtype` precision.
+
+        Returns:
+            np.ndarray or SparseGNN: GNN proportions in the `gnn_dtype`
+            precision with shape (windows, time windows, focal, sample
+            sets), where the window and time window axes are dropped if
+            the corresponding argument is None. The sample set axis
+            follows the order of `individuals_table.sample_sets()`.
+        """
+        if focal is None:
+            focal = self.individuals_table.samples()
+        sample_sets = self.individuals_table.sample_sets()
+        hap = self._precomputed_gnn(focal, sample_sets, windows, time_windows)
+        if hap is not None:
+            if sparse:
+                return SparseGNN.from_dense(hap, self.gnn_dtype)
+            return hap.astype(self.gnn_dtype)
+
+        def compute():
+            checkpoints = None
+            if windows is not None and windows[0] > 0:
+                checkpoints = self.tree_state_index(sample_sets)
+            return windowed_genealogical_nearest_neighbours(
+                self.tsm.ts,
+                focal,
+                sample_sets,
+                windows=windows,
+                time_windows=time_windows,
+                num_workers=self.num_workers,
+                checkpoints=checkpoints,
+                progress=log_progress,
+                dtype=self.gnn_dtype,
+                sparse=sparse,
+            )
+
+        return self.cached(
+            "haplotype_gnn",
+            compute,
+            focal=focal,
+            sample_sets=list(sample_sets.values()),
+            windows=windows,
+            time_windows=time_windows,
+            dtype=self.gnn_dtype,
+            sparse=sparse,
+        )
+
+    def _precomputed_gnn(
+        self,
+        focal: List[int],
+        sample_sets: Dict,
+        windows: Optional[List[int]],
+        time_windows: Optional[List[float]],
+    ) -> Optional[np.ndarray]:
+        """Returns the stored GNN proportions of the focal nodes if they
+        were precomputed for the same sample sets and windows."""
+        if self.precomputed_gnn is None or time_windows is not None:
+            return None
+        key = reference_set_key(reference_set_map(self.tsm.ts, sample_sets))
+        return self.precomputed_gnn.lookup(focal, key, windows)
+
+    @property
+    def fingerprint(self) -> str:
+        """Returns the fingerprint of the tree sequence used in cache keys."""
+        if getattr(self, "_fingerprint", None) is None:
+            self._fingerprint = cache.file_fingerprint(
+                self.tsm.full_path, self.tsm.ts
+            )
+        return self._fingerprint
+
+    def cached(self, name: str, func: Callable, **params):
+        """Returns the result of an expensive computation on the tree
+        sequence from the persistent cache, computing and storing it on a
+        cache miss.
+
+        Arguments:
+            name (str): The name of the computation.
+            func (Callable): Computes the result.
+            **params: The parameters that determine the result, such as the
+                statistic, mode, windows and sample set node arrays.
+        """
+        return cache.memoize(name, self.fingerprint, func, **params)
+
+    @property
+    def data_version(self) -> str:
+        """Returns a digest of the sample set assignment, selection, names
+        and colors that the plots are drawn from. It is computed once and
+        recomputed after the individuals or sample sets tables are edited
+        or replaced."""
+        if getattr(self, "_data_version", None) is not None:
+            return self._data_version
+        digest = hashlib.blake2b(digest_size=16)
+        for df, columns in [
+            (
+                self.individuals_table.data.rx.value,
+                ["sample_set_id", "selected"],
+            ),
+            (self.sample_sets_table.data.rx.value, ["name", "color"]),
+        ]:
+            digest.update(pd.util.hash_pandas_object(df[columns]).values)
+        self._data_version = digest.hexdigest()
+        return self._data_version
+
+    @param.depends(
+        "individuals_table",
+        "individuals_table.table",
+        "individuals_table.edits",
+        "sample_sets_table",
+        "sample_sets_table.table",
+        "sample_sets_table.edits",
+        watch=True,
+    )
+    def _reset_data_version(self):
+        self._data_version = None
+
+    @property
+    def plot_cache(self) -> cache.PlotCache:
+        """Returns the cache of rendered plots of the current session.
+
+        The datastore is shared by all sessions of the server, but each
+        session (Bokeh document) has its own cache with its own memory
+        budget, so that rendered layouts are never handed to more than one
+        document. The cache of a session is dropped when the session is
+        destroyed. Outside a session a single cache is used.
+        """
+        if getattr(self, "_plot_caches", None) is None:
+            self._plot_caches = {}
+        doc = pn.state.curdoc
+        plots = self._plot_caches.get(doc)
+        if plots is None:
+            plots = self._plot_caches[doc] = cache.PlotCache(
+                self.plot_cache_size
+            )
+            if doc is not None:
+                pn.state.on_session_destroyed(
+                    lambda session_context: self._plot_caches.pop(doc, None)
+                )
+        plots.max_size = self.plot_cache_size
+        return plots
+
+    def cached_plot(self, name: str, func: Callable, **params):
+        """Returns a rendered plot object from the plot cache, calling
+        func() to render it on a cache miss. Toggling back to recently
+        viewed settings reuses the plot instead of rebuilding it.
+
+        Arguments:
+            name (str): The name of the view.
+            func (Callable): Renders the plot.
+            **params: The view parameters the plot is rendered from. The
+                data version is added to the key.
+        """
+        return self.plot_cache.get_or_create(
+            self.plot_key(name, **params), func
+        )
+
+    def plot_key(self, name: str, **params) -> str:
+        """Returns the plot cache key of a view rendered from params and
+        the current data version."""
+        return cache.make_key(name, self.data_version, **params)
+
+    def genealogical_nearest_neighbours(
+        self,
+        focal: Optional[List[int]] = None,
+        sample_sets: Optional[Dict] = None,
+    ) -> np.ndarray:
+        """Calculates the Genealogical Nearest Neighbors (GNN) of focal
+        samples over the entire sequence.
+
+        The result is kept in memory and shared by all views, and is only
+        recalculated when the focal samples or the sample set assignment
+        change.
+
+        Arguments:
+            focal (List[int], optional): The focal sample (tskit node) IDs.
+                If None, all samples of the selected individuals are used.
+            sample_sets (Dict, optional): Mapping from sample set id to
+                samples. If None, `individuals_table.sample_sets()` is used.
+
+        Returns:
+            np.ndarray: Read-only GNN proportions with shape (focal, sample
+            sets).
+        """
+        if sample_sets is None:
+            sample_sets = self.individuals_table.sample_sets()
+        if focal is None:
+            focal = [u for nodes in sample_sets.values() for u in nodes]
+        key = reference_set_key(
+            reference_set_map(self.tsm.ts, sample_sets), focal
+        )
+        memo = getattr(self, "_gnn_memo", None)
+        if memo is None or memo[0] != key:
+            result = self.cached(
+                "genealogical_nearest_neighbours",
+                lambda: api.genealogical_nearest_neighbours(
+                    self.tsm.ts, sample_sets, focal
+                ),
+                focal=focal,
+                sample_sets=list(sample_sets.values()),
+            )
+            result.setflags(write=False)
+            memo = (key, result)
+            self._gnn_memo = memo
+        return memo[1]
+
+    def tree_state_index(self, sample_sets: Dict) -> TreeStateIndex:
+        """Returns the tree state checkpoints for the given sample sets.
+
+        The checkpoints are kept in memory and rebuilt when the sample set
+        assignment changes.
+
+        Arguments:
+            sample_sets (Dict): Mapping from sample set id to samples.
+
+        Returns:
+            TreeStateIndex: Checkpoints of the tree state along the
+            sequence.
+        """
+        key = reference_set_key(reference_set_map(self.tsm.ts, sample_sets))
+        index = getattr(self, "_tree_state_index", None)
+        if index is None or index.key != key:
+            logger.info("Building tree state checkpoints")
+            index = TreeStateIndex(self.tsm.ts, sample_sets)
+            self._tree_state_index = index
+        return index
+
+
+def make_individuals_table(
+    tsm: model.TSModel, individuals: Optional[Individuals] = None
+) -> IndividualsTable:
     """Creates an IndividualsTable object from the data in the provided TSModel
-    object, by iterating through the individuals in the tree sequence and
-    creates an Individual object for each one, creating a Pandas DataFrame
-    populated with the individual level information.
+    object, by building a columnar store of the individuals in the tree
+    sequence and presenting its per-individual columns as a Pandas
+    DataFrame.
 
     Arguments:
         tsm (model.TSModel): The TSModel object containing the tree
         sequence data.
+        individuals (Individuals): The columnar store of the individuals,
+        if already available; built from the tree sequence otherwise.
 
     Returns:
         IndividualsTable: An IndividualsTable object populated with
         individual level information from the tree sequence.
     """
-    result = []
-    for ts_ind in tsm.ts.individuals():
-        ind = Individual(individual=ts_ind)
-        result.append(ind)
-    return IndividualsTable(table=pd.DataFrame(result))
+    if individuals is None:
+        individuals = Individuals.from_tree_sequence(tsm.ts)
+    return IndividualsTable(
+        table=individuals.to_dataframe(),
+        individuals=individuals,
+        node_individual=tsm.ts.nodes_individual,
+    )
 
 
-def make_sample_sets_table(tsm: model.TSModel) -> SampleSetsTable:
+def make_sample_sets_table(
+    tsm: model.TSModel, table: Optional[pd.DataFrame] = None
+) -> SampleSetsTable:
     """Creates a SampleSetsTable object from the data in the provided TSModel
     object, by iterating through the populations in the tree sequence and
     creates a SampleSet object for each one, creating a Pandas DataFrame
@@ -952,18 +1489,16 @@ def make_sample_sets_table(tsm: model.TSModel) -> SampleSetsTable:
     Arguments:
         tsm (model.TSModel): The TSModel object containing the tree
         sequence data.
+        table (pd.DataFrame): The sample sets, if already available; built
+        from the populations of the tree sequence otherwise.
 
     Returns:
         SampleSet: A SampleSet object populated with
         population level information from the tree sequence.
     """
-    result = []
-    for ts_pop in tsm.ts.populations():
-        ss = SampleSet(
-            sample_set_id=ts_pop.id, population=ts_pop, predefined=True
-        )
-        result.append(ss)
-    return SampleSetsTable(table=pd.DataFrame(result))
+    if table is not None:
+        return SampleSetsTable(table=table)
+    return SampleSetsTable(table=pd.DataFrame(population_sample_sets(tsm.ts)))
 
 
 def preprocess(tsm: model.TSModel) -> Tuple[IndividualsTable, SampleSetsTable]:
@@ -983,6 +1518,15 @@ def preprocess(tsm: model.TSModel) -> Tuple[IndividualsTable, SampleSetsTable]:
             SampleSetsTable: A SampleSetsTable object populated with population
             information from the tree sequence.
     """
+    stored = precompute.load_tables(tsm.full_path, tsm.ts)
+    if stored is not None:
+        logger.info(
+            f"Loaded individuals and sample sets tables from {tsm.full_path}"
+        )
+        individuals, sample_sets = stored
+        sample_sets_table = make_sample_sets_table(tsm, sample_sets)
+        individuals_table = make_individuals_table(tsm, individuals)
+        return individuals_table, sample_sets_table
     logger.info(
         "Preprocessing data: making individuals and sample sets tables"
     )
@@ -3,11 +3,53 @@
 Based on code from tskit.tests.test_stats:
 
 https://github.com/tskit-dev/tskit/pull/683/files#diff-e5e589330499b325320b2e3c205eaf350660b50691d3e1655f8789683e49dca6R399
+
+Two engines are provided. The default numba engine runs the entire
+edge-diff traversal as a compiled kernel over the flat edge and index
+arrays of the tree sequence. The pure Python engine is the original
+implementation and is kept as a reference for testing.
+
+The numba engine can also split the sequence into contiguous chunks of
+windows that are processed in parallel by a pool of worker processes.
+Each worker rebuilds the tree state at the start of its chunk and only
+processes the edge diffs within it.
+
+Finished windows can also be streamed in chunks with
+iter_windowed_genealogical_nearest_neighbours, which carries the tree
+state over from one chunk to the next. Progress is reported through an
+optional callback rather than printed to the terminal.
+
+The output can be stored in reduced floating point precision, or as a
+SparseGNN that only keeps the non-zero proportions of each row. The
+numba engine assembles either representation one chunk of windows at
+a time, so the full float64 array is never allocated when the
+proportions are span normalised.
+
+Windows need not span the entire sequence. Region-restricted queries
+start from the tree state at the first window breakpoint, which is
+either rebuilt from scratch or resumed from the nearest checkpoint of a
+TreeStateIndex.
 """
 
+import concurrent.futures
+import dataclasses
+import hashlib
+import math
+import multiprocessing
+from typing import Optional
+
+import daiquiri
+import numba
 import numpy as np
+import pandas as pd
 import tskit
-from tqdm import tqdm
+
+logger = daiquiri.getLogger("tseda")
+
+ENGINES = ["numba", "python"]
+CHECKPOINT_INTERVAL = 1_000_000
+# Number of float64 values computed per chunk when assembling the output
+CHUNK_VALUES = 2**22
 
 
 def parse_time_windows(ts, time_windows):
@@ -16,6 +58,338 @@ def parse_time_windows(ts, time_windows):
     return np.array(time_windows)
 
 
+def make_windows(window_size, sequence_length):
+    """Make windows for statistics."""
+    num_windows = int(sequence_length / window_size)
+    windows = np.linspace(0, sequence_length, num_windows + 1)
+    windows[-1] = sequence_length
+    return windows
+
+
+def make_time_windows(num_time_windows, ts):
+    """Make log-spaced time windows for GNN, from the youngest internal
+    node to the oldest root. Returns None for a single time window."""
+    if num_time_windows <= 1:
+        return None
+    nodes_time = ts.nodes_time[ts.nodes_time > 0]
+    breakpoints = np.geomspace(
+        nodes_time.min(), ts.max_root_time, num_time_windows + 1
+    )
+    breakpoints[0] = 0
+    breakpoints[-1] = ts.max_root_time
+    return breakpoints
+
+
+def log_progress(done, total):
+    """Progress callback that logs the number of finished windows."""
+    logger.debug(f"GNN: finished {done} of {total} windows")
+
+
+def parse_windows(ts, windows):
+    """Parse sequence windows. Unlike ts.parse_windows the windows may
+    cover a region of the sequence rather than the entire sequence."""
+    if windows is None:
+        return np.array([0, ts.sequence_length], dtype=np.float64)
+    windows = np.asarray(windows, dtype=np.float64)
+    if (
+        windows.ndim != 1
+        or windows.shape[0] < 2
+        or windows[0] < 0
+        or windows[-1] > ts.sequence_length
+        or np.any(np.diff(windows) <= 0)
+    ):
+        raise ValueError(
+            "Windows must be increasing breakpoints within the sequence"
+        )
+    return windows
+
+
+def reference_set_map(ts, sample_sets):
+    """Map nodes to the index of the sample set they belong to.
+
+    Arguments:
+        ts (tskit.TreeSequence): The tree sequence.
+        sample_sets (dict): Mapping from sample set id to nodes.
+
+    Returns:
+        np.ndarray: Array of length num_nodes with the index (in the
+        order of sample_sets) of the reference set of each node, or
+        tskit.NULL if the node is not in a reference set.
+    """
+    node_map = np.full(ts.num_nodes, tskit.NULL, dtype=np.int32)
+    for k, reference_set in enumerate(sample_sets.values()):
+        nodes = np.asarray(reference_set, dtype=np.int32)
+        if np.any(node_map[nodes] != tskit.NULL) or (
+            np.unique(nodes).shape[0] != nodes.shape[0]
+        ):
+            raise ValueError("Duplicate value in reference sets")
+        node_map[nodes] = k
+    return node_map
+
+
+def reference_set_key(node_map, focal=None):
+    """Return a digest identifying an assignment of reference sets and,
+    optionally, the focal nodes of a query."""
+    digest = hashlib.blake2b(
+        np.ascontiguousarray(node_map).tobytes(), digest_size=16
+    )
+    if focal is not None:
+        digest.update(np.asarray(focal, dtype=np.int32).tobytes())
+    return digest.hexdigest()
+
+
+def _initial_sample_count(node_map, num_sets):
+    sample_count = np.zeros((node_map.shape[0], num_sets), dtype=np.int32)
+    nodes = np.flatnonzero(node_map != tskit.NULL)
+    sample_count[nodes, node_map[nodes]] = 1
+    return sample_count
+
+
+class TreeStateIndex:
+    """Checkpoints of the tree state at regular positions along the
+    sequence, for one assignment of reference sets.
+
+    Each checkpoint stores the parent array and the sample_count matrix
+    at a position, restricted to the nodes that differ from the initial
+    state, together with the positions in the edge insertion and
+    removal indexes. GNN queries restricted to a region resume from the
+    nearest checkpoint instead of replaying the tree sequence from the
+    start.
+
+    Attributes:
+        key (str): Digest of the reference set assignment.
+        positions (np.ndarray): Checkpoint positions.
+    """
+
+    def __init__(self, ts, sample_sets, interval=CHECKPOINT_INTERVAL):
+        node_map = reference_set_map(ts, sample_sets)
+        self.key = reference_set_key(node_map)
+        self.num_sets = len(sample_sets)
+        self.positions = np.arange(0, ts.sequence_length, interval)
+        arrays = _kernel_arrays(ts)
+        sample_count = _initial_sample_count(node_map, self.num_sets)
+        initial = sample_count.copy()
+        parent = np.full(ts.num_nodes, tskit.NULL, dtype=np.int32)
+        indexes, nodes, parents, counts = [], [], [], []
+        j, k = 0, 0
+        for position in self.positions:
+            j, k = _advance_kernel(
+                position, j, k, *arrays[:6], parent, sample_count
+            )
+            changed = np.flatnonzero(
+                (parent != tskit.NULL) | np.any(sample_count != initial, 1)
+            )
+            indexes.append((j, k))
+            nodes.append(changed.astype(np.int32))
+            parents.append(parent[changed])
+            counts.append(sample_count[changed])
+        self.indexes = np.array(indexes, dtype=np.int64).reshape(-1, 2)
+        self.offsets = np.cumsum([0] + [len(n) for n in nodes])
+        self.nodes = np.concatenate(nodes)
+        self.parent = np.concatenate(parents)
+        self.sample_count = np.concatenate(counts)
+        self._initial = initial
+
+    @property
+    def nbytes(self):
+        return (
+            self.nodes.nbytes + self.parent.nbytes + self.sample_count.nbytes
+        )
+
+    def restore(self, position):
+        """Return the tree state at the last checkpoint before or at
+        position.
+
+        Returns:
+            tuple: The checkpoint position, parent array, sample_count
+            matrix and the insertion and removal index positions.
+        """
+        i = np.searchsorted(self.positions, position, side="right") - 1
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        nodes = self.nodes[start:stop]
+        parent = np.full(self._initial.shape[0], tskit.NULL, dtype=np.int32)
+        parent[nodes] = self.parent[start:stop]
+        sample_count = self._initial.copy()
+        sample_count[nodes] = self.sample_count[start:stop]
+        j, k = self.indexes[i]
+        return self.positions[i], parent, sample_count, j, k
+
+
+class SparseGNN:
+    """GNN proportions stored row-wise in compressed sparse row format.
+
+    A row holds the proportions of one focal node in one window and time
+    window across the sample sets. Only non-zero proportions are stored,
+    and rows without entries are windows where the focal node has no
+    nearest neighbours, which are NaN in the dense representation.
+    Indexing with the leading axes selects rows without densifying.
+
+    Attributes:
+        shape (tuple): Shape of the dense array, with the sample sets
+            along the last axis.
+        indptr (np.ndarray): Row offsets into indices and data.
+        indices (np.ndarray): Sample set index of each stored value.
+        data (np.ndarray): Stored proportions.
+    """
+
+    def __init__(self, shape, indptr, indices, data):
+        self.shape = tuple(shape)
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    @classmethod
+    def from_dense(cls, A, dtype=np.float64):  # noqa: N803
+        rows = A.reshape(math.prod(A.shape[:-1]), A.shape[-1])
+        mask = rows != 0
+        mask[np.isnan(rows)] = False
+        indptr = np.zeros(rows.shape[0] + 1, dtype=np.int64)
+        np.cumsum(mask.sum(axis=1), out=indptr[1:])
+        indices = np.nonzero(mask)[1].astype(np.int32)
+        return cls(A.shape, indptr, indices, rows[mask].astype(dtype))
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Concatenate sparse arrays along the first axis."""
+        offsets = np.cumsum([0] + [part.indptr[-1] for part in parts[:-1]])
+        shape = (sum(part.shape[0] for part in parts),) + parts[0].shape[1:]
+        indptr = np.concatenate(
+            [[0]]
+            + [part.indptr[1:] + off for part, off in zip(parts, offsets)]
+        )
+        return cls(
+            shape,
+            indptr,
+            np.concatenate([part.indices for part in parts]),
+            np.concatenate([part.data for part in parts]),
+        )
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes
+
+    def reshape(self, shape):
+        """Return a view with the leading axes reshaped; the last axis
+        must be unchanged."""
+        if shape[-1] != self.shape[-1]:
+            raise ValueError("Cannot reshape the sample set axis")
+        num_rows = self.indptr.shape[0] - 1
+        leading = list(shape[:-1])
+        if leading.count(-1) > 1:
+            raise ValueError("Can only infer one axis of the shape")
+        known = math.prod(n for n in leading if n != -1)
+        if -1 in leading and known > 0 and num_rows % known == 0:
+            leading[leading.index(-1)] = num_rows // known
+        if math.prod(leading) != num_rows:
+            raise ValueError(
+                f"Cannot reshape {num_rows} rows into shape {tuple(shape)}"
+            )
+        return SparseGNN(
+            tuple(leading) + (shape[-1],), self.indptr, self.indices, self.data
+        )
+
+    def __getitem__(self, key):
+        rows = np.arange(self.indptr.shape[0] - 1).reshape(self.shape[:-1])
+        rows = np.asarray(rows[key])
+        flat = rows.reshape(-1)
+        starts = self.indptr[flat]
+        counts = self.indptr[flat + 1] - starts
+        indptr = np.zeros(flat.shape[0] + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        take = np.repeat(starts - indptr[:-1], counts) + np.arange(indptr[-1])
+        return SparseGNN(
+            rows.shape + (self.shape[-1],),
+            indptr,
+            self.indices[take],
+            self.data[take],
+        )
+
+    def to_dense(self):
+        """Return the dense array, with NaN for empty rows."""
+        num_rows = self.indptr.shape[0] - 1
+        A = np.full((num_rows, self.shape[-1]), np.nan, dtype=self.dtype)
+        counts = np.diff(self.indptr)
+        A[counts > 0] = 0
+        A[np.repeat(np.arange(num_rows), counts), self.indices] = self.data
+        return A.reshape(self.shape)
+
+
+@dataclasses.dataclass
+class HaplotypeGNN:
+    """Windowed GNN proportions of a set of haplotypes.
+
+    The proportions are kept in the array computed by the GNN engine,
+    and the accessors for a haplotype return views into it.
+
+    Attributes:
+        values (np.ndarray): GNN proportions with shape (windows, time
+            windows, haplotypes, sample sets).
+        windows (np.ndarray): Sequence window breakpoints.
+        nodes (np.ndarray): The sample node of each haplotype.
+        labels (list): The name of each sample set.
+        time_windows (np.ndarray): Time window breakpoints, or None if
+            the proportions are not stratified by time.
+    """
+
+    values: np.ndarray
+    windows: np.ndarray
+    nodes: np.ndarray
+    labels: list
+    time_windows: Optional[np.ndarray] = None
+
+    @property
+    def start(self) -> np.ndarray:
+        return self.windows[:-1]
+
+    @property
+    def end(self) -> np.ndarray:
+        return self.windows[1:]
+
+    def haplotype(self, haplotype, time_window=0):
+        """Return a (windows, sample sets) view of the proportions of a
+        haplotype in a time window."""
+        return self.values[:, time_window, haplotype]
+
+    def columns(self, haplotype, time_window=0):
+        """Return the window starts and the proportions of each sample set
+        for a haplotype in a time window, as a dict of column views."""
+        values = self.haplotype(haplotype, time_window)
+        columns = {"start": self.start}
+        for k, label in enumerate(self.labels):
+            columns[str(label)] = values[:, k]
+        return columns
+
+    def to_dataframe(self):
+        """Export the proportions to a DataFrame indexed by haplotype,
+        time window (if used) and window."""
+        num_windows, num_time_windows, num_haplotypes, K = self.values.shape
+        index = {
+            "haplotype": np.repeat(
+                np.arange(num_haplotypes), num_time_windows * num_windows
+            )
+        }
+        if self.time_windows is not None:
+            index["time_start"] = np.tile(
+                np.repeat(self.time_windows[:-1], num_windows), num_haplotypes
+            )
+            index["time_end"] = np.tile(
+                np.repeat(self.time_windows[1:], num_windows), num_haplotypes
+            )
+        index["start"] = np.tile(self.start, num_haplotypes * num_time_windows)
+        index["end"] = np.tile(self.end, num_haplotypes * num_time_windows)
+        return pd.DataFrame(
+            self.values.transpose(2, 1, 0, 3).reshape(-1, K),
+            index=pd.MultiIndex.from_arrays(
+                list(index.values()), names=list(index)
+            ),
+            columns=self.labels,
+        )
+
+
 def windowed_genealogical_nearest_neighbours(  # noqa: C901
     ts,
     focal,
@@ -24,25 +398,247 @@ def windowed_genealogical_nearest_neighbours(  # noqa: C901
     time_windows=None,
     span_normalise=True,
     time_normalise=True,
+    engine="numba",
+    num_workers=None,
+    checkpoints=None,
+    progress=None,
+    dtype=np.float64,
+    sparse=False,
 ):
-    reference_sets = {}
-    index_map = {}
-    for i, j in enumerate(sample_sets):
-        reference_sets[i] = sample_sets[j]
-        index_map[i] = j
-
-    reference_set_map = np.full(ts.num_nodes, tskit.NULL, dtype=int)
-    for k, reference_set in reference_sets.items():
-        for u in reference_set:
-            if reference_set_map[u] != tskit.NULL:
-                raise ValueError("Duplicate value in reference sets")
-            reference_set_map[u] = k
+    """Compute genealogical nearest neighbours of focal nodes in windows
+    along the sequence and, optionally, in time windows.
+
+    Arguments:
+        ts (tskit.TreeSequence): The tree sequence.
+        focal (list): The focal nodes.
+        sample_sets (dict): Mapping from sample set id to the list of
+            nodes in the reference set.
+        windows (list, optional): Sequence window breakpoints. The
+            windows may cover a region rather than the entire sequence.
+        time_windows (list, optional): Time window breakpoints.
+        span_normalise (bool): Normalise by the span of each window.
+        time_normalise (bool): Normalise by the time windows.
+        engine (str): Traversal engine, one of "numba" (default) or
+            "python" (reference implementation).
+        num_workers (int, optional): Number of worker processes. If
+            larger than 1, the windows are split into contiguous chunks
+            that are processed in parallel. Requires the numba engine.
+        checkpoints (TreeStateIndex, optional): Checkpoints for the
+            same sample sets, used by the numba engine to resume the
+            traversal close to the first window.
+        progress (callable, optional): Called as progress(done, total)
+            with the number of finished windows.
+        dtype (np.dtype): Floating point type of the output, e.g.
+            np.float32 or np.float16 to reduce memory.
+        sparse (bool): Return a SparseGNN instead of a dense array.
+
+    Returns:
+        np.ndarray or SparseGNN: GNN proportions of shape (windows,
+        time_windows, focal, sample_sets), where the window and time
+        window dimensions are dropped if the corresponding parameter is
+        None.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine}; choose from {ENGINES}")
+    if not np.issubdtype(dtype, np.floating):
+        raise ValueError(f"Output dtype must be floating point, not {dtype}")
+    if num_workers is not None and num_workers > 1 and engine != "numba":
+        raise ValueError("Parallel GNN requires the numba engine")
+    reference_sets = dict(enumerate(sample_sets.values()))
+    node_map = reference_set_map(ts, sample_sets)
+    if checkpoints is not None and checkpoints.key != reference_set_key(
+        node_map
+    ):
+        raise ValueError("Checkpoints were built for other sample sets")
     windows_used = windows is not None
     time_windows_used = time_windows is not None
-    windows = ts.parse_windows(windows)
+    windows = parse_windows(ts, windows)
     num_windows = windows.shape[0] - 1
     time_windows = parse_time_windows(ts, time_windows)
     num_time_windows = time_windows.shape[0] - 1
+    K = len(reference_sets)
+    shape = (num_windows, num_time_windows, len(focal), K)
+
+    if len(focal) == 0 or K == 0:
+        A = np.empty(shape, dtype=dtype)
+        if sparse:
+            A = SparseGNN.from_dense(A, dtype)
+        return _drop_window_axes(A, windows_used, time_windows_used)
+    if engine == "numba":
+        chunk_size = max(
+            1, CHUNK_VALUES // (num_time_windows * len(focal) * K)
+        )
+        chunks = _iter_gnn_numba(
+            ts,
+            focal,
+            node_map,
+            windows,
+            time_windows,
+            num_workers=num_workers,
+            checkpoints=checkpoints,
+            chunk_size=chunk_size,
+        )
+        chunks = _report_progress(chunks, num_windows, progress)
+    else:
+        A, norm = _gnn_python(
+            ts,
+            focal,
+            reference_sets,
+            node_map,
+            windows,
+            time_windows,
+            progress=progress,
+        )
+        chunks = [(0, A, norm)]
+    if span_normalise:
+        # Windows are normalised independently, so each chunk is final
+        parts = (
+            (start, _normalise(A, norm, True, time_normalise))
+            for start, A, norm in chunks
+        )
+    else:
+        _, A, norm = zip(*chunks)
+        A = _normalise(
+            np.concatenate(A), np.concatenate(norm), False, time_normalise
+        )
+        parts = [(0, A)]
+    if sparse:
+        A = SparseGNN.concatenate(
+            [SparseGNN.from_dense(A, dtype) for _, A in parts]
+        )
+    else:
+        A = np.empty(shape, dtype=dtype)
+        for start, part in parts:
+            A[start : start + part.shape[0]] = part
+    return _drop_window_axes(A, windows_used, time_windows_used)
+
+
+def _drop_window_axes(A, windows_used, time_windows_used):  # noqa: N803
+    """Remove the axis for windows and/or time_windows if the parameter
+    is None."""
+    num_windows, num_time_windows, num_focal, K = A.shape
+    if not windows_used and time_windows_used:
+        A = A.reshape((num_time_windows, num_focal, K))
+    elif not time_windows_used and windows_used:
+        A = A.reshape((num_windows, num_focal, K))
+    elif not windows_used and not time_windows_used:
+        A = A.reshape((num_focal, K))
+    return A
+
+
+def iter_windowed_genealogical_nearest_neighbours(
+    ts,
+    focal,
+    sample_sets,
+    windows,
+    time_windows=None,
+    time_normalise=True,
+    chunk_size=None,
+    checkpoints=None,
+    progress=None,
+    dtype=np.float64,
+):
+    """Compute span normalised genealogical nearest neighbours of focal
+    nodes in windows, yielding finished windows in chunks as the
+    traversal passes them.
+
+    Arguments:
+        ts (tskit.TreeSequence): The tree sequence.
+        focal (list): The focal nodes.
+        sample_sets (dict): Mapping from sample set id to the list of
+            nodes in the reference set.
+        windows (list): Sequence window breakpoints.
+        time_windows (list, optional): Time window breakpoints.
+        time_normalise (bool): Normalise by the time windows.
+        chunk_size (int, optional): Number of windows per chunk.
+            Defaults to a hundredth of the windows.
+        checkpoints (TreeStateIndex, optional): Checkpoints for the
+            same sample sets.
+        progress (callable, optional): Called as progress(done, total)
+            with the number of finished windows after each chunk.
+        dtype (np.dtype): Floating point type of the yielded arrays.
+
+    Yields:
+        tuple: The index of the first window in the chunk and the GNN
+        proportions of the chunk, with shape (windows, time_windows,
+        focal, sample_sets) where the time window dimension is dropped
+        if time_windows is None.
+    """
+    node_map = reference_set_map(ts, sample_sets)
+    if checkpoints is not None and checkpoints.key != reference_set_key(
+        node_map
+    ):
+        raise ValueError("Checkpoints were built for other sample sets")
+    time_windows_used = time_windows is not None
+    windows = parse_windows(ts, windows)
+    num_windows = windows.shape[0] - 1
+    time_windows = parse_time_windows(ts, time_windows).astype(np.float64)
+    if chunk_size is None:
+        chunk_size = math.ceil(num_windows / 100)
+    chunks = _iter_gnn_numba(
+        ts,
+        focal,
+        node_map,
+        windows,
+        time_windows,
+        checkpoints=checkpoints,
+        chunk_size=chunk_size,
+    )
+    for start, A, norm in _report_progress(chunks, num_windows, progress):
+        A = _normalise(A, norm, True, time_normalise).astype(dtype)
+        if not time_windows_used:
+            A = A.reshape((A.shape[0], len(focal), len(sample_sets)))
+        yield start, A
+
+
+def _report_progress(chunks, num_windows, progress):
+    """Pass on chunks of windows, reporting progress after each."""
+    for start, A, norm in chunks:
+        if progress is not None:
+            progress(start + A.shape[0], num_windows)
+        yield start, A, norm
+
+
+def _normalise(A, norm, span_normalise, time_normalise):  # noqa: N803
+    """Normalise the GNN counts A, setting windows without any
+    nearest neighbours to NaN."""
+    num_windows, num_time_windows, num_focal, _ = A.shape
+    # Reshape norm depending on normalization selected
+    # Return NaN when normalisation value is 0
+    if span_normalise and time_normalise:
+        reshaped_norm = norm.reshape(
+            (num_windows, num_time_windows, num_focal, 1)
+        )
+    elif span_normalise and not time_normalise:
+        norm = np.sum(norm, axis=1)
+        reshaped_norm = norm.reshape((num_windows, 1, num_focal, 1))
+    elif time_normalise and not span_normalise:
+        norm = np.sum(norm, axis=0)
+        reshaped_norm = norm.reshape((1, num_time_windows, num_focal, 1))
+    else:
+        reshaped_norm = 1
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        A /= reshaped_norm
+    A[np.all(A == 0, axis=3)] = np.nan
+    return A
+
+
+def _gnn_python(
+    ts,
+    focal,
+    reference_sets,
+    reference_set_map,
+    windows,
+    time_windows,
+    progress=None,
+):
+    """Reference implementation looping over ts.edge_diffs() in Python.
+
+    Returns the unnormalised GNN counts A and the normalisation array.
+    """
+    num_windows = windows.shape[0] - 1
+    num_time_windows = time_windows.shape[0] - 1
     A = np.zeros(
         (num_windows, num_time_windows, len(focal), len(reference_sets))
     )
@@ -58,7 +654,7 @@ def windowed_genealogical_nearest_neighbours(  # noqa: C901
 
     window_index = 0
     # Loop the tree sequence
-    for (t_left, t_right), edges_out, edges_in in tqdm(ts.edge_diffs()):
+    for (t_left, t_right), edges_out, edges_in in ts.edge_diffs():
         for edge in edges_out:
             parent[edge.child] = tskit.NULL
             v = edge.parent
@@ -73,7 +669,8 @@ def windowed_genealogical_nearest_neighbours(  # noqa: C901
                 v = parent[v]
 
         # Update the windows
-        assert window_index < num_windows
+        if window_index == num_windows:
+            break
         while (
             windows[window_index] < t_right and window_index + 1 <= num_windows
         ):
@@ -105,33 +702,503 @@ def windowed_genealogical_nearest_neighbours(  # noqa: C901
             assert span > 0
             if w_right <= t_right:
                 window_index += 1
+                if progress is not None:
+                    progress(window_index, num_windows)
             else:
                 # This interval crosses a tree boundary, so we update it again
                 # in the next tree
                 break
+    return A, norm
 
-    # Reshape norm depending on normalization selected
-    # Return NaN when normalisation value is 0
-    if span_normalise and time_normalise:
-        reshaped_norm = norm.reshape(
-            (num_windows, num_time_windows, len(focal), 1)
+
+def _iter_gnn_numba(
+    ts,
+    focal,
+    node_map,
+    windows,
+    time_windows,
+    num_workers=None,
+    checkpoints=None,
+    chunk_size=None,
+):
+    """Set up the flat arrays for the compiled GNN kernel and run it over
+    contiguous chunks of windows, either in turn carrying the tree state
+    from one chunk to the next or in a pool of worker processes.
+
+    Yields the index of the first window in each chunk together with the
+    unnormalised GNN counts A and the normalisation array of the chunk.
+    """
+    K = int(node_map.max(initial=-1)) + 1
+    sample_count = _initial_sample_count(node_map, K)
+    arrays = _kernel_arrays(ts)
+    focal = np.asarray(focal, dtype=np.int32)
+    windows = np.asarray(windows, dtype=np.float64)
+    time_windows = np.asarray(time_windows, dtype=np.float64)
+    num_windows = windows.shape[0] - 1
+    if num_workers is None or num_workers <= 1 or num_windows <= 1:
+        if chunk_size is None:
+            chunk_size = num_windows
+        parent, sample_count, j, k = _initial_state(
+            arrays, sample_count, windows[0], checkpoints
         )
-    elif span_normalise and not time_normalise:
-        norm = np.sum(norm, axis=1)
-        reshaped_norm = norm.reshape((num_windows, 1, len(focal), 1))
-    elif time_normalise and not span_normalise:
-        norm = np.sum(norm, axis=0)
-        reshaped_norm = norm.reshape((1, num_time_windows, len(focal), 1))
+        for start in range(0, num_windows, chunk_size):
+            stop = min(start + chunk_size, num_windows)
+            A, norm, j, k, _ = _gnn_kernel(
+                *arrays,
+                focal,
+                node_map,
+                parent,
+                sample_count,
+                j,
+                k,
+                windows[start : stop + 1],
+                time_windows,
+            )
+            yield start, A, norm
+        return
 
-    with np.errstate(invalid="ignore", divide="ignore"):
-        A /= reshaped_norm  # pyright: ignore[reportPossiblyUnboundVariable]
-    A[np.all(A == 0, axis=3)] = np.nan
+    # Contiguous chunks of windows; neighbouring chunks share a breakpoint
+    bounds = [
+        (chunk[0], chunk[-1] + 1)
+        for chunk in np.array_split(
+            np.arange(num_windows), min(num_workers, num_windows)
+        )
+    ]
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=len(bounds),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(arrays, focal, node_map, sample_count, checkpoints),
+    ) as executor:
+        results = executor.map(
+            _gnn_worker,
+            [windows[start : stop + 1] for start, stop in bounds],
+            [time_windows] * len(bounds),
+        )
+        for (start, _), (A, norm) in zip(bounds, results):
+            yield start, A, norm
 
-    # Remove dimension for windows and/or time_windows if parameter is None
-    if not windows_used and time_windows_used:
-        A = A.reshape((num_time_windows, len(focal), len(reference_sets)))
-    elif not time_windows_used and windows_used:
-        A = A.reshape((num_windows, len(focal), len(reference_sets)))
-    elif not windows_used and not time_windows_used:
-        A = A.reshape((len(focal), len(reference_sets)))
-    return A
+
+def _gnn_chunk(
+    arrays, focal, node_map, sample_count, windows, time_windows, checkpoints
+):
+    """Position the tree state at windows[0] and run the GNN kernel."""
+    parent, sample_count, j, k = _initial_state(
+        arrays, sample_count, windows[0], checkpoints
+    )
+    A, norm, _, _, _ = _gnn_kernel(
+        *arrays,
+        focal,
+        node_map,
+        parent,
+        sample_count,
+        j,
+        k,
+        windows,
+        time_windows,
+    )
+    return A, norm
+
+
+def _initial_state(arrays, sample_count, position, checkpoints):
+    """Return the tree state at position, either restored from the
+    nearest checkpoint or rebuilt from scratch."""
+    if checkpoints is not None and position > 0:
+        _, parent, sample_count, j, k = checkpoints.restore(position)
+        j, k = _advance_kernel(
+            position, j, k, *arrays[:6], parent, sample_count
+        )
+    else:
+        sample_count = sample_count.copy()
+        parent = np.full(sample_count.shape[0], tskit.NULL, dtype=np.int32)
+        j, k = _seek_kernel(position, *arrays[:6], parent, sample_count)
+    return parent, sample_count, j, k
+
+
+def _kernel_arrays(ts):
+    """Return the tree sequence arrays consumed by _gnn_kernel."""
+    return (
+        ts.edges_left,
+        ts.edges_right,
+        ts.edges_parent,
+        ts.edges_child,
+        ts.indexes_edge_insertion_order,
+        ts.indexes_edge_removal_order,
+        ts.sequence_length,
+        ts.nodes_time,
+    )
+
+
+_worker_state = {}
+
+
+def _init_worker(arrays, focal, node_map, sample_count, checkpoints):
+    """Store the arrays shared by all chunks once per worker process."""
+    _worker_state["args"] = (
+        arrays,
+        focal,
+        node_map,
+        sample_count,
+        checkpoints,
+    )
+
+
+def _gnn_worker(windows, time_windows):
+    """Run the GNN kernel on one chunk of windows in a worker process."""
+    arrays, focal, node_map, sample_count, checkpoints = _worker_state["args"]
+    return _gnn_chunk(
+        arrays,
+        focal,
+        node_map,
+        sample_count,
+        windows,
+        time_windows,
+        checkpoints,
+    )
+
+
+@numba.njit(cache=True)
+def _insert_edge(e, edges_parent, edges_child, parent, sample_count):
+    c = edges_child[e]
+    parent[c] = edges_parent[e]
+    v = edges_parent[e]
+    while v != -1:
+        for m in range(sample_count.shape[1]):
+            sample_count[v, m] += sample_count[c, m]
+        v = parent[v]
+
+
+@numba.njit(cache=True)
+def _remove_edge(e, edges_parent, edges_child, parent, sample_count):
+    c = edges_child[e]
+    parent[c] = -1
+    v = edges_parent[e]
+    while v != -1:
+        for m in range(sample_count.shape[1]):
+            sample_count[v, m] -= sample_count[c, m]
+        v = parent[v]
+
+
+@numba.njit(cache=True)
+def _advance_kernel(
+    position,
+    j,
+    k,
+    edges_left,
+    edges_right,
+    edges_parent,
+    edges_child,
+    insertion,
+    removal,
+    parent,
+    sample_count,
+):
+    """Apply all edge diffs at breakpoints up to and including position,
+    starting from the insertion and removal index positions j and k.
+
+    Updates parent and sample_count in place and returns the new index
+    positions.
+    """
+    num_edges = edges_left.shape[0]
+    while True:
+        x = np.inf
+        if j < num_edges:
+            x = min(x, edges_left[insertion[j]])
+        if k < num_edges:
+            x = min(x, edges_right[removal[k]])
+        if x > position:
+            break
+        while k < num_edges and edges_right[removal[k]] == x:
+            _remove_edge(
+                removal[k], edges_parent, edges_child, parent, sample_count
+            )
+            k += 1
+        while j < num_edges and edges_left[insertion[j]] == x:
+            _insert_edge(
+                insertion[j], edges_parent, edges_child, parent, sample_count
+            )
+            j += 1
+    return j, k
+
+
+@numba.njit(cache=True)
+def _seek_kernel(
+    position,
+    edges_left,
+    edges_right,
+    edges_parent,
+    edges_child,
+    insertion,
+    removal,
+    parent,
+    sample_count,
+):
+    """Build the tree state at position by inserting all edges that
+    overlap it.
+
+    Updates parent and sample_count in place and returns the indexes
+    into the insertion and removal orders from where the traversal
+    continues.
+    """
+    num_edges = edges_left.shape[0]
+    j = 0
+    while j < num_edges and edges_left[insertion[j]] <= position:
+        e = insertion[j]
+        if edges_right[e] > position:
+            _insert_edge(e, edges_parent, edges_child, parent, sample_count)
+        j += 1
+    k = 0
+    while k < num_edges and edges_right[removal[k]] <= position:
+        k += 1
+    return j, k
+
+
+@numba.njit(cache=True)
+def _flush_focal(
+    f, window_index, position, focal_time, weights, since, gnn, norm
+):
+    """Add the span of focal node f since its last flush up to position,
+    with its current weights, to window_index."""
+    t = focal_time[f]
+    span = position - since[f]
+    if t >= 0 and span > 0:
+        for m in range(weights.shape[1]):
+            gnn[window_index, t, f, m] += weights[f, m] * span
+        norm[window_index, t, f] += span
+    since[f] = position
+
+
+@numba.njit(cache=True)
+def _compact_paths(head, entries, num_entries, evaluated):
+    """Drop the path entries of focal nodes that have been re-evaluated
+    since they were registered, growing the entry storage if it is still
+    more than half full. Returns the new storage and number of entries.
+
+    Each entry is a row (next entry, focal index, version) of a linked
+    list starting at head[v], listing the focal nodes whose path to their
+    nearest ancestor passes through node v.
+    """
+    live = 0
+    for v in range(head.shape[0]):
+        e = head[v]
+        while e != -1:
+            if entries[e, 2] == evaluated[entries[e, 1]]:
+                live += 1
+            e = entries[e, 0]
+    capacity = entries.shape[0]
+    if 2 * live >= capacity:
+        capacity *= 2
+    compacted = np.empty((capacity, 3), dtype=np.int64)
+    n = 0
+    for v in range(head.shape[0]):
+        e = head[v]
+        head[v] = -1
+        while e != -1:
+            if entries[e, 2] == evaluated[entries[e, 1]]:
+                compacted[n, 0] = head[v]
+                compacted[n, 1] = entries[e, 1]
+                compacted[n, 2] = entries[e, 2]
+                head[v] = n
+                n += 1
+            e = entries[e, 0]
+    return compacted, n
+
+
+@numba.njit(cache=True)
+def _gnn_kernel(  # noqa: C901
+    edges_left,
+    edges_right,
+    edges_parent,
+    edges_child,
+    insertion,
+    removal,
+    sequence_length,
+    time,
+    focal,
+    reference_set_map,
+    parent,
+    sample_count,
+    j,
+    k,
+    windows,
+    time_windows,
+):
+    """Compiled equivalent of the loop in _gnn_python.
+
+    Walks the edge insertion and removal indexes in the same way as
+    ts.edge_diffs() and updates parent and sample_count in place. The
+    traversal starts at windows[0], which need not be the start of the
+    sequence; parent, sample_count and the index positions j and k must
+    hold the tree state at that position. Returns A and norm together
+    with the index positions from where the traversal continues after
+    the last window, and the number of times each focal node was
+    evaluated.
+
+    Focal nodes are evaluated incrementally. Each focal node caches its
+    nearest ancestor and GNN weights, and is registered on every node of
+    the path to that ancestor. The nodes whose parent or sample count is
+    changed by the edge diff of a tree are collected, and only the focal
+    nodes registered on them are re-evaluated, so the work per tree is
+    proportional to the changed lineages rather than to the number of
+    focal nodes. The span of each focal node is accumulated with its
+    cached weights and added to A when it is re-evaluated or a window
+    ends.
+    """
+    num_nodes, K = sample_count.shape
+    num_edges = edges_left.shape[0]
+    num_focal = focal.shape[0]
+    num_windows = windows.shape[0] - 1
+    num_time_windows = time_windows.shape[0] - 1
+    A = np.zeros((num_windows, num_time_windows, num_focal, K))
+    norm = np.zeros((num_windows, num_time_windows, num_focal))
+    total = np.zeros(num_nodes, dtype=np.int32)
+    for v in range(num_nodes):
+        for m in range(K):
+            total[v] += sample_count[v, m]
+    stamp = np.zeros(num_nodes, dtype=np.int64)
+    touched = np.empty(num_nodes, dtype=np.int32)
+
+    # Cached state per focal node
+    nearest = np.full(num_focal, -1, dtype=np.int32)
+    evaluated = np.full(num_focal, -1, dtype=np.int64)
+    evaluations = np.zeros(num_focal, dtype=np.int64)
+    focal_time = np.full(num_focal, -1, dtype=np.int64)
+    weights = np.zeros((num_focal, K))
+    since = np.full(num_focal, windows[0])
+    dirty = np.arange(num_focal)
+    num_dirty = num_focal
+    dirty_stamp = np.zeros(num_focal, dtype=np.int64)
+
+    # Focal nodes registered on each node, see _compact_paths
+    head = np.full(num_nodes, -1, dtype=np.int64)
+    entries = np.empty((max(16, 4 * num_focal), 3), dtype=np.int64)
+    num_entries = 0
+
+    t_left = windows[0]
+    tree = 0
+    window_index = 0
+    while t_left < sequence_length and window_index < num_windows:
+        tree += 1
+        num_touched = 0
+        while k < num_edges and edges_right[removal[k]] == t_left:
+            e = removal[k]
+            c = edges_child[e]
+            parent[c] = -1
+            if stamp[c] != tree:
+                stamp[c] = tree
+                touched[num_touched] = c
+                num_touched += 1
+            v = edges_parent[e]
+            while v != -1:
+                for m in range(K):
+                    sample_count[v, m] -= sample_count[c, m]
+                total[v] -= total[c]
+                if stamp[v] != tree:
+                    stamp[v] = tree
+                    touched[num_touched] = v
+                    num_touched += 1
+                v = parent[v]
+            k += 1
+        while j < num_edges and edges_left[insertion[j]] == t_left:
+            e = insertion[j]
+            c = edges_child[e]
+            parent[c] = edges_parent[e]
+            if stamp[c] != tree:
+                stamp[c] = tree
+                touched[num_touched] = c
+                num_touched += 1
+            v = edges_parent[e]
+            while v != -1:
+                for m in range(K):
+                    sample_count[v, m] += sample_count[c, m]
+                total[v] += total[c]
+                if stamp[v] != tree:
+                    stamp[v] = tree
+                    touched[num_touched] = v
+                    num_touched += 1
+                v = parent[v]
+            j += 1
+        t_right = sequence_length
+        if j < num_edges:
+            t_right = min(t_right, edges_left[insertion[j]])
+        if k < num_edges:
+            t_right = min(t_right, edges_right[removal[k]])
+
+        # Collect the focal nodes registered on the touched nodes,
+        # unlinking entries left over from earlier evaluations
+        for i in range(num_touched):
+            v = touched[i]
+            previous = -1
+            e = head[v]
+            while e != -1:
+                f = entries[e, 1]
+                following = entries[e, 0]
+                if entries[e, 2] != evaluated[f]:
+                    if previous == -1:
+                        head[v] = following
+                    else:
+                        entries[previous, 0] = following
+                else:
+                    if dirty_stamp[f] != tree:
+                        dirty_stamp[f] = tree
+                        dirty[num_dirty] = f
+                        num_dirty += 1
+                    previous = e
+                e = following
+
+        for i in range(num_dirty):
+            f = dirty[i]
+            u = focal[f]
+            _flush_focal(
+                f, window_index, t_left, focal_time, weights, since, A, norm
+            )
+            focal_reference_set = reference_set_map[u]
+            delta = 1 if focal_reference_set != -1 else 0
+            evaluated[f] = tree
+            evaluations[f] += 1
+            p = u
+            while p != -1:
+                if num_entries == entries.shape[0]:
+                    entries, num_entries = _compact_paths(
+                        head, entries, num_entries, evaluated
+                    )
+                entries[num_entries, 0] = head[p]
+                entries[num_entries, 1] = f
+                entries[num_entries, 2] = tree
+                head[p] = num_entries
+                num_entries += 1
+                if total[p] > delta:
+                    break
+                p = parent[p]
+            nearest[f] = p
+            focal_time[f] = -1
+            if p != -1:
+                time_index = np.searchsorted(time_windows, time[p]) - 1
+                if 0 <= time_index < num_time_windows:
+                    focal_time[f] = time_index
+                    scale = 1.0 / (total[p] - delta)
+                    for m in range(K):
+                        n = sample_count[p, m]
+                        if focal_reference_set == m:
+                            n -= 1
+                        weights[f, m] = n * scale
+        num_dirty = 0
+
+        while (
+            window_index < num_windows and windows[window_index + 1] <= t_right
+        ):
+            w_right = windows[window_index + 1]
+            for f in range(num_focal):
+                _flush_focal(
+                    f,
+                    window_index,
+                    w_right,
+                    focal_time,
+                    weights,
+                    since,
+                    A,
+                    norm,
+                )
+            window_index += 1
+        t_left = t_right
+    return A, norm, j, k, evaluations
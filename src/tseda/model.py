@@ -4,26 +4,27 @@ Class definitions for data models underlying all data views in tseda.
 The main data model is the tsbrowse.TSModel class which wraps a
 tskit.TreeSequence loaded from a .tszip file. This model is treated as
 immutable by the main application. Tseda adds two helper dataclasses to
-deal with individuals and sample sets, Indivudals and SampleSets.
-Instances of these classes are editable and can be used to filter the
-data for visualization, e.g. by selecting individuals or sample sets,
-or customization of sample set colors.
+deal with individuals and sample sets, Individuals and SampleSet.
+Individuals is a columnar store of all individuals, and SampleSet holds
+one sample set. They are presented as editable tables that can be used
+to filter the data for visualization, e.g. by selecting individuals or
+sample sets, or customization of sample set colors.
 
 TODO:
 
 - simplify haplotype_gnn function
-- cache computations!
 """
 
 import dataclasses
 import json
 import re
 from enum import Enum
+from typing import Dict, List, Optional
 
 import daiquiri
 import numpy as np
+import pandas as pd
 import tskit
-from bokeh.palettes import Set3
 
 from tseda import config
 
@@ -62,10 +63,110 @@ def parse_metadata(obj, regex):
     return None
 
 
-def palette(cmap=Set3[12], n=12, start=0, end=1):
-    """Make a small colorblind-friendly palette."""
+def _match_keys(keys, patterns: Dict[str, re.Pattern]) -> Dict[str, str]:
+    """Returns the first of keys that matches each pattern, as in
+    `parse_metadata`."""
+    matches = {}
+    for name, regex in patterns.items():
+        key = next(filter(regex.match, keys), None)
+        if key is not None:
+            matches[name] = key
+    return matches
+
+
+def _decode_json_rows(table) -> Optional[list]:
+    """Decodes the packed metadata column of a table as JSON in a single
+    call, or returns None if a row is not valid JSON."""
+    data = table.metadata.tobytes()
+    offset = table.metadata_offset
+    rows = [
+        data[start:stop] or b"null"
+        for start, stop in zip(offset[:-1].tolist(), offset[1:].tolist())
+    ]
+    try:
+        return json.loads(b"[" + b",".join(rows) + b"]")
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+
+def decode_metadata_columns(
+    table, patterns: Dict[str, re.Pattern]
+) -> Dict[str, np.ndarray]:
+    """Decodes the metadata values whose keys match the patterns for all
+    rows of a table.
+
+    JSON metadata, with or without a schema, is decoded from the packed
+    metadata column in one pass, and the matching keys are resolved once
+    per distinct set of keys rather than once per row. As when decoding
+    with the schema, missing top-level keys are filled in from the
+    defaults of the schema, and empty metadata decodes to the defaults.
+    Metadata with a binary codec is read key by key with
+    `metadata_vector`, after resolving the keys from the schema
+    properties. Rows whose metadata cannot be decoded in bulk fall back
+    to `parse_metadata`.
+
+    Arguments:
+        table: A tskit table with a metadata column.
+        patterns (Dict[str, re.Pattern]): Regular expressions matching the
+            key of each value to extract.
+
+    Returns:
+        Dict[str, np.ndarray]: An object array for each pattern with the
+        value of each row, or None where no key matches.
+    """
+    num_rows = table.num_rows
+    columns = {
+        name: np.full(num_rows, None, dtype=object) for name in patterns
+    }
+    if num_rows == 0:
+        return columns
+    schema = table.metadata_schema.schema
+    codec = None if schema is None else schema.get("codec")
+    if codec not in (None, "json"):
+        keys = _match_keys(schema.get("properties", {}), patterns)
+        for name, key in keys.items():
+            columns[name][:] = table.metadata_vector(key).tolist()
+        return columns
+    rows = _decode_json_rows(table)
+    if rows is None:
+        logger.debug("Decoding metadata row by row")
+        for j, row in enumerate(table):
+            for name, regex in patterns.items():
+                columns[name][j] = parse_metadata(row, regex)
+        return columns
+    defaults = {}
+    if schema is not None:
+        defaults = {
+            key: prop["default"]
+            for key, prop in schema.get("properties", {}).items()
+            if "default" in prop
+        }
+    resolved = {}
+    for j, row in enumerate(rows):
+        if row is None and schema is not None:
+            row = {}
+        if not isinstance(row, dict):
+            continue
+        if defaults:
+            row = dict(defaults, **row)
+        row_keys = tuple(row)
+        keys = resolved.get(row_keys)
+        if keys is None:
+            keys = resolved[row_keys] = _match_keys(row_keys, patterns)
+        for name, key in keys.items():
+            columns[name][j] = row[key]
+    return columns
+
+
+def palette(cmap=None, n=12, start=0, end=1):
+    """Make a small colorblind-friendly palette, from bokeh's Set3 palette
+    by default."""
     import matplotlib
 
+    if cmap is None:
+        from bokeh.palettes import Set3
+
+        cmap = Set3[12]
     linspace = np.linspace(start, end, n)
     cmap = matplotlib.colors.LinearSegmentedColormap.from_list(
         "customcmap", cmap
@@ -75,6 +176,26 @@ def palette(cmap=Set3[12], n=12, start=0, end=1):
     return hex_palette
 
 
+def group_nodes(nodes: np.ndarray, set_ids: np.ndarray) -> Dict:
+    """Groups nodes by their sample set.
+
+    Arguments:
+        nodes (np.ndarray): int32 node IDs.
+        set_ids (np.ndarray): The sample set ID of each node.
+
+    Returns:
+        dict: A dictionary where keys are sample set IDs, in order of first
+        appearance, and values are contiguous int32 arrays of the nodes of
+        that set, in their original order.
+    """
+    ids, first, inverse, counts = np.unique(
+        set_ids, return_index=True, return_inverse=True, return_counts=True
+    )
+    grouped = nodes[np.argsort(inverse, kind="stable")]
+    groups = np.split(grouped, np.cumsum(counts)[:-1])
+    return {int(ids[k]): groups[k] for k in np.argsort(first)}
+
+
 @dataclasses.dataclass
 class SampleSet:
     """A class to contain sample sets."""
@@ -87,7 +208,9 @@ class SampleSet:
     population: dataclasses.InitVar[tskit.Population | None] = None
     predefined: bool = False
 
-    colormap = config.COLORS
+    @property
+    def colormap(self):
+        return config.COLORS
 
     def __post_init__(self, population):
         if self.color is None:
@@ -98,52 +221,137 @@ class SampleSet:
             self.name = f"SampleSet-{self.sample_set_id}"
 
 
-@dataclasses.dataclass
-class Individual(tskit.Individual):
-    """A class to handle individuals."""
+def population_sample_sets(ts: tskit.TreeSequence) -> List[SampleSet]:
+    """Returns a predefined sample set for each population of the tree
+    sequence."""
+    return [
+        SampleSet(sample_set_id=pop.id, population=pop, predefined=True)
+        for pop in ts.populations()
+    ]
 
-    name_re = re.compile(r"^(name|Name|SM)$")
-    longitude_re = re.compile(r"^(longitude|Longitude|lng|long)$")
-    latitude_re = re.compile(r"^(latitude|Latitude|lat)$")
 
-    population: np.int32 = None
-    longitude: np.float64 = None
-    latitude: np.float64 = None
-    name: str = None
-    sample_set_id: np.int32 = None
-    selected: bool = True
-
-    def __init__(self, individual: tskit.Individual):
-        super().__init__(
-            id=individual.id,
-            flags=individual.flags,
-            location=individual.location,
-            metadata=individual.metadata,
-            nodes=individual.nodes,
-            parents=individual.parents,
+def _coordinates(values: np.ndarray, name: str) -> np.ndarray:
+    """Converts metadata values to float64, logging the individuals whose
+    value is not a number, which are set to NaN."""
+    coordinates = pd.to_numeric(values, errors="coerce").astype(np.float64)
+    invalid = np.flatnonzero(
+        np.isnan(coordinates) & pd.notna(values).astype(bool)
+    )
+    if len(invalid) > 0:
+        logger.warning(
+            f"Ignoring {len(invalid)} {name} values that are not numbers, "
+            f"e.g. {values[invalid[0]]!r} of individual {invalid[0]}"
         )
-        self.population = individual.population
-        self.sample_set_id = self.population
-        self.__post_init__()
+    return coordinates
 
-    def __post_init__(self) -> None:
-        self.longitude = parse_metadata(self, self.longitude_re)
-        self.latitude = parse_metadata(self, self.latitude_re)
-        self.name = parse_metadata(self, self.name_re)
 
-    @property
-    def samples(self):
-        """Return samples (nodes) associated with individual."""
-        return self.nodes
+@dataclasses.dataclass
+class Individuals:
+    """A columnar store of the individuals of a tree sequence.
+
+    Each attribute is a flat array with one entry per individual, except
+    for the nodes, which are stored in CSR form: the nodes of the
+    individual at position i are nodes[nodes_offset[i]:nodes_offset[i + 1]].
+
+    Attributes:
+        id (np.ndarray): int32 individual ids.
+        population (np.ndarray): int32 population of each individual.
+        sample_set_id (np.ndarray): int32 sample set of each individual,
+            initially its population.
+        longitude (np.ndarray): float64 longitude from the metadata, NaN
+            if missing.
+        latitude (np.ndarray): float64 latitude from the metadata, NaN if
+            missing.
+        name (np.ndarray): Object array of names from the metadata, None
+            if missing.
+        selected (np.ndarray): Boolean selection status.
+        nodes (np.ndarray): int32 nodes of all individuals.
+        nodes_offset (np.ndarray): int64 offsets into nodes.
+    """
 
-    def toggle(self) -> None:
-        """Toggle selection status."""
-        self.selected = not self.selected
+    name_re = re.compile(r"^(name|Name|SM)$")
+    longitude_re = re.compile(r"^(longitude|Longitude|lng|long)$")
+    latitude_re = re.compile(r"^(latitude|Latitude|lat)$")
 
-    def select(self) -> None:
-        """Select individual."""
-        self.selected = True
+    id: np.ndarray
+    population: np.ndarray
+    sample_set_id: np.ndarray
+    longitude: np.ndarray
+    latitude: np.ndarray
+    name: np.ndarray
+    selected: np.ndarray
+    nodes: np.ndarray
+    nodes_offset: np.ndarray
+
+    @classmethod
+    def from_tree_sequence(cls, ts: tskit.TreeSequence) -> "Individuals":
+        """Builds the store from the individuals of a tree sequence."""
+        num_individuals = ts.num_individuals
+        node_individual = ts.nodes_individual
+        order = np.argsort(node_individual, kind="stable")
+        order = order[node_individual[order] >= 0]
+        counts = np.bincount(node_individual[order], minlength=num_individuals)
+        nodes_offset = np.zeros(num_individuals + 1, dtype=np.int64)
+        np.cumsum(counts, out=nodes_offset[1:])
+        population = ts.individuals_population.astype(np.int32)
+        metadata = decode_metadata_columns(
+            ts.tables.individuals,
+            {
+                "name": cls.name_re,
+                "longitude": cls.longitude_re,
+                "latitude": cls.latitude_re,
+            },
+        )
+        longitude, latitude = (
+            _coordinates(metadata[key], key)
+            for key in ["longitude", "latitude"]
+        )
+        name = metadata["name"]
+        return cls(
+            id=np.arange(num_individuals, dtype=np.int32),
+            population=population,
+            sample_set_id=population.copy(),
+            longitude=longitude,
+            latitude=latitude,
+            name=name,
+            selected=np.ones(num_individuals, dtype=bool),
+            nodes=order.astype(np.int32),
+            nodes_offset=nodes_offset,
+        )
 
-    def deselect(self) -> None:
-        """Deselect individual."""
-        self.selected = False
+    def __len__(self) -> int:
+        return len(self.id)
+
+    def individual_nodes(self, i: int) -> np.ndarray:
+        """Returns the nodes of the individual at position i."""
+        return self.nodes[self.nodes_offset[i] : self.nodes_offset[i + 1]]
+
+    def node_rows(self) -> np.ndarray:
+        """Returns the position of the individual of each of the nodes."""
+        return np.repeat(np.arange(len(self)), np.diff(self.nodes_offset))
+
+    def sample_sets(self, only_selected: Optional[bool] = True) -> Dict:
+        """Returns a dictionary with a sample set id to samples array
+        mapping, as IndividualsTable.sample_sets does for a table that has
+        not been edited."""
+        rows = self.node_rows()
+        nodes, set_ids = self.nodes, self.sample_set_id[rows]
+        if only_selected:
+            keep = self.selected[rows]
+            nodes, set_ids = nodes[keep], set_ids[keep]
+        return group_nodes(nodes, set_ids)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Returns the per-individual columns as a DataFrame, without the
+        nodes."""
+        return pd.DataFrame(
+            {
+                "id": self.id,
+                "population": self.population,
+                "sample_set_id": self.sample_set_id,
+                "longitude": self.longitude,
+                "latitude": self.latitude,
+                "name": self.name,
+                "selected": self.selected,
+            }
+        )
@@ -0,0 +1,282 @@
+"""Precomputed results stored in the .tseda file.
+
+The individuals and sample sets tables are stored in columnar form in
+the `tseda/tables` group of the .tseda zarr zip store by
+`tseda preprocess`, tagged with the fingerprint of the tree sequence, so
+that the app can load them instead of rebuilding them from the tree
+sequence and its metadata on every launch.
+
+The haplotype GNN of every sample against the default sample sets (the
+populations of the tree sequence) can be computed once at preprocessing
+time and stored in the `tseda` group of the .tseda zarr zip store,
+alongside the tsbrowse data. The stored result is tagged with
+TSEDA_DATA_VERSION and with a digest of the reference sets, and is only
+served when both match.
+"""
+
+import dataclasses
+from typing import Dict, List, Optional, Tuple
+
+import daiquiri
+import numpy as np
+import pandas as pd
+import zarr
+
+from . import TSEDA_DATA_VERSION, cache
+from .gnn import (
+    make_windows,
+    reference_set_key,
+    reference_set_map,
+    windowed_genealogical_nearest_neighbours,
+)
+from .model import Individuals
+
+logger = daiquiri.getLogger("tseda")
+
+GROUP = "tseda"
+
+_ZARR_V3 = int(zarr.__version__.split(".")[0]) >= 3
+
+
+def _open_group(path, mode):
+    """Open the root group of the .tseda zip store in zarr v2 format."""
+    store = zarr.storage.ZipStore(str(path), mode=mode)
+    if _ZARR_V3:
+        return store, zarr.open_group(store=store, zarr_format=2, mode=mode)
+    return store, zarr.open_group(store=store, mode=mode)
+
+
+def _create_group(parent, name, attrs):
+    """Create a group with its attributes. Entries cannot be replaced in
+    a zip store, so the attributes must be written together with the
+    group rather than updated afterwards."""
+    if _ZARR_V3:
+        return parent.create_group(name, attributes=attrs)
+    group = parent.create_group(name)
+    group.attrs.put(attrs)
+    return group
+
+
+def _tseda_group(root):
+    """Returns the tseda group of the store, creating it if needed."""
+    if GROUP in root:
+        return root[GROUP]
+    return _create_group(root, GROUP, {"data_version": TSEDA_DATA_VERSION})
+
+
+def _check_version(root, name: str) -> bool:
+    """Returns True if the tseda group was written by a compatible
+    version, logging a warning otherwise."""
+    version = root[GROUP].attrs.get("data_version")
+    if version != TSEDA_DATA_VERSION:
+        logger.warning(
+            f"Ignoring precomputed {name} with data version {version}; "
+            f"expected {TSEDA_DATA_VERSION}, rerun tseda preprocess"
+        )
+        return False
+    return True
+
+
+INDIVIDUALS_COLUMNS = [
+    "id",
+    "population",
+    "longitude",
+    "latitude",
+    "nodes",
+    "nodes_offset",
+]
+
+
+def write_tables(
+    path, ts, individuals: Individuals, sample_sets: pd.DataFrame
+):
+    """Store the individuals and sample sets tables in the .tseda file at
+    path.
+
+    Arguments:
+        path: Path of the .tseda file.
+        ts (tskit.TreeSequence): The tree sequence stored in the file.
+        individuals (Individuals): The individuals, as built from the tree
+            sequence.
+        sample_sets (pd.DataFrame): The sample sets, with sample_set_id,
+            name, color and predefined columns.
+    """
+    names = individuals.name
+    store, root = _open_group(path, mode="a")
+    with store:
+        group = _create_group(
+            _tseda_group(root),
+            "tables",
+            {"fingerprint": cache.fingerprint(ts)},
+        )
+        inds = _create_group(group, "individuals", {})
+        for column in INDIVIDUALS_COLUMNS:
+            inds[column] = getattr(individuals, column)
+        inds["name"] = np.array(
+            ["" if x is None else str(x) for x in names], dtype=str
+        )
+        inds["name_missing"] = np.array([x is None for x in names], dtype=bool)
+        sets = _create_group(group, "sample_sets", {})
+        sets["sample_set_id"] = sample_sets["sample_set_id"].to_numpy(
+            dtype=np.int64
+        )
+        for column in ["name", "color"]:
+            sets[column] = sample_sets[column].to_numpy(dtype=str)
+        sets["predefined"] = sample_sets["predefined"].to_numpy(dtype=bool)
+    logger.info(f"Wrote individuals and sample sets tables to {path}")
+
+
+def load_tables(path, ts) -> Optional[Tuple[Individuals, pd.DataFrame]]:
+    """Load the individuals and sample sets tables from the .tseda file at
+    path.
+
+    Arguments:
+        path: Path of the .tseda file.
+        ts (tskit.TreeSequence): The tree sequence stored in the file.
+
+    Returns:
+        Tuple[Individuals, pd.DataFrame]: The individuals and the sample
+        sets, or None if the file has no stored tables, they were written
+        by an incompatible version or for another tree sequence.
+    """
+    store, root = _open_group(path, mode="r")
+    with store:
+        if GROUP not in root or "tables" not in root[GROUP]:
+            return None
+        if not _check_version(root, "tables"):
+            return None
+        group = root[f"{GROUP}/tables"]
+        if group.attrs.get("fingerprint") != cache.file_fingerprint(path, ts):
+            logger.warning(
+                f"Ignoring stored tables in {path} that were written for "
+                "another tree sequence"
+            )
+            return None
+        inds = {
+            column: group["individuals"][column][:]
+            for column in INDIVIDUALS_COLUMNS + ["name", "name_missing"]
+        }
+        sample_sets = pd.DataFrame(
+            {
+                column: group["sample_sets"][column][:]
+                for column in ["sample_set_id", "name", "color", "predefined"]
+            }
+        )
+    name = inds.pop("name").astype(object)
+    name[inds.pop("name_missing")] = None
+    individuals = Individuals(
+        sample_set_id=inds["population"].copy(),
+        name=name,
+        selected=np.ones(len(name), dtype=bool),
+        **inds,
+    )
+    for column in ["name", "color"]:
+        sample_sets[column] = sample_sets[column].astype(object)
+    return individuals, sample_sets
+
+
+@dataclasses.dataclass
+class PrecomputedGNN:
+    """Windowed GNN proportions of all samples against a fixed set of
+    reference sets.
+
+    Attributes:
+        values (np.ndarray): GNN proportions with shape (windows, samples,
+            sample sets).
+        windows (np.ndarray): Window breakpoints.
+        samples (np.ndarray): Sorted sample node ids of the focal axis.
+        key (str): Digest of the reference set assignment.
+    """
+
+    values: np.ndarray
+    windows: np.ndarray
+    samples: np.ndarray
+    key: str
+
+    def lookup(
+        self, focal: List[int], key: str, windows: Optional[List[float]]
+    ) -> Optional[np.ndarray]:
+        """Return the stored proportions of the focal nodes, or None if
+        the result was computed for other reference sets or windows.
+        """
+        if key != self.key or windows is None:
+            return None
+        windows = np.asarray(windows, dtype=np.float64)
+        if not np.array_equal(windows, self.windows):
+            return None
+        focal = np.asarray(focal)
+        index = np.searchsorted(self.samples, focal)
+        index[index == self.samples.shape[0]] = 0
+        if not np.array_equal(self.samples[index], focal):
+            return None
+        return self.values[:, index]
+
+
+def write_gnn(
+    path,
+    ts,
+    sample_sets: Dict,
+    window_size: int,
+    num_workers: int = 1,
+    dtype: str = "float32",
+):
+    """Compute the windowed GNN of all samples against the sample sets
+    and store it in the .tseda file at path.
+
+    Arguments:
+        path: Path of the .tseda file.
+        ts (tskit.TreeSequence): The tree sequence stored in the file.
+        sample_sets (Dict): Mapping from sample set id to samples, as
+            returned by `IndividualsTable.sample_sets()`.
+        window_size (int): The size of the windows.
+        num_workers (int): Number of worker processes.
+        dtype (str): Floating point type of the stored proportions.
+    """
+    windows = make_windows(window_size, ts.sequence_length)
+    samples = np.sort(
+        np.concatenate([np.asarray(x) for x in sample_sets.values()])
+    ).astype(np.int32)
+    logger.info(
+        f"Computing GNN of {len(samples)} samples in {len(windows) - 1} "
+        "windows"
+    )
+    values = windowed_genealogical_nearest_neighbours(
+        ts,
+        samples,
+        sample_sets,
+        windows=windows,
+        num_workers=num_workers,
+        dtype=dtype,
+    )
+    key = reference_set_key(reference_set_map(ts, sample_sets))
+    store, root = _open_group(path, mode="a")
+    with store:
+        group = _create_group(
+            _tseda_group(root), "gnn", {"reference_set_key": key}
+        )
+        group["values"] = values
+        group["windows"] = windows
+        group["samples"] = samples
+    logger.info(f"Wrote precomputed GNN to {path}")
+
+
+def load_gnn(path) -> Optional[PrecomputedGNN]:
+    """Load the precomputed GNN from the .tseda file at path.
+
+    Returns:
+        PrecomputedGNN: The stored result, or None if the file has no
+        precomputed GNN or it was written by an incompatible version.
+    """
+    store, root = _open_group(path, mode="r")
+    with store:
+        if GROUP not in root or "gnn" not in root[GROUP]:
+            return None
+        group = root[f"{GROUP}/gnn"]
+        if not _check_version(root, "GNN"):
+            return None
+        return PrecomputedGNN(
+            values=group["values"][:],
+            windows=group["windows"][:],
+            samples=group["samples"][:],
+            key=group.attrs["reference_set_key"],
+        )
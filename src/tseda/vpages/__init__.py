@@ -1,20 +1,50 @@
-from . import (
-    ignn,
-    individuals,
-    overview,
-    stats,
-    structure,
-    trees,
-)
-
-PAGES = [
-    overview.OverviewPage,
-    individuals.IndividualsPage,
-    structure.StructurePage,
-    ignn.IGNNPage,
-    stats.StatsPage,
-    trees.TreesPage,
+"""The pages of the tseda app.
+
+Each page module is imported on first use, by `load_page` or through the
+PAGES, PAGES_MAP and PAGES_BY_TITLE attributes, so that showing a page
+only imports the plotting dependencies of that page.
+"""
+
+import importlib
+
+# Title, module and class name of each page, in display order
+_PAGES = [
+    ("Overview", "overview", "OverviewPage"),
+    ("Individuals & sets", "individuals", "IndividualsPage"),
+    ("Structure", "structure", "StructurePage"),
+    ("iGNN", "ignn", "IGNNPage"),
+    ("Statistics", "stats", "StatsPage"),
+    ("Trees", "trees", "TreesPage"),
 ]
 
-PAGES_MAP = {page.key: page for page in PAGES}
-PAGES_BY_TITLE = {page.title: page for page in PAGES}
+TITLES = [title for title, _, _ in _PAGES]
+_MODULES = {title: (module, name) for title, module, name in _PAGES}
+
+
+def load_page(title):
+    """Returns the page class with the given title, importing its module.
+
+    Arguments:
+        title (str): The title of the page.
+
+    Returns:
+        type: The page class.
+
+    Raises:
+        KeyError: If there is no page with that title.
+    """
+    module, name = _MODULES[title]
+    return getattr(importlib.import_module(f".{module}", __name__), name)
+
+
+def __getattr__(name):
+    if name == "PAGES":
+        value = [load_page(title) for title in TITLES]
+    elif name == "PAGES_MAP":
+        value = {page.key: page for page in __getattr__("PAGES")}
+    elif name == "PAGES_BY_TITLE":
+        value = {page.title: page for page in __getattr__("PAGES")}
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
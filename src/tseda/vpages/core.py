@@ -4,12 +4,12 @@ Provides View helper class for panel plots and helper functions common to
 pages.
 """
 
-import numpy as np
 import panel as pn
 import param
 from panel.viewable import Viewer
 
 from tseda.datastore import DataStore
+from tseda.gnn import make_time_windows, make_windows  # noqa: F401
 
 
 class View(Viewer):
@@ -24,14 +24,6 @@ class View(Viewer):
         return pn.Column(pn.pane.Markdown(f"# {self.title}"))
 
 
-def make_windows(window_size, sequence_length):
-    """Make windows for statistics."""
-    num_windows = int(sequence_length / window_size)
-    windows = np.linspace(0, sequence_length, num_windows + 1)
-    windows[-1] = sequence_length
-    return windows
-
-
 # NB: currently unused
 def make_sample_sets(inds):
     sample_sets = {}
@@ -15,10 +15,12 @@ TODO:
 - linked brushing between the map and the GNN plot
 """
 
-from typing import Any, Union
+import asyncio
+from typing import Any, Dict, Union
 
 import holoviews as hv
 import hvplot.pandas  # noqa
+import numpy as np
 import pandas as pd
 import panel as pn
 import param
@@ -29,9 +31,10 @@ from bokeh.models import (
 )
 from bokeh.plotting import figure
 
-from tseda import config
+from tseda import api, config
+from tseda.gnn import HaplotypeGNN
 
-from .core import View, make_windows
+from .core import View, make_time_windows, make_windows
 from .map import GeoMap
 
 hv.extension("bokeh")
@@ -47,17 +50,20 @@ class GNNHaplotype(View):
         Defaults to None.
         window_size (int): The size of the window to use for visualization.
         Defaults to 10000. Must be greater than 0.
+        num_time_windows (int): The number of log-spaced time windows that
+        the GNN proportions are stratified by. Defaults to 1.
         warning_pane (pn.Alert): a warning panel that is displayed if no
         samples are selected.
         individual_id_warning (pn.Alert): a warning panel that is displayed
         if an invalid individual ID is entered.
 
     Methods:
-        plot(haplotype=0): makes the haplotype plot.
-        plot_haplotype0(): calls the plot function for haplotype 0.
-        plot_haplotype1(): calls the plot function for haplotype 1.
-        __panel__() -> pn.Column: Defines the layout of the main content area
-        or sends out a warning message if the user input isn't valid.
+        plot(buffer): makes the haplotype plot from a stream of windows.
+        haplotype_data(data, haplotype, time_window=0): selects the windows
+        of a haplotype and time window.
+        __panel__(): Yields the layout of the main content area, streaming
+        windows into the plots as they are computed, or sends out a warning
+        message if the user input isn't valid.
         sidebar() -> pn.Card: Defines the layout of the sidebar content area.
     """
 
@@ -70,6 +76,12 @@ class GNNHaplotype(View):
         default=10000, bounds=(1, None), doc="Size of window"
     )
 
+    num_time_windows = param.Integer(
+        default=1,
+        bounds=(1, None),
+        doc="Number of log-spaced time windows",
+    )
+
     warning_pane = pn.pane.Alert(
         """Please select at least 1 sample to visualize these graphs. 
         Sample selection is done on the Individuals page.""",
@@ -83,116 +95,91 @@ class GNNHaplotype(View):
         visible=False,
     )
 
-    def plot(
-        self, haplotype: int = 0
-    ) -> Union[hv.core.overlay.NdOverlay, pn.pane.Markdown]:
-        """Creates the GNN Haplotype plot.
+    def plot(self, buffer: hv.streams.Buffer) -> hv.DynamicMap:
+        """Creates the GNN Haplotype plot for a stream of windows.
 
         Args:
-            haplotype (int): Can be either 0 or 1 and will be used to plot
-            haplotype 0 or haplotype 1.
-
+            buffer (hv.streams.Buffer): The buffer that GNN proportions of
+            one haplotype are streamed into, as a dict with a "start" column
+            and one column per sample set.
 
         Returns:
-            pn.pane.Markdown: A message directed to the user to enter a valid
-            correct sample ID.
-            pn.pane.Markdown: A placeholder pane in place to show the
-            warningmessage when a incorrect sample ID is entered.
-            hv.core.overlay.NdOverlay: A GNN Haplotype plot.
+            hv.DynamicMap: A GNN Haplotype plot that is redrawn as windows
+            are streamed into the buffer.
         """
-
-        if self.individual_id is None:
-            return pn.pane.Markdown("Enter a sample ID")
-        if self.window_size is not None:
-            windows = make_windows(
-                self.window_size, self.datastore.tsm.ts.sequence_length
-            )
-        else:
-            windows = None
-        data = self.datastore.haplotype_gnn(
-            self.individual_id, windows=windows
-        )
-        df = data.loc[data.index.get_level_values("haplotype") == haplotype]
-        df = df.droplevel(["haplotype", "end"])
-        if list(df.columns) == []:
-            self.warning_pane.visible = True
-            return pn.pane.Markdown("")
-        else:
-            self.warning_pane.visible = False
-        populations = [str(x) for x in df.columns]
+        populations = [x for x in buffer.data if x != "start"]
         colormap = [
             self.datastore.sample_sets_table.color_by_name[x]
-            for x in df.columns
+            for x in populations
         ]
-        df.reset_index(inplace=True)
-        # TODO: hvplot ignores tools/default_tools parameter
-        p = df.hvplot.area(
-            x="start",
-            y=populations,
-            color=colormap,
-            legend="right",
-            sizing_mode="stretch_width",
-            fill_alpha=0.5,
-            min_height=300,
-            responsive=True,
-            tools=[
-                "pan",
-                "xpan",
-                "xwheel_zoom",
-                "box_select",
-                "save",
-                "reset",
-            ],
-        )
-        p.opts(
-            default_tools=[
-                "pan",
-                "xpan",
-                "xwheel_zoom",
-                "box_select",
-                "save",
-                "reset",
-            ],
-            active_tools=[
-                "pan",
-                "xpan",
-                "xwheel_zoom",
-                "box_select",
-                "save",
-                "reset",
-            ],
-            tools=["xpan", "xwheel_zoom", "box_select", "save", "reset"],
-            ylabel="Proportion",
-        )
-        return p
 
-    def plot_haplotype0(
-        self,
-    ) -> Union[hv.core.overlay.NdOverlay, pn.pane.Markdown]:
-        """Creates the GNN Haplotype plot for haplotype 0.
+        def area(data):
+            # TODO: hvplot ignores tools/default_tools parameter
+            p = pd.DataFrame(data, copy=False).hvplot.area(
+                x="start",
+                y=populations,
+                color=colormap,
+                legend="right",
+                sizing_mode="stretch_width",
+                fill_alpha=0.5,
+                min_height=300,
+                responsive=True,
+                tools=[
+                    "pan",
+                    "xpan",
+                    "xwheel_zoom",
+                    "box_select",
+                    "save",
+                    "reset",
+                ],
+            )
+            p.opts(
+                default_tools=[
+                    "pan",
+                    "xpan",
+                    "xwheel_zoom",
+                    "box_select",
+                    "save",
+                    "reset",
+                ],
+                active_tools=[
+                    "pan",
+                    "xpan",
+                    "xwheel_zoom",
+                    "box_select",
+                    "save",
+                    "reset",
+                ],
+                tools=["xpan", "xwheel_zoom", "box_select", "save", "reset"],
+                ylabel="Proportion",
+            )
+            return p
+
+        return hv.DynamicMap(area, streams=[buffer])
 
-        Returns:
-            pn.pane.Markdown: A message directed to the user to enter a valid
-            correct sample ID.
-            pn.pane.Markdown: A placeholder pane in place to show the
-            warningmessage when a incorrect sample ID is entered.
-            hv.core.overlay.NdOverlay: A GNN Haplotype plot for haplotype 0.
-        """
-        return self.plot(0)
+    @staticmethod
+    def haplotype_data(
+        data: HaplotypeGNN, haplotype: int, time_window: int = 0
+    ) -> Dict[str, np.ndarray]:
+        """Selects the windows of one haplotype from the output of
+        `datastore.iter_haplotype_gnn`.
 
-    def plot_haplotype1(
-        self,
-    ) -> Union[hv.core.overlay.NdOverlay, pn.pane.Markdown]:
-        """Creates the GNN Haplotype plot for haplotype 1.
+        Args:
+            data (HaplotypeGNN): GNN proportions of the haplotypes.
+            haplotype (int): Can be either 0 or 1.
+            time_window (int): The index of the time window to select.
 
         Returns:
-            pn.pane.Markdown: A message directed to the user to enter a valid
-            correct sample ID.
-            pn.pane.Markdown: A placeholder pane in place to show the
-            warningmessage when a incorrect sample ID is entered.
-            hv.core.overlay.NdOverlay: A GNN Haplotype plot for haplotype 1.
+            Dict[str, np.ndarray]: The window starts in the "start" column
+            and the GNN proportions of each sample set, as views into
+            data where possible.
         """
-        return self.plot(1)
+        columns = data.columns(haplotype, time_window)
+        # Half precision columns are not supported by the plot backend
+        return {
+            key: np.asarray(x, dtype=np.promote_types(x.dtype, np.float32))
+            for key, x in columns.items()
+        }
 
     def check_inputs(self, inds: pd.core.frame.DataFrame) -> tuple:
         """Checks the inputs to the GNN Haplotype plot.
@@ -230,7 +217,9 @@ class GNNHaplotype(View):
                 return (None, info_column)
             else:
                 self.individual_id_warning.visible = False
-                nodes = inds.loc[self.individual_id].nodes
+                nodes = self.datastore.individuals_table.nodes(
+                    self.individual_id
+                )
                 info_column = pn.Column(pn.pane.Markdown(""))
                 return (nodes, info_column)
         except KeyError:
@@ -241,33 +230,93 @@ class GNNHaplotype(View):
             self.individual_id_warning.visible = True
             return (None, info_column)
 
-    @pn.depends("individual_id", "window_size")
-    def __panel__(self, **params) -> pn.Column:
+    @pn.depends("individual_id", "window_size", "num_time_windows")
+    async def __panel__(self, **params):
         """Returns the main content for the GNN Haplotype plot which is
         retrieved from the `datastore.tsm.ts` attribute.
 
-        Returns:
+        The plots are shown as soon as the first chunk of windows is
+        finished, and the remaining windows are streamed into them as
+        the tree sequence is traversed. Completed layouts are kept in the
+        plot cache and shown at once when the same settings are selected
+        again.
+
+        Yields:
             pn.Column: The layout for the main content area of the GNN
             Haplotype plot or a warning message if the input isn't validated.
         """
 
         inds = self.datastore.individuals_table.data.rx.value
-        nodes = self.check_inputs(inds)
-        if nodes[0] is not None:
-            return pn.Column(
-                pn.pane.HTML(
-                    "<h2 style='margin: 0;'>"
-                    f"- Individual id {self.individual_id}</h2>",
-                    sizing_mode="stretch_width",
-                ),
-                self.warning_pane,
-                pn.pane.Markdown(f"### Haplotype 0 (sample id {nodes[0][0]})"),
-                self.plot_haplotype0,
-                pn.pane.Markdown(f"### Haplotype 1 (sample id {nodes[0][1]})"),
-                self.plot_haplotype0,
+        nodes, info_column = self.check_inputs(inds)
+        if nodes is None:
+            yield info_column
+            return
+        header = pn.pane.HTML(
+            "<h2 style='margin: 0;'>"
+            f"- Individual id {self.individual_id}</h2>",
+            sizing_mode="stretch_width",
+        )
+        if len(self.datastore.individuals_table.sample_sets()) == 0:
+            self.warning_pane.visible = True
+            yield pn.Column(header, self.warning_pane)
+            return
+        self.warning_pane.visible = False
+        key = self.datastore.plot_key(
+            "gnn_haplotype",
+            individual_id=self.individual_id,
+            window_size=self.window_size,
+            num_time_windows=self.num_time_windows,
+        )
+        layout = self.datastore.plot_cache.get(key)
+        if layout is not None:
+            yield layout
+            return
+        ts = self.datastore.tsm.ts
+        windows = make_windows(self.window_size, ts.sequence_length)
+        num_windows = len(windows) - 1
+        time_windows = make_time_windows(self.num_time_windows, ts)
+        num_time_windows = 1 if time_windows is None else len(time_windows) - 1
+        chunks = self.datastore.iter_haplotype_gnn(
+            self.individual_id, windows, time_windows=time_windows
+        )
+        data = await asyncio.to_thread(next, chunks)
+        done = len(data.start)
+        progress = pn.indicators.Progress(
+            value=done, max=num_windows, visible=done < num_windows
+        )
+        buffers = {
+            (i, t): hv.streams.Buffer(
+                self.haplotype_data(data, i, t),
+                length=num_windows,
+                index=False,
             )
-        else:
-            return nodes[1]
+            for i in range(len(nodes))
+            for t in range(num_time_windows)
+        }
+        layout = pn.Column(header, progress)
+        for i, node in enumerate(nodes):
+            layout.append(
+                pn.pane.Markdown(f"### Haplotype {i} (sample id {node})")
+            )
+            for t in range(num_time_windows):
+                if time_windows is not None:
+                    layout.append(
+                        pn.pane.Markdown(
+                            f"#### Time window {time_windows[t]:.4g} - "
+                            f"{time_windows[t + 1]:.4g}"
+                        )
+                    )
+                layout.append(self.plot(buffers[i, t]))
+        yield layout
+        while (
+            data := await asyncio.to_thread(next, chunks, None)
+        ) is not None:
+            for (i, t), buffer in buffers.items():
+                buffer.send(self.haplotype_data(data, i, t))
+            done += len(data.start)
+            progress.value = done
+        progress.visible = False
+        self.datastore.plot_cache.set(key, layout)
 
     def sidebar(self) -> pn.Card:
         """Returns the content of the sidbar options for the GNN Haplotype
@@ -280,6 +329,7 @@ class GNNHaplotype(View):
         return pn.Card(
             self.param.individual_id,
             self.param.window_size,
+            self.param.num_time_windows,
             self.individual_id_warning,
             collapsed=False,
             title="GNN haplotype options",
@@ -303,7 +353,9 @@ class VBar(View):
 
     Methods:
         gnn() -> pd.DataFrame: gets the data for the GNN VBar plot.
-        __panel__() -> pn.panel: creates the panel containing the GNN VBar
+        __panel__() -> pn.panel: returns the cached GNN VBar plot for the
+        current settings, rendering it with plot() on a cache miss.
+        plot() -> pn.panel: creates the panel containing the GNN VBar
         plot.
         sidebar() -> pn.Card: defines the layout of the sidebar content area
         for the VBar options.
@@ -337,33 +389,35 @@ class VBar(View):
             pd.DataFrame: a dataframe containing all the information for the
             GNN VBar plot.
         """
-        inds = self.datastore.individuals_table.data.rx.value
         sample_sets = self.datastore.individuals_table.sample_sets()
-        samples = [
-            sample for sublist in sample_sets.values() for sample in sublist
-        ]
+        samples = np.concatenate(list(sample_sets.values()))
         self.param.sorting.objects = [""] + list(
             self.datastore.sample_sets_table.names.values()
         )
-        gnn = self.datastore.tsm.ts.genealogical_nearest_neighbours(
-            samples, sample_sets=list(sample_sets.values())
+        gnn = self.datastore.genealogical_nearest_neighbours(
+            samples, sample_sets
         )
-        df = pd.DataFrame(
-            gnn,
-            columns=[i for i in sample_sets],
-        )
-        samples2ind = [
-            self.datastore.individuals_table.sample2ind[i] for i in samples
-        ]
-        df["id"] = samples2ind
-        df["sample_id"] = df.index
-        df["sample_set_id"] = [inds.loc[i].sample_set_id for i in samples2ind]
-        df.set_index(["sample_set_id", "sample_id", "id"], inplace=True)
-        return df
+        return api.gnn_table(self.datastore.tsm.ts, sample_sets, gnn)
 
     @pn.depends("sorting", "sort_order")
     def __panel__(self) -> Union[pn.pane.plot.Bokeh, pn.pane.Alert, Any]:
         # TODO: Does not accept pn.panel so Any is included as quickfix
+        """Returns the GNN VBar plot, reusing the plot rendered for the
+        same settings and data if it is still cached.
+
+        Returns:
+            pn.pane.Alert: a warning pane telling the user that it needs to
+            select a sample.
+            pn.pane.plot.Bokeh: a panel with the GNN VBar plot.
+        """
+        return self.datastore.cached_plot(
+            "gnn_vbar",
+            self.plot,
+            sorting=self.sorting,
+            sort_order=self.sort_order,
+        )
+
+    def plot(self) -> Union[pn.pane.plot.Bokeh, pn.pane.Alert, Any]:
         """Returns the main content of the plot which is retrieved from the
         `datastore.tsm.ts` attribute by the gnn() function.
 
@@ -374,23 +428,25 @@ class VBar(View):
         """
         sample_sets = self.datastore.individuals_table.sample_sets()
         if len(list(sample_sets.keys())) < 1:
-            print(type(self.warning_pane))
             return self.warning_pane
         df = self.gnn()
-        sample_sets = self.datastore.sample_sets_table.data.rx.value
+        sample_sets_table = self.datastore.sample_sets_table
         inds = self.datastore.individuals_table.data.rx.value
-        color = [sample_sets.color[i] for i in df.columns]
-        groups = [sample_sets.name[i] for i in df.columns]
+        color = sample_sets_table.colors_of(df.columns).tolist()
+        groups = sample_sets_table.names_of(df.columns).tolist()
         levels = df.index.names
         factors = list(
-            tuple([self.datastore.sample_sets_table.names[x[0]], str(x[1])])
-            for x in df.index
+            zip(
+                sample_sets_table.names_of(
+                    df.index.get_level_values("sample_set_id")
+                ),
+                df.index.get_level_values("sample_id").astype(str),
+            )
         )
         df.columns = groups
         df.reset_index(inplace=True)
         df["x"] = factors
-        samples2ind = self.datastore.individuals_table.sample2ind
-        df["name"] = [inds.loc[samples2ind[x]].name for x in df.index]
+        df["name"] = inds["name"].to_numpy()[inds.index.get_indexer(df["id"])]
 
         hover = HoverTool()
         hover.tooltips = list([("name", "@name")])
@@ -18,7 +18,7 @@ import panel as pn
 import param
 from holoviews.plotting.util import process_cmap
 
-from tseda import config
+from tseda import api, config
 
 from .core import View, make_windows
 
@@ -63,6 +63,9 @@ class OnewayStats(View):
     tooltip() -> pn.widgets.TooltipIcon:
             Returns a tooltip for the plot.
     __panel__() -> pn.Column:
+        Returns the cached one-way statistics plot for the current
+        settings, rendering it with plot() on a cache miss.
+    plot() -> pn.Column:
         Generates the view containing the one-way statistics plot.
         Raises a warning if no sample sets are selected.
     sidebar() -> pn.Card:
@@ -76,7 +79,7 @@ class OnewayStats(View):
         Branch mode is only available for calibrated data.""",
     )
     statistic = param.Selector(
-        objects=["Tajimas_D", "diversity"],
+        objects=config.ONEWAY_STATISTICS,
         default="diversity",
         doc="Select statistic. Names correspond to tskit method names.",
     )
@@ -112,7 +115,22 @@ class OnewayStats(View):
 
     @param.depends("mode", "statistic", "window_size")
     def __panel__(self) -> Union[pn.Column, pn.pane.Alert]:
-        """Returns the plot.
+        """Returns the plot, reusing the plot rendered for the same
+        settings and data if it is still cached.
+
+        Returns:
+            pn.Column: The layout for the plot.
+        """
+        return self.datastore.cached_plot(
+            "oneway_stats",
+            self.plot,
+            mode=self.mode,
+            statistic=self.statistic,
+            window_size=self.window_size,
+        )
+
+    def plot(self) -> Union[pn.Column, pn.pane.Alert]:
+        """Renders the plot.
 
         Returns:
             pn.Column: The layout for the plot.
@@ -128,24 +146,30 @@ class OnewayStats(View):
         sample_sets_individuals = list(sample_sets_dictionary.values())
 
         if self.statistic == "Tajimas_D":
-            data = self.datastore.tsm.ts.Tajimas_D(
-                sample_sets_individuals, windows=windows, mode=self.mode
-            )
             fig_text = "**Oneway Tajimas_D plot** - Lorem Ipsum"
         elif self.statistic == "diversity":
-            data = self.datastore.tsm.ts.diversity(
-                sample_sets_individuals, windows=windows, mode=self.mode
-            )
             fig_text = "**Oneway Diversity plot** - Lorem Ipsum"
         else:
             raise ValueError("Invalid statistic")
+        ts = self.datastore.tsm.ts
+        data = self.datastore.cached(
+            "oneway_stats",
+            lambda: api.oneway_statistic(
+                ts,
+                self.statistic,
+                sample_sets_dictionary,
+                windows=windows,
+                mode=self.mode,
+            ),
+            statistic=self.statistic,
+            mode=self.mode,
+            windows=windows,
+            sample_sets=sample_sets_individuals,
+        )
 
         data = pd.DataFrame(
             data,
-            columns=[
-                self.datastore.sample_sets_table.names[i]
-                for i in sample_sets_ids
-            ],
+            columns=self.datastore.sample_sets_table.names_of(sample_sets_ids),
         )
         position = hv.Dimension(
             "position",
@@ -219,6 +243,9 @@ class MultiwayStats(View):
         Updates the options for the comparisons multi-choice widget based
         on available sample sets.
     __panel__() -> pn.Column:
+        Returns the cached multiway statistics plot for the current
+        settings, rendering it with plot() on a cache miss.
+    plot() -> pn.Column:
         Generates the view containing the multiway statistics plot.
         Raises a warning if no sample sets are selected.
     sidebar() -> pn.Card:
@@ -232,7 +259,7 @@ class MultiwayStats(View):
         Branch mode is only available for calibrated data.""",
     )
     statistic = param.Selector(
-        objects=["Fst", "divergence"],
+        objects=config.MULTIWAY_STATISTICS,
         default="Fst",
         doc="Select statistic. Names correspond to tskit method names.",
     )
@@ -299,13 +326,29 @@ class MultiwayStats(View):
         "mode", "statistic", "window_size", "colormap", "comparisons.value"
     )
     def __panel__(self):
-        """Returns the multiway plot.
+        """Returns the multiway plot, reusing the plot rendered for the
+        same settings and data if it is still cached.
 
         Returns:
             pn.Column: The layout for the main content area.
         """
         self.set_multichoice_options()
+        return self.datastore.cached_plot(
+            "multiway_stats",
+            self.plot,
+            mode=self.mode,
+            statistic=self.statistic,
+            window_size=self.window_size,
+            colormap=self.colormap,
+            comparisons=list(self.comparisons.value),
+        )
 
+    def plot(self):
+        """Renders the multiway plot.
+
+        Returns:
+            pn.Column: The layout for the main content area.
+        """
         data = None
         tsm = self.datastore.tsm
         windows = []
@@ -328,47 +371,49 @@ class MultiwayStats(View):
             key: all_sample_sets[key] for key in sorted(all_sample_sets)
         }
         sample_sets_individuals = list(all_sample_sets_sorted.values())
-        comparisons_indexes = [
-            (
-                list(all_sample_sets_sorted.keys()).index(x),
-                list(all_sample_sets_sorted.keys()).index(y),
-            )
+        comparisons = [
+            (x, y)
             for x, y in comparisons
             if x in all_sample_sets_sorted and y in all_sample_sets_sorted
         ]
+        ids = list(all_sample_sets_sorted.keys())
+        comparisons_indexes = [
+            (ids.index(x), ids.index(y)) for x, y in comparisons
+        ]
         if comparisons_indexes == []:
             return pn.pane.Markdown(
                 "**Select which sample sets to compare to see this plot.**"
             )
         if self.statistic == "Fst":
-            data = tsm.ts.Fst(
-                sample_sets_individuals,
-                windows=windows,
-                indexes=comparisons_indexes,
-                mode=self.mode,
-            )
             fig_text = "**Multiway Fst plot** - Lorem Ipsum"
         elif self.statistic == "divergence":
-            data = tsm.ts.divergence(
-                sample_sets_individuals,
-                windows=windows,
-                indexes=comparisons_indexes,
-                mode=self.mode,
-            )
             fig_text = "**Multiway divergence plot** - Lorem Ipsum"
         else:
             raise ValueError("Invalid statistic")
+        data = self.datastore.cached(
+            "multiway_stats",
+            lambda: api.multiway_statistic(
+                tsm.ts,
+                self.statistic,
+                all_sample_sets_sorted,
+                comparisons_indexes,
+                windows=windows,
+                mode=self.mode,
+            ),
+            statistic=self.statistic,
+            mode=self.mode,
+            windows=windows,
+            sample_sets=sample_sets_individuals,
+            indexes=comparisons_indexes,
+        )
         sample_sets_table = self.datastore.sample_sets_table
         data = pd.DataFrame(
             data,
             columns=[
-                "-".join(
-                    [
-                        sample_sets_table.loc(i)["name"],
-                        sample_sets_table.loc(j)["name"],
-                    ]
+                "-".join(names)
+                for names in sample_sets_table.names_of(comparisons).reshape(
+                    -1, 2
                 )
-                for i, j in comparisons_indexes
             ],
         )
         position = hv.Dimension(
@@ -8,7 +8,6 @@ TODO:
 - add parameter to subset sample sets of interest
 """
 
-import itertools
 from typing import Union
 
 import colorcet as cc
@@ -19,6 +18,8 @@ import pandas as pd
 import panel as pn
 import param
 
+from tseda import api
+
 from .core import View
 
 hv.extension("bokeh")
@@ -51,31 +52,20 @@ class GNN(View):
             plot with a descriptive markdown element or a warning message.
         """
         sample_sets = self.datastore.individuals_table.sample_sets()
-        samples = [
-            sample for sublist in sample_sets.values() for sample in sublist
-        ]
         if len(sample_sets) <= 1:
             return self.warning_pane
         else:
-            sstable = self.datastore.sample_sets_table.data.rx.value
-            inds = self.datastore.individuals_table.data.rx.value
-            samples2ind = [
-                self.datastore.individuals_table.sample2ind[i] for i in samples
-            ]
-
-            ts = self.datastore.tsm.ts
-            data = ts.genealogical_nearest_neighbours(
-                samples, sample_sets=list(sample_sets.values())
+            sstable = self.datastore.sample_sets_table
+            samples = np.concatenate(list(sample_sets.values()))
+            data = self.datastore.genealogical_nearest_neighbours(
+                samples, sample_sets
             )
-            df = pd.DataFrame(
-                data,
-                columns=[sstable.loc[i]["name"] for i in sample_sets],
+            mean_gnn = api.mean_gnn(self.datastore.tsm.ts, sample_sets, data)
+            mean_gnn.columns = sstable.names_of(mean_gnn.columns)
+            mean_gnn.index = pd.Index(
+                sstable.names_of(mean_gnn.index), name="focal_population"
             )
-            df["focal_population"] = [
-                sstable.loc[inds.loc[i].sample_set_id]["name"]
-                for i in samples2ind
-            ]
-            mean_gnn = df.groupby("focal_population").mean()
+            mean_gnn = mean_gnn.sort_index()
             # Z-score normalization here!
             return pn.Column(
                 mean_gnn.hvplot.heatmap(
@@ -121,15 +111,15 @@ class Fst(View):
         if len(sample_sets) <= 1:
             return self.warning_pane
         else:
-            sstable = self.datastore.sample_sets_table.data.rx.value
+            sstable = self.datastore.sample_sets_table
             ts = self.datastore.tsm.ts
-            k = len(sample_sets)
-            i = list(itertools.product(list(range(k)), list(range(k))))
-            groups = [sstable.loc[i]["name"] for i in sample_sets]
-            fst = ts.Fst(list(sample_sets.values()), indexes=i)
-            df = pd.DataFrame(
-                np.reshape(fst, newshape=(k, k)), columns=groups, index=groups
+            groups = list(sstable.names_of(list(sample_sets)))
+            fst = self.datastore.cached(
+                "pairwise_fst",
+                lambda: api.pairwise_fst(ts, sample_sets),
+                sample_sets=list(sample_sets.values()),
             )
+            df = pd.DataFrame(fst, columns=groups, index=groups)
             return pn.Column(
                 df.hvplot.heatmap(cmap=cc.bgy, height=300, responsive=True),
                 pn.pane.Markdown(
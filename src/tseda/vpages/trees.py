@@ -86,6 +86,9 @@ class Tree(View):
         position.
         update_position(self): Updates the position based on the slider value.
         plot_tree(self, tree, omit_sites, y_ticks, node_labels,
+        additional_options): Returns the cached plot of a single tree,
+        rendering it with render_tree on a cache miss.
+        render_tree(self, tree, omit_sites, y_ticks, node_labels,
         additional_options): Generates
         the HTML plot for a single tree with specified options.
         get_all_trees(self, trees): Constructs a panel layout displaying all
@@ -203,29 +206,26 @@ class Tree(View):
         Returns:
             str: A string with the css styling.
         """
-        styles = []
         sample_sets = self.datastore.sample_sets_table.data.rx.value
         individuals = self.datastore.individuals_table.data.rx.value
-        sample2ind = self.datastore.individuals_table.sample2ind
-        selected_sample_sets = self.datastore.individuals_table.sample_sets()
-        selected_samples = [
-            int(i)
-            for sublist in list(selected_sample_sets.values())
-            for i in sublist
+        samples = self.datastore.individuals_table.samples()
+        rows = individuals.index.get_indexer(
+            self.datastore.individuals_table.sample2ind[samples]
+        )
+        selected = individuals["selected"].to_numpy(dtype=bool)[rows]
+        ssids = individuals["sample_set_id"].to_numpy()[rows]
+        colors = sample_sets["color"].reindex(ssids).to_numpy()
+        styles = [
+            f".node.n{n} > .sym "
+            + "{"
+            + (
+                f"fill: {color}; stroke: black; stroke-width: 2px;"
+                if is_selected
+                else f"fill: {color} "
+            )
+            + "}"
+            for n, color, is_selected in zip(samples, colors, selected)
         ]
-        for n in self.datastore.individuals_table.samples():
-            ssid = individuals.loc[sample2ind[n]].sample_set_id
-            ss = sample_sets.loc[ssid]
-            if n in selected_samples:
-                s = (
-                    f".node.n{n} > .sym "
-                    + "{"
-                    + f"fill: {ss.color}; stroke: black; stroke-width: 2px;"
-                    + "}"
-                )
-            else:
-                s = f".node.n{n} > .sym " + "{" + f"fill: {ss.color} " + "}"
-            styles.append(s)
         css_string = " ".join(styles)
         return css_string
 
@@ -309,7 +309,8 @@ class Tree(View):
         node_labels: dict,
         additional_options: dict,
     ) -> Union[pn.Accordion, pn.Column]:
-        """Plots a single tree.
+        """Plots a single tree, reusing the plot rendered for the same tree,
+        options and data if it is still cached.
 
         Arguments:
             tree (tskit.trees.Tree): The tree to be plotted.
@@ -324,8 +325,53 @@ class Tree(View):
             Union[pn.Accordion, pn.Column]: A panel element containing the
             tree.
         """
+        plot, warning = self.datastore.cached_plot(
+            "tree",
+            lambda: self.render_tree(
+                tree, omit_sites, y_ticks, node_labels, additional_options
+            ),
+            tree_index=tree.index,
+            num_trees=int(self.num_trees.value),
+            size=(self.width, self.height),
+            symbol_size=self.symbol_size,
+            y_axis=self.y_axis.value,
+            x_axis=self.x_axis.value,
+            omit_sites=omit_sites,
+            node_labels=node_labels,
+            y_ticks=y_ticks,
+            pack_untracked_polytomies=self.pack_unselected.value,
+            additional_options=additional_options,
+        )
+        self.advanced_warning.visible = warning
+        return plot
+
+    def render_tree(
+        self,
+        tree: tskit.trees.Tree,
+        omit_sites: bool,
+        y_ticks: Union[None, dict],
+        node_labels: dict,
+        additional_options: dict,
+    ) -> Tuple[Union[pn.Accordion, pn.Column], bool]:
+        """Renders a single tree.
+
+        Arguments:
+            tree (tskit.trees.Tree): The tree to be plotted.
+            omit_sites (bool): If sites & mutaions should be included in the
+            plot.
+            y_ticks (Union[None, dict]): If y_ticks should be included in the
+            plot.
+            nodel_labels (dict): Any customised node labels.
+            additional_options (dict): Any additional plotting options.
+
+        Returns:
+            Tuple[Union[pn.Accordion, pn.Column], bool]: A panel element
+            containing the tree, and whether the additional options were
+            invalid and the tree was drawn with the default options.
+        """
+        style = self.default_css
         try:
-            plot = tree.draw_svg(
+            options = dict(
                 size=(self.width, self.height),
                 symbol_size=self.symbol_size,
                 y_axis=self.y_axis.value,
@@ -334,18 +380,24 @@ class Tree(View):
                 node_labels=node_labels,
                 y_ticks=y_ticks,
                 pack_untracked_polytomies=self.pack_unselected.value,
-                style=self.default_css,
+                style=style,
                 **additional_options,
             )
-            self.advanced_warning.visible = False
+            plot = self.datastore.cached(
+                "tree_svg",
+                lambda: tree.draw_svg(**options),
+                tree_index=tree.index,
+                options=options,
+            )
+            warning = False
         except (ValueError, SyntaxError, TypeError):
             plot = tree.draw_svg(
                 size=(self.width, self.height),
                 y_axis=True,
                 node_labels={},
-                style=self.default_css,
+                style=style,
             )
-            self.advanced_warning.visible = True
+            warning = True
         pos1 = int(tree.get_interval()[0])
         pos2 = int(tree.get_interval()[1]) - 1
         if int(self.num_trees.value) > 1:
@@ -355,7 +407,7 @@ class Tree(View):
                     name=f"Tree index {tree.index} (position {pos1} - {pos2})",
                 ),
                 active=[0],
-            )
+            ), warning
         else:
             return pn.Column(
                 pn.pane.HTML(
@@ -364,7 +416,7 @@ class Tree(View):
                     sizing_mode="stretch_width",
                 ),
                 pn.pane.HTML(plot),
-            )
+            ), warning
 
     def get_all_trees(self, trees: list) -> Union[None, pn.Column]:
         """Returns all trees in columns and rows.
@@ -5,7 +5,7 @@ import tskit
 from pytest import fixture
 from tsbrowse import model as tsb_model
 
-from tseda import model, datastore
+from tseda import cache, model, datastore
 
 dirname = os.path.abspath(os.path.dirname(__file__))
 
@@ -18,6 +18,16 @@ def port():
     return PORT[0]
 
 
+@fixture(autouse=True)
+def tmp_cache(tmp_path, monkeypatch):
+    """
+    Use a fresh result cache for each test.
+    """
+    with cache.open_cache(tmp_path / "cache") as tmp:
+        monkeypatch.setattr(cache, "cache", tmp)
+        yield tmp
+
+
 @fixture(autouse=True)
 def server_cleanup():
     """
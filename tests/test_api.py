@@ -0,0 +1,68 @@
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tseda import api
+from tseda.vpages import ignn
+
+
+@pytest.fixture
+def sample_sets(ts):
+    return api.population_samples(ts)
+
+
+def test_no_ui_imports():
+    code = (
+        "import sys, tseda.api; "
+        "print([m for m in ['panel', 'bokeh', 'holoviews'] "
+        "if m in sys.modules])"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True
+    )
+    assert result.stdout.strip() == "[]", result.stderr
+
+
+def test_population_samples(ds, sample_sets):
+    expected = ds.individuals_table.sample_sets()
+    assert list(sample_sets) == list(expected)
+    for key, samples in expected.items():
+        np.testing.assert_array_equal(sample_sets[key], samples)
+
+
+def test_statistics(ts, sample_sets):
+    windows = [0, ts.sequence_length / 2, ts.sequence_length]
+    sets = list(sample_sets.values())
+    np.testing.assert_array_equal(
+        api.oneway_statistic(ts, "diversity", sample_sets, windows=windows),
+        ts.diversity(sets, windows=windows),
+    )
+    np.testing.assert_array_equal(
+        api.multiway_statistic(ts, "divergence", sample_sets, [(0, 1)]),
+        ts.divergence(sets, indexes=[(0, 1)]),
+    )
+    with pytest.raises(ValueError):
+        api.oneway_statistic(ts, "Fst", sample_sets)
+    with pytest.raises(ValueError):
+        api.multiway_statistic(ts, "diversity", sample_sets, [(0, 1)])
+
+
+def test_pairwise_fst(ts, sample_sets):
+    fst = api.pairwise_fst(ts, sample_sets)
+    k = len(sample_sets)
+    assert fst.shape == (k, k)
+    np.testing.assert_allclose(fst, fst.T)
+    sets = list(sample_sets.values())
+    np.testing.assert_allclose(fst[0, 1], ts.Fst(sets, indexes=[(0, 1)])[0])
+
+
+def test_gnn_table(ds, sample_sets):
+    df = api.gnn_table(ds.tsm.ts, sample_sets)
+    pd.testing.assert_frame_equal(df, ignn.VBar(datastore=ds).gnn())
+    mean = api.mean_gnn(ds.tsm.ts, sample_sets)
+    expected = df.groupby(level="sample_set_id").mean()
+    np.testing.assert_allclose(mean.values, expected.values)
+    assert list(mean.index) == sorted(sample_sets)
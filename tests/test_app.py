@@ -0,0 +1,88 @@
+import threading
+import time
+
+import panel as pn
+from bokeh.document import Document
+from click.testing import CliRunner
+from panel.io.state import set_curdoc
+
+from tseda import app, vpages
+from tseda.__main__ import cli
+
+
+def test_pages_constructed_on_selection(ds):
+    app_ = app.DataStoreApp(datastore=ds)
+    assert app_.pages == {}
+    app_.view()
+    # Only the page shown first is constructed
+    assert list(app_.pages) == [vpages.PAGES[0].title]
+    title = vpages.PAGES[1].title
+    page = app_.get_page(title)
+    assert isinstance(page, vpages.PAGES[1])
+    assert app_.get_page(title) is page
+    assert list(app_.page_timings) == [vpages.PAGES[0].title, title]
+
+
+def test_warm_pages(ds):
+    app_ = app.DataStoreApp(datastore=ds, warm_pages=True)
+    doc = Document()
+    # A served session that has not finished loading
+    pn.state._loaded[doc] = False
+    with set_curdoc(doc):
+        app_.view()
+    # The remaining pages are only constructed once the session has loaded
+    assert list(app_.pages) == [vpages.PAGES[0].title]
+    pn.state._on_load(doc)
+    app_._warm_thread.join()
+    assert list(app_.pages) == [page.title for page in vpages.PAGES]
+    assert all(t >= 0 for t in app_.page_timings.values())
+
+
+def test_page_constructed_once(ds, monkeypatch):
+    constructed = []
+
+    class Page:
+        def __init__(self, datastore):
+            constructed.append(self)
+            time.sleep(0.1)
+
+    monkeypatch.setattr(vpages, "load_page", lambda title: Page)
+    app_ = app.DataStoreApp(datastore=ds)
+    threads = [
+        threading.Thread(target=app_.get_page, args=("Trees",))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(constructed) == 1
+    assert app_.get_page("Trees") is constructed[0]
+
+
+def test_serve_builds_view_per_session(tsbrowsefile, tmp_path, monkeypatch):
+    served = []
+    monkeypatch.setattr(
+        pn, "serve", lambda panels, **kwargs: served.append(panels)
+    )
+    result = CliRunner().invoke(
+        cli,
+        [
+            "serve",
+            tsbrowsefile,
+            "--warm-pages",
+            "--cache-dir",
+            str(tmp_path),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    (view,) = served
+    # The view, and the page warming it schedules, are only created when
+    # a session is opened
+    assert callable(view)
+    assert view.__self__.pages == {}
+
+
+def test_page_titles():
+    assert vpages.TITLES == [page.title for page in vpages.PAGES]
+    assert vpages.load_page("Trees") is vpages.PAGES_BY_TITLE["Trees"]
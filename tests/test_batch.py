@@ -0,0 +1,140 @@
+import json
+import pathlib
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from tseda import batch
+from tseda.__main__ import cli
+from tseda.vpages import stats
+
+
+def curves(layout):
+    """Returns the plotted values of a statistics plot by label."""
+    overlay = layout[0].object
+    return {key: curve.dimension_values(1) for key, curve in overlay.items()}
+
+
+def test_compute_track_matches_plot(ds):
+    ts = ds.tsm.ts
+    sample_sets, names = batch.load_sample_sets(ts)
+    oneway = stats.OnewayStats(datastore=ds, window_size=50000)
+    df = batch.compute_track(
+        ts, "diversity", "site", 50000, sample_sets, names
+    )
+    plotted = curves(oneway.plot())
+    assert sorted(df.columns[2:]) == sorted(plotted)
+    for name, values in plotted.items():
+        np.testing.assert_array_equal(df[name], values)
+    np.testing.assert_array_equal(df["start"], np.arange(0, 1e6, 5e4))
+    multiway = stats.MultiwayStats(datastore=ds, window_size=50000)
+    multiway.set_multichoice_options()
+    multiway.comparisons.value = multiway.comparisons.options
+    df = batch.compute_track(ts, "Fst", "site", 50000, sample_sets, names)
+    plotted = curves(multiway.plot())
+    assert sorted(df.columns[2:]) == sorted(plotted)
+    for name, values in plotted.items():
+        np.testing.assert_array_equal(df[name], values)
+
+
+def test_multiway_plot_sample_set_ids(ds):
+    # Sample set ids that are not positions in the sorted ids
+    ds.sample_sets_table.data.rx.value.loc[9] = ["nine", "#000000", False]
+    inds = ds.individuals_table.data.rx.value
+    inds.loc[inds.sample_set_id == 1, "sample_set_id"] = 9
+    names = ds.sample_sets_table.names
+    sample_sets = ds.individuals_table.sample_sets(only_selected=False)
+    expected = batch.compute_track(
+        ds.tsm.ts,
+        "Fst",
+        "site",
+        50000,
+        sample_sets,
+        {key: names[key] for key in sample_sets},
+    )
+    multiway = stats.MultiwayStats(datastore=ds, window_size=50000)
+    multiway.set_multichoice_options()
+    multiway.comparisons.value = multiway.comparisons.options
+    plotted = curves(multiway.plot())
+    assert "nine-" + names[2] in plotted
+    assert sorted(expected.columns[2:]) == sorted(plotted)
+    for name, values in plotted.items():
+        np.testing.assert_array_equal(expected[name], values)
+
+
+def test_load_sample_sets(ts):
+    sample_sets, names = batch.load_sample_sets(ts, {"a": [1, 0], "b": [5]})
+    assert names == {0: "a", 1: "b"}
+    np.testing.assert_array_equal(sample_sets[0], [0, 1, 2, 3])
+    np.testing.assert_array_equal(sample_sets[1], [10, 11])
+    with pytest.raises(ValueError):
+        batch.load_sample_sets(ts, {"a": [ts.num_individuals]})
+    with pytest.raises(ValueError, match="Sample set b has no samples"):
+        batch.load_sample_sets(ts, {"a": [0], "b": []})
+    with pytest.raises(ValueError, match="already in sample set a"):
+        batch.load_sample_sets(ts, {"a": [0, 1], "b": [1, 2]})
+
+
+def test_run_duplicate_names(treesfile, tmp_path):
+    copy = tmp_path / "copy" / pathlib.Path(treesfile).name
+    copy.parent.mkdir()
+    shutil.copy(treesfile, copy)
+    with pytest.raises(ValueError, match="same file name"):
+        batch.run(
+            [treesfile, str(copy)], ["diversity"], ["site"], [1e5], tmp_path
+        )
+    assert list(tmp_path.glob("*.parquet")) == []
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_run(treesfile, tmp_path, num_workers):
+    written = batch.run(
+        [treesfile],
+        ["diversity", "divergence"],
+        ["site", "branch"],
+        [100000, 250000],
+        tmp_path,
+        num_workers=num_workers,
+    )
+    # test.trees has uncalibrated times, so branch mode is skipped
+    assert len(written) == 4
+    df = pd.read_parquet(
+        tmp_path / "test.trees.divergence.site.250000.parquet"
+    )
+    assert df.shape == (4, 2 + 15)
+
+
+def test_compute_cli(tsbrowsefile, tmp_path):
+    definitions = tmp_path / "sets.json"
+    definitions.write_text(json.dumps({"a": [0, 1, 2], "b": [6, 7]}))
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        [
+            "compute",
+            tsbrowsefile,
+            "-s",
+            "Tajimas_D",
+            "-s",
+            "Fst",
+            "-w",
+            "500000",
+            "--sample-sets",
+            str(definitions),
+            "--format",
+            "npz",
+            "-o",
+            str(tmp_path / "out"),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert "Wrote 2 tracks" in result.output
+    with np.load(
+        tmp_path / "out" / "test.trees.tsbrowse.Fst.site.500000.npz"
+    ) as data:
+        np.testing.assert_array_equal(data["windows"], [0, 5e5, 1e6])
+        assert list(data["columns"]) == ["a-b"]
+        assert data["values"].shape == (2, 1)
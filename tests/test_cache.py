@@ -0,0 +1,292 @@
+import os
+import subprocess
+import sys
+
+import holoviews as hv
+import numpy as np
+import pandas as pd
+import panel as pn
+import pytest
+from bokeh.document import Document
+from click.testing import CliRunner
+from panel.io.state import set_curdoc
+
+from tseda import cache, datastore
+from tseda.__main__ import cli
+from tseda.vpages import stats
+
+
+def test_make_key():
+    key = cache.make_key("stat", "abc", windows=[0, 0.5, 1.0], mode="site")
+    assert key.startswith("stat/abc/")
+    assert key == cache.make_key(
+        "stat", "abc", mode="site", windows=np.array([0, 0.5, 1.0])
+    )
+    assert key != cache.make_key(
+        "stat", "abc", windows=[0, 0.5, 1.0], mode="branch"
+    )
+    assert key != cache.make_key("stat", "abd", windows=[0, 0.5, 1.0])
+    sample_sets = [np.array([0, 1], dtype=np.int32), [2, 3, 4]]
+    assert cache.make_key("gnn", "abc", sample_sets=sample_sets) != (
+        cache.make_key("gnn", "abc", sample_sets=sample_sets[::-1])
+    )
+    assert cache.make_key("gnn", "abc", focal=[1, 2]) == cache.make_key(
+        "gnn", "abc", focal=np.array([1, 2], dtype=np.int32)
+    )
+
+
+def test_memoize(tmp_cache):
+    calls = []
+
+    def func():
+        calls.append(1)
+        return np.arange(3)
+
+    for _ in range(2):
+        result = cache.memoize("f", "abc", func, x=[1, 2])
+        np.testing.assert_array_equal(result, np.arange(3))
+    assert len(calls) == 1
+    assert cache.lookup("f", "abc", x=[1, 3]) is None
+    assert len(tmp_cache) == 1
+
+
+def test_fingerprint(ts):
+    assert cache.fingerprint(ts) == cache.fingerprint(
+        ts.dump_tables().tree_sequence()
+    )
+    tables = ts.dump_tables()
+    time = tables.nodes.time
+    time[-1] += 1
+    tables.nodes.time = time
+    assert cache.fingerprint(tables.tree_sequence()) != cache.fingerprint(ts)
+
+
+def test_fingerprint_zero_copy(ts, monkeypatch):
+    expected = cache.fingerprint(ts)
+
+    def copy(*args, **kwargs):
+        raise AssertionError("Tables were copied")
+
+    monkeypatch.setattr(type(ts), "dump_tables", copy)
+    monkeypatch.setattr(type(ts), "tables", property(copy))
+    assert cache.fingerprint(ts) == expected
+
+
+def test_fingerprint_metadata(ts):
+    tables = ts.dump_tables()
+    tables.populations.clear()
+    for population in ts.populations():
+        tables.populations.append(
+            population.replace(metadata=f"p{population.id}".encode())
+        )
+    assert cache.fingerprint(tables.tree_sequence()) != cache.fingerprint(ts)
+
+
+def test_fingerprint_sampled(ts, monkeypatch):
+    monkeypatch.setattr(cache, "FINGERPRINT_BLOCK_SIZE", 16)
+    monkeypatch.setattr(cache, "FINGERPRINT_BLOCKS", 4)
+    expected = cache.fingerprint(ts)
+    assert ts.num_nodes * 8 > 16 * 4
+    # Edits in the first or last block, and changes to the length of a
+    # column, are detected even though large columns are sampled.
+    for index, delta in [(0, -1), (-1, 1)]:
+        tables = ts.dump_tables()
+        time = tables.nodes.time
+        time[index] += delta
+        tables.nodes.time = time
+        assert cache.fingerprint(tables.tree_sequence()) != expected
+    tables = ts.dump_tables()
+    tables.delete_sites([ts.num_sites - 1])
+    assert cache.fingerprint(tables.tree_sequence()) != expected
+
+
+def test_file_fingerprint(tmp_cache, ts, tmp_path, monkeypatch):
+    path = tmp_path / "test.trees"
+    ts.dump(path)
+    expected = cache.file_fingerprint(path, ts)
+    assert expected == cache.fingerprint(ts)
+    monkeypatch.setattr(cache, "fingerprint", None)
+    assert cache.file_fingerprint(path, ts) == expected
+    # A modified file is fingerprinted again
+    tables = ts.dump_tables()
+    tables.delete_sites([0])
+    tables.dump(path)
+    monkeypatch.undo()
+    other = cache.file_fingerprint(path, tables.tree_sequence())
+    assert other != expected
+
+
+def test_datastore_cached(tsm):
+    calls = []
+
+    def func():
+        calls.append(1)
+        return 1.0
+
+    for _ in range(2):
+        # A new session on the same data shares the cached results
+        individuals_table, sample_sets_table = datastore.preprocess(tsm)
+        ds = datastore.DataStore(
+            tsm=tsm,
+            individuals_table=individuals_table,
+            sample_sets_table=sample_sets_table,
+        )
+        assert ds.cached("stat", func, windows=[0, 1]) == 1.0
+    assert len(calls) == 1
+
+
+def test_streamed_gnn_cached(ds):
+    windows = list(np.linspace(0, ds.tsm.ts.sequence_length, 11))
+    chunks = list(ds.iter_haplotype_gnn(0, windows, chunk_size=2))
+    assert len(chunks) == 5
+    (cached,) = ds.iter_haplotype_gnn(0, windows, chunk_size=2)
+    np.testing.assert_array_equal(
+        cached.values, np.concatenate([chunk.values for chunk in chunks])
+    )
+    np.testing.assert_array_equal(
+        ds.haplotype_gnn(0, windows=windows).values, cached.values
+    )
+
+
+def test_compressed_disk(tmp_path):
+    with cache.open_cache(tmp_path / "c") as c:
+        A = np.zeros((1000, 42, 6))
+        c.set("a", A)
+        c.set("b", "small")
+        np.testing.assert_array_equal(c.get("a"), A)
+        assert c.get("b") == "small"
+        assert c.volume() < A.nbytes / 10
+
+
+def test_configure(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "cache", cache.open_cache(tmp_path / "a"))
+    cache.configure(
+        tmp_path / "b",
+        size_limit=2**20,
+        eviction_policy="least-frequently-used",
+    )
+    assert cache.cache.directory == str(tmp_path / "b")
+    assert cache.cache.eviction_policy == "least-frequently-used"
+    # Settings persist in the directory
+    cache.configure(tmp_path / "b")
+    assert cache.cache.size_limit == 2**20
+    rng = np.random.default_rng(1)
+    for j in range(40):
+        cache.store("f", "abc", rng.random(2**14), j=j)
+    assert cache.cache.volume() < 2 * 2**20
+    cache.cache.close()
+
+
+def test_cache_opened_lazily(tmp_path):
+    # The default cache directory is only created when the cache is used
+    code = (
+        "import sys; from tseda import cache; from tseda.__main__ import cli; "
+        "assert cache.cache is None; "
+        "cache.configure(sys.argv[1]); "
+        "assert cache.get_cache() is cache.cache"
+    )
+    env = dict(os.environ, XDG_CACHE_HOME=str(tmp_path / "default"))
+    result = subprocess.run(
+        [sys.executable, "-c", code, str(tmp_path / "configured")],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert not (tmp_path / "default").exists()
+    assert (tmp_path / "configured").exists()
+
+
+def test_parse_size():
+    assert cache.parse_size("1024") == 1024
+    assert cache.parse_size("500M") == 500 * 2**20
+    assert cache.parse_size("2GB") == 2 * 2**30
+    assert cache.parse_size("1.5 GiB") == int(1.5 * 2**30)
+    with pytest.raises(ValueError):
+        cache.parse_size("lots")
+
+
+def test_cache_cli(ds, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cli")
+    monkeypatch.setattr(cache, "cache", cache.open_cache(cache_dir))
+    path = ds.tsm.full_path
+    cache.memoize("f", ds.fingerprint, lambda: 1, x=1)
+    cache.memoize("f", ds.fingerprint, lambda: 1, x=1)
+    cache.memoize("f", "other", lambda: 2, x=1)
+    runner = CliRunner()
+    result = runner.invoke(cli, ["cache", "--cache-dir", cache_dir, "stats"])
+    assert result.exit_code == 0, result.output
+    assert "Entries:         3" in result.output
+    result = runner.invoke(
+        cli, ["cache", "--cache-dir", cache_dir, "prune", str(path)]
+    )
+    assert result.exit_code == 0, result.output
+    # The result and the memoized fingerprint are removed
+    assert "Removed 2 entries" in result.output
+    result = runner.invoke(
+        cli, ["cache", "--cache-dir", cache_dir, "clear", "--yes"]
+    )
+    assert "Removed 1 entries" in result.output
+    assert len(cache.cache) == 0
+    cache.cache.close()
+
+
+def test_plot_cache():
+    plots = cache.PlotCache(max_size=3 * 8000)
+    for j in range(3):
+        plots.set(j, np.zeros(1000))
+    assert plots.size == 3 * 8000
+    assert plots.get(0) is not None
+    plots.set(3, np.zeros(1000))
+    # 1 is the least recently used entry
+    assert 1 not in plots
+    assert [j in plots for j in [0, 2, 3]] == [True] * 3
+    plots.set(4, np.zeros(10000))
+    assert 4 not in plots
+    assert plots.get_or_create(5, lambda: "plot") == "plot"
+    assert plots.get_or_create(5, lambda: "other") == "plot"
+    assert plots.hits == 2
+    plots.clear()
+    assert len(plots) == 0
+    assert plots.size == 0
+
+
+def test_estimate_size():
+    df = pd.DataFrame({"x": np.zeros(1000)})
+    assert cache.estimate_size(np.zeros(1000)) == 8000
+    assert cache.estimate_size(df) >= 8000
+    layout = pn.Column(pn.pane.HTML("x" * 10000), hv.Curve(df))
+    assert cache.estimate_size(layout) >= 18000
+
+
+def test_cached_plot(ds):
+    view = stats.OnewayStats(datastore=ds)
+    plot = view.__panel__()
+    view.window_size = 20000
+    other = view.__panel__()
+    assert other is not plot
+    view.window_size = 10000
+    assert view.__panel__() is plot
+    assert ds.data_version is ds.data_version
+    ds.individuals_table.data.rx.value.loc[0, "selected"] = False
+    ds.individuals_table.edits += 1
+    assert view.__panel__() is not plot
+    ds.plot_cache_size = 0
+    assert view.__panel__() is not view.__panel__()
+
+
+def test_plot_cache_per_session(ds):
+    docs = [Document(), Document()]
+    caches = []
+    for doc in docs:
+        with set_curdoc(doc):
+            caches.append(ds.plot_cache)
+            assert ds.plot_cache is caches[-1]
+    assert caches[0] is not caches[1]
+    assert ds.plot_cache not in caches
+    for callback in docs[0].session_destroyed_callbacks:
+        callback(None)
+    with set_curdoc(docs[0]):
+        assert ds.plot_cache is not caches[0]
+    with set_curdoc(docs[1]):
+        assert ds.plot_cache is caches[1]
@@ -1,7 +1,13 @@
+import dataclasses
+import shutil
+
 import numpy as np
+import pandas as pd
 import pytest
+from tsbrowse import model as tsb_model
 
-from tseda import datastore
+from tseda import datastore, gnn, precompute
+from tseda.gnn import make_windows
 
 
 @pytest.fixture
@@ -19,6 +25,31 @@ def test_datastore_preprocess(tsm):
     np.testing.assert_equal(sample_sets[1], np.arange(0, 12))
 
 
+def test_sample_sets_arrays(individuals_table):
+    inds = individuals_table.data.rx.value
+    inds.loc[[3, 20], "sample_set_id"] = 7
+    inds.loc[4, "selected"] = False
+    expected = {}
+    for i, ind in inds.iterrows():
+        if ind.selected:
+            nodes = individuals_table.nodes(i)
+            expected.setdefault(ind.sample_set_id, []).extend(nodes)
+    sample_sets = individuals_table.sample_sets()
+    assert list(sample_sets) == list(expected)
+    assert list(sample_sets)[:3] == [1, 7, 0]
+    for key, nodes in sample_sets.items():
+        assert nodes.dtype == np.int32
+        assert nodes.flags.c_contiguous
+        np.testing.assert_array_equal(nodes, expected[key])
+    all_sets = individuals_table.sample_sets(only_selected=False)
+    assert sum(len(x) for x in all_sets.values()) == 42
+    samples = individuals_table.samples()
+    assert samples.dtype == np.int32
+    np.testing.assert_array_equal(
+        samples, [u for i in inds.index for u in individuals_table.nodes(i)]
+    )
+
+
 def test_individuals_table(individuals_table):
     ind = individuals_table.loc(5)
     assert ind is not None
@@ -26,8 +57,11 @@ def test_individuals_table(individuals_table):
     assert ind.population == 1
     assert ind["name"] == "tsk_6"
     assert ind.name == 5
-    assert individuals_table.sample2ind[ind.nodes[0]] == 5
-    assert individuals_table.sample2ind[ind.nodes[1]] == 5
+    nodes = individuals_table.nodes(5)
+    np.testing.assert_array_equal(nodes, [10, 11])
+    np.testing.assert_array_equal(individuals_table.sample2ind[nodes], 5)
+    with pytest.raises(KeyError):
+        individuals_table.nodes(100)
     ss = individuals_table.sample_sets()
     assert len(ss) == 6
     assert len(ss[0]) == 12
@@ -35,6 +69,236 @@ def test_individuals_table(individuals_table):
     assert len(samples) == 42
 
 
+def test_sample2ind(individuals_table, ts):
+    index = individuals_table.sample2ind
+    assert individuals_table.sample2ind is index
+    np.testing.assert_array_equal(index, ts.nodes_individual)
+    assert not index.flags.writeable
+    # Built from the nodes of the individuals when the node individual
+    # column is not given
+    table = individuals_table.data.rx.value.reset_index()
+    other = datastore.IndividualsTable(
+        table=table, individuals=individuals_table.individuals
+    )
+    np.testing.assert_array_equal(
+        other.sample2ind, ts.nodes_individual[: len(other.sample2ind)]
+    )
+    individuals_table.table = table.copy()
+    assert individuals_table.sample2ind is not index
+
+
+def test_sample_sets_lookups(ds):
+    table = ds.sample_sets_table
+    names = table.names
+    assert table.names is names
+    assert names[1] == "CHB"
+    assert table.color_by_name["CHB"] == table.loc(1).color
+    np.testing.assert_array_equal(
+        table.names_of([1, 0, 1]), ["CHB", "CEU", "CHB"]
+    )
+    np.testing.assert_array_equal(
+        table.colors_of(np.array([[0], [1]])),
+        [table.loc(0).color, table.loc(1).color],
+    )
+    with pytest.raises(KeyError):
+        table.names_of([100])
+    with pytest.raises(TypeError):
+        names[1] = "other"
+    # Edits in place rebuild the lookups
+    table.data.rx.value.loc[1, "name"] = "other"
+    assert table.names is not names
+    assert table.names[1] == "other"
+    assert "other" in table.color_by_name
+
+
 def test_datastore(ds):
     print(ds.color)
     print(ds.sample_sets_table.color_by_name)
+
+
+def test_haplotype_gnn_batch(ds):
+    windows = [0, 5e5, 1e6]
+    samples = list(ds.individuals_table.samples())
+    atlas = ds.haplotype_gnn_batch(windows=windows)
+    assert atlas.shape == (2, len(samples), 6)
+    for i in [0, 5, 20]:
+        nodes = ds.individuals_table.nodes(i)
+        single = ds.haplotype_gnn_batch(nodes, windows=windows)
+        index = [samples.index(u) for u in nodes]
+        np.testing.assert_allclose(atlas[:, index, :], single)
+    result = ds.haplotype_gnn(5, windows=windows)
+    np.testing.assert_array_equal(result.nodes, [10, 11])
+    np.testing.assert_allclose(
+        result.haplotype(0),
+        ds.haplotype_gnn_batch([10], windows=windows)[:, 0],
+    )
+    assert np.shares_memory(result.haplotype(1), result.values)
+    columns = result.columns(1)
+    np.testing.assert_array_equal(columns["start"], windows[:-1])
+    assert list(columns)[1:] == result.labels
+    df = result.to_dataframe()
+    np.testing.assert_allclose(df.loc[0].values, result.haplotype(0))
+
+
+def test_haplotype_gnn_batch_region(ds):
+    windows = np.linspace(0, ds.tsm.ts.sequence_length, 11)
+    expected = ds.haplotype_gnn_batch(windows=windows)
+    result = ds.haplotype_gnn_batch(windows=windows[4:8])
+    np.testing.assert_allclose(result, expected[4:7])
+    index = ds.tree_state_index(ds.individuals_table.sample_sets())
+    assert ds.tree_state_index(ds.individuals_table.sample_sets()) is index
+    ds.individuals_table.data.rx.value.loc[0, "selected"] = False
+    assert ds.tree_state_index(ds.individuals_table.sample_sets()) is not index
+
+
+def test_haplotype_gnn_time_windows(ds):
+    windows = [0, 5e5, 1e6]
+    time_windows = [0, 1e3, 1e4, ds.tsm.ts.max_root_time]
+    hap = ds.haplotype_gnn_batch(
+        [10, 11], windows=windows, time_windows=time_windows
+    )
+    assert hap.shape == (2, 3, 2, 6)
+    result = ds.haplotype_gnn(5, windows=windows, time_windows=time_windows)
+    np.testing.assert_array_equal(result.haplotype(1, 1), hap[:, 1, 1])
+    df = result.to_dataframe()
+    assert df.index.names == [
+        "haplotype",
+        "time_start",
+        "time_end",
+        "start",
+        "end",
+    ]
+    assert df.shape == (2 * 3 * 2, 6)
+    np.testing.assert_allclose(df.loc[(1, 1e3)].values, hap[:, 1, 1])
+    result = ds.haplotype_gnn(5, time_windows=time_windows)
+    assert result.values.shape == (1, 3, 2, 6)
+    assert result.to_dataframe().shape == (2 * 3, 6)
+
+
+def test_haplotype_gnn_dtype(ds):
+    windows = [0, 5e5, 1e6]
+    expected = ds.haplotype_gnn_batch(windows=windows)
+    ds.gnn_dtype = "float16"
+    result = ds.haplotype_gnn_batch(windows=windows)
+    assert result.dtype == np.float16
+    np.testing.assert_allclose(result, expected, atol=1e-3)
+    sparse = ds.haplotype_gnn_batch(windows=windows, sparse=True)
+    np.testing.assert_array_equal(sparse.to_dense(), result)
+    assert ds.haplotype_gnn(5, windows=windows).values.dtype == np.float16
+
+
+@pytest.fixture
+def precomputed_ds(tsbrowsefile, tmp_path):
+    path = tmp_path / "test.tseda"
+    shutil.copy(tsbrowsefile, path)
+    tsm = tsb_model.TSModel(path)
+    individuals_table, sample_sets_table = datastore.preprocess(tsm)
+    precompute.write_gnn(
+        path, tsm.ts, individuals_table.sample_sets(), window_size=1e5
+    )
+    return datastore.DataStore(
+        tsm=tsm,
+        individuals_table=individuals_table,
+        sample_sets_table=sample_sets_table,
+        precomputed_gnn=precompute.load_gnn(path),
+    )
+
+
+def test_precomputed_gnn(precomputed_ds, tsbrowsefile):
+    ds = precomputed_ds
+    assert precompute.load_gnn(tsbrowsefile) is None
+    stored = ds.precomputed_gnn
+    assert stored.values.shape == (10, 42, 6)
+    assert stored.values.dtype == np.float32
+    windows = make_windows(1e5, ds.tsm.ts.sequence_length)
+    result = ds.haplotype_gnn(3, windows=windows)
+    ds.precomputed_gnn = None
+    expected = ds.haplotype_gnn(3, windows=windows)
+    np.testing.assert_allclose(result.values, expected.values, rtol=1e-6)
+    ds.precomputed_gnn = stored
+    (chunk,) = ds.iter_haplotype_gnn(3, windows)
+    np.testing.assert_array_equal(chunk.values, result.values)
+    # Other windows or sample sets are computed
+    assert stored.lookup([6, 7], stored.key, windows[:5]) is None
+    ds.individuals_table.data.rx.value.loc[0, "selected"] = False
+    sample_sets = ds.individuals_table.sample_sets()
+    key = gnn.reference_set_key(gnn.reference_set_map(ds.tsm.ts, sample_sets))
+    assert stored.lookup([6, 7], key, windows) is None
+
+
+def test_precomputed_gnn_version(precomputed_ds, monkeypatch):
+    path = precomputed_ds.tsm.full_path
+    monkeypatch.setattr(precompute, "TSEDA_DATA_VERSION", "0")
+    assert precompute.load_gnn(path) is None
+
+
+@pytest.fixture
+def tables_path(tsbrowsefile, tmp_path):
+    path = tmp_path / "tables.tseda"
+    shutil.copy(tsbrowsefile, path)
+    return path
+
+
+def test_stored_tables(tables_path, monkeypatch):
+    tsm = tsb_model.TSModel(tables_path)
+    assert precompute.load_tables(tables_path, tsm.ts) is None
+    individuals_table, sample_sets_table = datastore.preprocess(tsm)
+    sample_sets = sample_sets_table.data.rx.value.reset_index()
+    precompute.write_tables(
+        tables_path, tsm.ts, individuals_table.individuals, sample_sets
+    )
+    individuals, stored_sample_sets = precompute.load_tables(
+        tables_path, tsm.ts
+    )
+    expected = individuals_table.individuals
+    for field in dataclasses.fields(expected):
+        np.testing.assert_equal(
+            getattr(individuals, field.name), getattr(expected, field.name)
+        )
+    pd.testing.assert_frame_equal(stored_sample_sets, sample_sets)
+    # The tables are loaded rather than rebuilt from the tree sequence
+    monkeypatch.setattr(datastore.Individuals, "from_tree_sequence", None)
+    loaded, loaded_sample_sets = datastore.preprocess(tsm)
+    pd.testing.assert_frame_equal(
+        loaded.data.rx.value, individuals_table.data.rx.value
+    )
+    pd.testing.assert_frame_equal(
+        loaded_sample_sets.data.rx.value, sample_sets_table.data.rx.value
+    )
+    np.testing.assert_array_equal(
+        loaded.sample2ind, individuals_table.sample2ind
+    )
+    monkeypatch.setattr(precompute, "TSEDA_DATA_VERSION", "0")
+    assert precompute.load_tables(tables_path, tsm.ts) is None
+
+
+def test_stored_tables_fingerprint(tables_path, ts):
+    tsm = tsb_model.TSModel(tables_path)
+    individuals_table, sample_sets_table = datastore.preprocess(tsm)
+    tables = tsm.ts.dump_tables()
+    tables.delete_sites([0])
+    precompute.write_tables(
+        tables_path,
+        tables.tree_sequence(),
+        individuals_table.individuals,
+        sample_sets_table.data.rx.value.reset_index(),
+    )
+    assert precompute.load_tables(tables_path, tsm.ts) is None
+
+
+def test_genealogical_nearest_neighbours_memo(ds):
+    sample_sets = ds.individuals_table.sample_sets()
+    samples = [u for nodes in sample_sets.values() for u in nodes]
+    result = ds.genealogical_nearest_neighbours()
+    np.testing.assert_array_equal(
+        result,
+        ds.tsm.ts.genealogical_nearest_neighbours(
+            samples, sample_sets=list(sample_sets.values())
+        ),
+    )
+    assert not result.flags.writeable
+    assert ds.genealogical_nearest_neighbours(samples, sample_sets) is result
+    ds.individuals_table.data.rx.value.loc[0, "selected"] = False
+    other = ds.genealogical_nearest_neighbours()
+    assert other is not result
+    assert other.shape == (len(samples) - 2, 6)
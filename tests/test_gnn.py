@@ -1,7 +1,13 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import panel as pn
 import pytest
+import tskit
 
-from tseda import datastore
-from tseda.vpages import ignn
+from tseda import datastore, gnn
+from tseda.vpages import ignn, structure
 
 
 @pytest.fixture
@@ -14,11 +20,350 @@ def hapgnn(ds):
     return ignn.GNNHaplotype(datastore=ds)
 
 
+@pytest.fixture
+def sample_sets(ts):
+    return {
+        pop.id: ts.samples(population=pop.id)
+        for pop in ts.populations()
+        if len(ts.samples(population=pop.id)) > 0
+    }
+
+
 def test_gnn(vbar):
     df = vbar.gnn()
     print(df)
 
 
 def test_haplotype_gnn(hapgnn):
-    df = hapgnn.datastore.haplotype_gnn(0)
+    df = hapgnn.datastore.haplotype_gnn(0).to_dataframe()
     print(df)
+
+
+@pytest.mark.parametrize(
+    "windows,time_windows",
+    [
+        (None, None),
+        ([0, 1e5, 5e5, 1e6], None),
+        (None, [0, 1e3, 1e4, 1e7]),
+        ([0, 2.5e5, 1e6], [0, 1e4, 1e7]),
+    ],
+)
+def test_windowed_gnn_engines(ts, sample_sets, windows, time_windows):
+    focal = ts.samples()[::3]
+    expected = gnn.windowed_genealogical_nearest_neighbours(
+        ts,
+        focal,
+        sample_sets,
+        windows=windows,
+        time_windows=time_windows,
+        engine="python",
+    )
+    result = gnn.windowed_genealogical_nearest_neighbours(
+        ts,
+        focal,
+        sample_sets,
+        windows=windows,
+        time_windows=time_windows,
+        engine="numba",
+    )
+    np.testing.assert_allclose(result, expected)
+
+
+def test_windowed_gnn_unknown_engine(ts, sample_sets):
+    with pytest.raises(ValueError):
+        gnn.windowed_genealogical_nearest_neighbours(
+            ts, [0], sample_sets, engine="cython"
+        )
+
+
+def test_windowed_gnn_parallel(ts, sample_sets):
+    focal = ts.samples()
+    windows = np.linspace(0, ts.sequence_length, 8)
+    expected = gnn.windowed_genealogical_nearest_neighbours(
+        ts, focal, sample_sets, windows=windows
+    )
+    result = gnn.windowed_genealogical_nearest_neighbours(
+        ts, focal, sample_sets, windows=windows, num_workers=3
+    )
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_windowed_gnn_parallel_requires_numba(ts, sample_sets):
+    with pytest.raises(ValueError):
+        gnn.windowed_genealogical_nearest_neighbours(
+            ts, [0], sample_sets, engine="python", num_workers=2
+        )
+
+
+@pytest.mark.parametrize("engine", ["numba", "python"])
+def test_windowed_gnn_region(ts, sample_sets, engine):
+    focal = ts.samples()[::2]
+    windows = np.linspace(0, ts.sequence_length, 21)
+    expected = gnn.windowed_genealogical_nearest_neighbours(
+        ts, focal, sample_sets, windows=windows
+    )
+    result = gnn.windowed_genealogical_nearest_neighbours(
+        ts, focal, sample_sets, windows=windows[7:13], engine=engine
+    )
+    np.testing.assert_allclose(result, expected[7:12])
+
+
+def test_gnn_kernel_reevaluates_touched_lineages():
+    # Node 7 replaces node 5 above samples 2 and 3 at position 0.5, so
+    # only those two samples are re-evaluated in the second tree
+    tables = tskit.TableCollection(sequence_length=1)
+    for t in [0, 0, 0, 0, 1, 1, 2, 1.5]:
+        tables.nodes.add_row(flags=int(t == 0), time=t)
+    for left, right, parent, child in [
+        (0, 1, 4, 0),
+        (0, 1, 4, 1),
+        (0, 0.5, 5, 2),
+        (0, 0.5, 5, 3),
+        (0.5, 1, 7, 2),
+        (0.5, 1, 7, 3),
+        (0, 1, 6, 4),
+        (0, 0.5, 6, 5),
+        (0.5, 1, 6, 7),
+    ]:
+        tables.edges.add_row(left, right, parent, child)
+    tables.sort()
+    small = tables.tree_sequence()
+    focal = np.arange(4, dtype=np.int32)
+    sample_sets = {0: [0, 1], 1: [2, 3]}
+    node_map = gnn.reference_set_map(small, sample_sets)
+    arrays = gnn._kernel_arrays(small)
+    windows = np.array([0, 1.0])
+    time_windows = np.array([0, np.inf])
+    parent, sample_count, j, k = gnn._initial_state(
+        arrays, gnn._initial_sample_count(node_map, 2), 0, None
+    )
+    A, norm, _, _, evaluations = gnn._gnn_kernel(
+        *arrays,
+        focal,
+        node_map,
+        parent,
+        sample_count,
+        j,
+        k,
+        windows,
+        time_windows,
+    )
+    np.testing.assert_array_equal(evaluations, [1, 1, 2, 2])
+    np.testing.assert_allclose(
+        A[0, 0] / norm[0, 0, :, np.newaxis],
+        gnn.windowed_genealogical_nearest_neighbours(
+            small, focal, sample_sets, engine="python"
+        ),
+    )
+
+
+def test_reference_set_map(ts, sample_sets):
+    node_map = gnn.reference_set_map(ts, sample_sets)
+    for k, nodes in enumerate(sample_sets.values()):
+        np.testing.assert_array_equal(node_map[nodes], k)
+    assert np.sum(node_map != tskit.NULL) == sum(
+        len(nodes) for nodes in sample_sets.values()
+    )
+    for duplicated in [{0: [0, 1], 1: [1, 2]}, {0: [0, 1, 0]}]:
+        with pytest.raises(ValueError):
+            gnn.reference_set_map(ts, duplicated)
+
+
+def test_tree_state_index(ts, sample_sets):
+    focal = ts.samples()
+    windows = np.linspace(0, ts.sequence_length, 21)
+    expected = gnn.windowed_genealogical_nearest_neighbours(
+        ts, focal, sample_sets, windows=windows
+    )
+    checkpoints = gnn.TreeStateIndex(ts, sample_sets, interval=1e5)
+    assert len(checkpoints.positions) == 10
+    for start, stop in [(0, 3), (5, 9), (13, 20)]:
+        result = gnn.windowed_genealogical_nearest_neighbours(
+            ts,
+            focal,
+            sample_sets,
+            windows=windows[start : stop + 1],
+            checkpoints=checkpoints,
+        )
+        np.testing.assert_allclose(result, expected[start:stop])
+    other = dict(list(sample_sets.items())[1:])
+    with pytest.raises(ValueError):
+        gnn.windowed_genealogical_nearest_neighbours(
+            ts, focal, other, windows=windows, checkpoints=checkpoints
+        )
+
+
+def test_parse_windows(ts):
+    np.testing.assert_equal(
+        gnn.parse_windows(ts, None), [0, ts.sequence_length]
+    )
+    np.testing.assert_equal(gnn.parse_windows(ts, [10, 20]), [10, 20])
+    for windows in [[10], [20, 10], [0, 2 * ts.sequence_length]]:
+        with pytest.raises(ValueError):
+            gnn.parse_windows(ts, windows)
+
+
+@pytest.mark.parametrize("time_windows", [None, [0, 1e4, 1e7]])
+@pytest.mark.parametrize("windows", [np.arange(0, 1e6 + 1, 5e4), [1e5, 3e5]])
+def test_iter_windowed_gnn(ts, sample_sets, windows, time_windows):
+    focal = ts.samples()[::3]
+    expected = gnn.windowed_genealogical_nearest_neighbours(
+        ts, focal, sample_sets, windows=windows, time_windows=time_windows
+    )
+    calls = []
+    chunks = list(
+        gnn.iter_windowed_genealogical_nearest_neighbours(
+            ts,
+            focal,
+            sample_sets,
+            windows,
+            time_windows=time_windows,
+            chunk_size=3,
+            progress=lambda done, total: calls.append((done, total)),
+        )
+    )
+    num_windows = len(windows) - 1
+    assert [start for start, _ in chunks] == list(range(0, num_windows, 3))
+    np.testing.assert_array_equal(
+        np.concatenate([A for _, A in chunks]), expected
+    )
+    assert calls[-1] == (num_windows, num_windows)
+    assert len(calls) == len(chunks)
+
+
+@pytest.mark.parametrize("engine", gnn.ENGINES)
+def test_windowed_gnn_progress(ts, sample_sets, engine):
+    calls = []
+    gnn.windowed_genealogical_nearest_neighbours(
+        ts,
+        ts.samples()[:2],
+        sample_sets,
+        windows=[0, 1e5, 5e5, 1e6],
+        engine=engine,
+        progress=lambda done, total: calls.append((done, total)),
+    )
+    assert calls[-1] == (3, 3)
+
+
+def test_iter_haplotype_gnn(ds):
+    windows = list(range(0, int(ds.tsm.ts.sequence_length) + 1, 50000))
+    chunks = list(ds.iter_haplotype_gnn(0, windows, chunk_size=4))
+    assert len(chunks) == 5
+    expected = ds.haplotype_gnn(0, windows=windows)
+    np.testing.assert_array_equal(
+        np.concatenate([chunk.values for chunk in chunks]), expected.values
+    )
+    np.testing.assert_array_equal(
+        np.concatenate([chunk.start for chunk in chunks]), expected.start
+    )
+    df = pd.concat([chunk.to_dataframe() for chunk in chunks]).sort_index()
+    pd.testing.assert_frame_equal(df, expected.to_dataframe().sort_index())
+
+
+def test_haplotype_plot_streams(hapgnn):
+    hapgnn.individual_id = 0
+
+    async def collect():
+        return [layout async for layout in hapgnn.__panel__()]
+
+    layouts = asyncio.run(collect())
+    assert len(layouts) == 1
+    progress = layouts[0][1]
+    assert progress.value == progress.max == 100
+    assert not progress.visible
+
+
+def test_haplotype_plot_time_windows(hapgnn):
+    hapgnn.individual_id = 0
+    hapgnn.num_time_windows = 3
+
+    async def collect():
+        return [layout async for layout in hapgnn.__panel__()]
+
+    layout = asyncio.run(collect())[0]
+    plots = [x for x in layout if isinstance(x, pn.pane.HoloViews)]
+    assert len(plots) == 2 * 3
+
+
+@pytest.mark.parametrize("engine", gnn.ENGINES)
+@pytest.mark.parametrize("span_normalise", [True, False])
+def test_windowed_gnn_dtype_sparse(ts, sample_sets, engine, span_normalise):
+    focal = ts.samples()[::3]
+    kwargs = dict(
+        windows=np.linspace(0, ts.sequence_length, 21),
+        time_windows=[0, 1e3, 1e7],
+        span_normalise=span_normalise,
+        engine=engine,
+    )
+    expected = gnn.windowed_genealogical_nearest_neighbours(
+        ts, focal, sample_sets, **kwargs
+    )
+    assert expected.dtype == np.float64
+    result = gnn.windowed_genealogical_nearest_neighbours(
+        ts, focal, sample_sets, dtype=np.float32, **kwargs
+    )
+    assert result.dtype == np.float32
+    np.testing.assert_allclose(result, expected, rtol=1e-6)
+    sparse = gnn.windowed_genealogical_nearest_neighbours(
+        ts, focal, sample_sets, dtype=np.float16, sparse=True, **kwargs
+    )
+    assert sparse.shape == expected.shape
+    assert sparse.dtype == np.float16
+    assert sparse.nbytes < expected.nbytes / 2
+    np.testing.assert_allclose(sparse.to_dense(), expected, atol=1e-3)
+
+
+def test_windowed_gnn_dtype_invalid(ts, sample_sets):
+    with pytest.raises(ValueError):
+        gnn.windowed_genealogical_nearest_neighbours(
+            ts, [0], sample_sets, dtype=np.int32
+        )
+
+
+def test_sparse_gnn(ts, sample_sets):
+    A = gnn.windowed_genealogical_nearest_neighbours(
+        ts,
+        ts.samples()[:5],
+        sample_sets,
+        windows=np.linspace(0, ts.sequence_length, 11),
+        time_windows=[0, 1e2, 1e7],
+    )
+    assert np.any(np.isnan(A))
+    sparse = gnn.SparseGNN.from_dense(A)
+    np.testing.assert_array_equal(sparse.to_dense(), A)
+    np.testing.assert_array_equal(
+        sparse[2:5, :, [1, 3]].to_dense(), A[2:5, :, [1, 3]]
+    )
+    np.testing.assert_array_equal(sparse[:, 1, 0].to_dense(), A[:, 1, 0])
+    parts = [gnn.SparseGNN.from_dense(A[:3]), gnn.SparseGNN.from_dense(A[3:])]
+    np.testing.assert_array_equal(
+        gnn.SparseGNN.concatenate(parts).to_dense(), A
+    )
+    np.testing.assert_array_equal(
+        sparse.reshape((10, 2 * 5, A.shape[-1])).to_dense(),
+        A.reshape((10, 2 * 5, A.shape[-1])),
+    )
+    assert sparse.reshape((-1, A.shape[-1])).shape == (100, A.shape[-1])
+    with pytest.raises(ValueError):
+        sparse.reshape((3, -1, A.shape[-1]))
+
+
+@pytest.mark.parametrize("engine", ["numba", "python"])
+@pytest.mark.parametrize("sparse", [False, True])
+def test_windowed_gnn_empty(ts, sample_sets, engine, sparse):
+    windows = np.linspace(0, ts.sequence_length, 5)
+    result = gnn.windowed_genealogical_nearest_neighbours(
+        ts, [], sample_sets, windows=windows, engine=engine, sparse=sparse
+    )
+    assert result.shape == (4, 0, len(sample_sets))
+    result = gnn.windowed_genealogical_nearest_neighbours(
+        ts, ts.samples()[:3], {}, engine=engine, sparse=sparse
+    )
+    assert result.shape == (3, 0)
+
+
+def test_gnn_shared_with_structure(ds, vbar):
+    vbar.__panel__()
+    result = ds.genealogical_nearest_neighbours()
+    structure.GNN(datastore=ds).__panel__()
+    assert ds.genealogical_nearest_neighbours() is result
@@ -0,0 +1,56 @@
+import subprocess
+import sys
+
+import numpy as np
+from tsbrowse import model as tsb_model
+
+from tseda import datastore, precompute
+
+# Modules that only the app and its pages need. matplotlib is not listed,
+# as numba can import it while compiling the tsbrowse preprocessing code.
+HEAVY_MODULES = ["panel", "holoviews", "hvplot", "bokeh", "geopandas"]
+# Budget for importing the command line interface, in seconds
+IMPORT_TIME_BUDGET = 1.0
+CLI = "from tseda.__main__ import cli; cli()"
+
+
+def import_times(*args):
+    """Runs python -X importtime with args, returning the cumulative import
+    time in seconds of each top-level module imported."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def test_cli_import_time():
+    times = import_times("-c", CLI, "--help")
+    assert times["tseda.__main__"] < IMPORT_TIME_BUDGET
+    assert not [name for name in HEAVY_MODULES if name in times]
+
+
+def test_preprocess_imports(tmp_path, tszipfile):
+    path = tmp_path / "test.tseda"
+    times = import_times("-c", CLI, "preprocess", tszipfile, "-o", path)
+    assert not [name for name in HEAVY_MODULES if name in times]
+    tsm = tsb_model.TSModel(path)
+    individuals, sample_sets = precompute.load_tables(path, tsm.ts)
+    individuals_table, sample_sets_table = datastore.preprocess(tsm)
+    expected = individuals_table.sample_sets()
+    result = individuals.sample_sets()
+    assert list(result) == list(expected)
+    for key, samples in expected.items():
+        np.testing.assert_array_equal(result[key], samples)
+    np.testing.assert_array_equal(
+        sample_sets["name"], sample_sets_table.data.rx.value["name"]
+    )
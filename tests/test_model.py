@@ -1,20 +1,34 @@
 import json
+import re
 
 import numpy as np
 import pytest
+import tskit
 
 from tseda import model
 
 
-def test_individual(ts):
-    ind = model.Individual(individual=ts.individual(0))
-    assert ind is not None
-    assert ind.id == 0
-    assert ind.population == 1
-    assert ind.metadata is not None
-    np.testing.assert_equal(ind.samples, [0, 1])
-    with pytest.raises(TypeError):
-        ind = model.Individual()
+def test_individuals(ts):
+    individuals = model.Individuals.from_tree_sequence(ts)
+    assert len(individuals) == ts.num_individuals
+    for ind in ts.individuals():
+        np.testing.assert_array_equal(
+            individuals.individual_nodes(ind.id), ind.nodes
+        )
+        assert individuals.population[ind.id] == ind.population
+        md = json.loads(ind.metadata.decode())
+        assert individuals.name[ind.id] == md["SM"]
+        np.testing.assert_equal(individuals.latitude[ind.id], md["latitude"])
+    assert individuals.nodes.dtype == np.int32
+    assert individuals.nodes_offset[-1] == len(individuals.nodes)
+    np.testing.assert_array_equal(
+        individuals.sample_set_id, individuals.population
+    )
+    assert individuals.selected.all()
+    df = individuals.to_dataframe()
+    assert "nodes" not in df
+    assert df.population.dtype == np.int32
+    assert df.longitude.dtype == np.float64
 
 
 def test_sample_set_init(ts):
@@ -61,3 +75,116 @@ def test_make_sample_sets(ds):
 
 def test_get_sample_sets(ds):
     pass
+
+
+@pytest.mark.parametrize(
+    "schema", [None, tskit.MetadataSchema.permissive_json()]
+)
+def test_decode_metadata_columns(schema):
+    tables = tskit.TableCollection(1)
+    if schema is not None:
+        tables.individuals.metadata_schema = schema
+    rows = [
+        {"SM": "a", "lat": 1.5},
+        {"name": "b", "Latitude": 2},
+        {},
+        {"other": 1},
+    ]
+    for _ in range(len(rows) + 1):
+        tables.individuals.add_row()
+    tables.individuals.packset_metadata(
+        [json.dumps(md).encode() for md in rows] + [b""]
+    )
+    patterns = {
+        "name": model.Individuals.name_re,
+        "latitude": model.Individuals.latitude_re,
+    }
+    columns = model.decode_metadata_columns(tables.individuals, patterns)
+    assert columns["name"].tolist() == ["a", "b", None, None, None]
+    assert columns["latitude"].tolist() == [1.5, 2, None, None, None]
+
+    # Undecodable rows fall back to parse_metadata
+    tables.individuals.clear()
+    tables.individuals.metadata_schema = tskit.MetadataSchema(None)
+    tables.individuals.add_row(metadata=b'{"SM": "a"}')
+    tables.individuals.add_row(metadata=b"not json")
+    columns = model.decode_metadata_columns(tables.individuals, patterns)
+    assert columns["name"].tolist() == ["a", None]
+
+
+def test_decode_metadata_columns_defaults():
+    tables = tskit.TableCollection(1)
+    tables.individuals.metadata_schema = tskit.MetadataSchema(
+        {
+            "codec": "json",
+            "type": "object",
+            "properties": {
+                "name": {"type": "string", "default": "unknown"},
+                "lat": {"type": "number", "default": 0.5},
+            },
+        }
+    )
+    tables.individuals.add_row(metadata={"name": "a", "lat": 1.5})
+    tables.individuals.add_row(metadata={"name": "b"})
+    tables.individuals.add_row(metadata={})
+    patterns = {
+        "name": model.Individuals.name_re,
+        "latitude": model.Individuals.latitude_re,
+    }
+    columns = model.decode_metadata_columns(tables.individuals, patterns)
+    assert columns["name"].tolist() == ["a", "b", "unknown"]
+    assert columns["latitude"].tolist() == [1.5, 0.5, 0.5]
+    ts = tables.tree_sequence()
+    for name, regex in patterns.items():
+        assert columns[name].tolist() == [
+            model.parse_metadata(ind, regex) for ind in ts.individuals()
+        ]
+
+
+def test_individuals_invalid_coordinates(caplog):
+    tables = tskit.TableCollection(1)
+    tables.individuals.metadata_schema = tskit.MetadataSchema.permissive_json()
+    tables.individuals.add_row(metadata={"lat": "12.5", "lng": 1})
+    tables.individuals.add_row(metadata={"lat": "north", "lng": 2})
+    tables.individuals.add_row(metadata={"lng": 3})
+    with caplog.at_level("WARNING"):
+        individuals = model.Individuals.from_tree_sequence(
+            tables.tree_sequence()
+        )
+    np.testing.assert_array_equal(individuals.latitude, [12.5, np.nan, np.nan])
+    np.testing.assert_array_equal(individuals.longitude, [1, 2, 3])
+    assert "1 latitude values" in caplog.text
+    assert "'north' of individual 1" in caplog.text
+
+
+def test_decode_metadata_columns_struct():
+    tables = tskit.TableCollection(1)
+    schema = tskit.MetadataSchema(
+        {
+            "codec": "struct",
+            "type": "object",
+            "properties": {
+                "Name": {"type": "string", "binaryFormat": "4p"},
+                "lat": {"type": "number", "binaryFormat": "d"},
+            },
+        }
+    )
+    tables.individuals.metadata_schema = schema
+    for j in range(3):
+        tables.individuals.add_row(metadata={"Name": f"i{j}", "lat": j})
+    columns = model.decode_metadata_columns(
+        tables.individuals,
+        {"name": model.Individuals.name_re, "lon": re.compile("^lon$")},
+    )
+    assert columns["name"].tolist() == ["i0", "i1", "i2"]
+    assert columns["lon"].tolist() == [None] * 3
+
+
+def test_palette():
+    from bokeh.palettes import Set3
+
+    colors = model.palette()
+    assert len(colors) == 12
+    assert colors == model.palette(Set3[12])
+    assert colors[0] == Set3[12][0].lower()
+    assert len(model.palette(["#000000", "#ffffff"], n=3)) == 3